@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the binary codec with JSON and pickle for encoding and decoding messages.
+
+`messages` messages of 6 parameters (ints, a float, strings, a bool and a datetime)
+are encoded and decoded with `codec`, with `json` (the datetime as a string, the
+decoded dicts turned back into messages) and with `cPickle` at protocol 2. The same
+messages are also sent as one MessageBatch through the codec. The best of three runs
+is reported, with the size of the output.
+
+    python benchmarks/codec_vs_json_pickle.py [messages]
+"""
+
+import sys, time, json, datetime
+import cPickle as pickle
+from tributary.core import Message, MessageBatch
+from tributary import codec
+
+def sample(count):
+    start = datetime.datetime(2020, 1, 1)
+    return [Message(id=index, sensor='sensor-%d' % (index % 50), value=index * 0.25, ok=bool(index % 2),
+                    unit='C', when=start + datetime.timedelta(seconds=index)) for index in range(count)]
+
+def jsonEncode(messages):
+    return json.dumps([[message.ns, message.channel, dict(message.data.items(), when=message.data.when.isoformat())]
+                       for message in messages])
+
+def jsonDecode(data):
+    messages = []
+    for ns, channel, fields in json.loads(data):
+        fields['when'] = datetime.datetime.strptime(fields['when'], '%Y-%m-%dT%H:%M:%S')
+        messages.append(Message.fromDict(fields, ns, channel))
+    return messages
+
+def best(function, argument):
+    elapsed = None
+    for attempt in range(3):
+        start = time.time()
+        result = function(argument)
+        run = time.time() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return elapsed, result
+
+def main(messages=100000):
+    rows = sample(messages)
+    batch = MessageBatch.fromMessages(rows)
+    formats = [
+        ('codec', codec.encode, codec.decode, rows),
+        ('codec batch', codec.encode, codec.decode, [batch]),
+        ('json', jsonEncode, jsonDecode, rows),
+        ('pickle', lambda rows: pickle.dumps(rows, 2), pickle.loads, rows),
+    ]
+    for name, encode, decode, value in formats:
+        encoding, data = best(encode, value)
+        decoding, decoded = best(decode, data)
+        print "%-12s encode %8.0f messages/s, decode %8.0f messages/s, %5.1f bytes per message" % (
+            name, messages / encoding, messages / decoding, float(len(data)) / messages)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the interpreted `apply` of predicate trees with the functions generated by
+`compilePredicate`, for trees of depth 1 to 5.
+
+Each depth uses `trees` random And/Or trees of parameter comparisons, every group
+holding 3 predicates, evaluated on `messages` messages. The best of three runs is
+reported per message and tree. Every compiled result is checked against `apply`.
+
+    python benchmarks/compiled_predicates.py [messages] [trees]
+"""
+
+import sys, time, random
+from tributary.core import Message
+from tributary.predicates import AndPredicate, OrPredicate, ReversePredicate, ParamEqualPredicate, \
+    ParamNotEqualPredicate, ParamInPredicate, ParamContainsPredicate, compilePredicate
+
+def leaf(rand):
+    kind = rand.randrange(4)
+    if kind == 0:
+        return ParamEqualPredicate('a', rand.randrange(10))
+    elif kind == 1:
+        return ParamNotEqualPredicate('c', rand.randrange(10))
+    elif kind == 2:
+        return ParamInPredicate('a', rand.sample(range(10), 3))
+    return ParamContainsPredicate('b', rand.choice('xyz'))
+
+def tree(rand, depth):
+    if depth == 1:
+        return leaf(rand)
+    group = AndPredicate() if rand.random() < 0.5 else OrPredicate()
+    for index in range(3):
+        group.addPredicate(tree(rand, depth - 1))
+    return ReversePredicate(group) if rand.random() < 0.2 else group
+
+def timed(function, rows):
+    best = None
+    for attempt in range(3):
+        start = time.time()
+        results = [function(row) for row in rows]
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+def main(messages=20000, trees=5):
+    rand = random.Random(1)
+    rows = [Message(a=rand.randrange(10), b=''.join(rand.sample('xyzw', 2)), c=rand.randrange(10)) for index in range(messages)]
+    for depth in range(1, 6):
+        interpreted = compiled = 0
+        for index in range(trees):
+            predicate = tree(rand, depth)
+            elapsed, expected = timed(predicate.apply, rows)
+            interpreted += elapsed
+            elapsed, results = timed(compilePredicate(predicate).apply, rows)
+            compiled += elapsed
+            if [bool(result) for result in expected] != [bool(result) for result in results]:
+                raise AssertionError("The compiled predicate differs from apply")
+        count = float(messages * trees)
+        print "depth %d: %6.2fus interpreted, %5.2fus compiled per message, %4.1fx" % (
+            depth, interpreted / count * 1e6, compiled / count * 1e6, interpreted / compiled)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
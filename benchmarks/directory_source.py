@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures how fast DirectorySource walks a large tree of files.
+
+A tree of `files` empty files spread over `directories` directories is generated in a
+temporary directory, a quarter of them ending with '.csv'. It is walked by:
+
+    os.walk    an os.walk loop emitting one message per file, filtered afterwards
+    scandir    DirectorySource with `threads` threads, the filter pushed down
+    listdir    the same without scandir (the os.listdir fallback)
+    fanOut     DirectorySource spreading the batches over 3 readers
+
+The best of three runs is reported in files walked per second.
+
+    python benchmarks/directory_source.py [files] [directories] [threads]
+"""
+
+import os, sys, time, logging, tempfile, shutil
+from tributary.core import Actor, Engine, Message, now
+from tributary.events import DATA
+from tributary.streams import StreamProducer
+from tributary.predicates import FilePredicate
+from tributary import sources
+from tributary.log import set_log_level
+
+class Counter(Actor):
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.count = 0
+
+    def process(self, message=None):
+        self.count += 1
+
+    def processBatch(self, messages):
+        self.count += len(messages)
+
+class WalkSource(StreamProducer):
+    """Walks the tree with os.walk, one emit per file"""
+    def __init__(self, name, root):
+        super(WalkSource, self).__init__(name)
+        self.root = root
+
+    def process(self, message=None):
+        for path, directories, files in os.walk(self.root):
+            for filename in files:
+                self.emit(DATA, Message.fromDict({'filename': os.path.join(path, filename)}, now()))
+
+def generate(root, files, directories):
+    for index in range(directories):
+        os.makedirs(os.path.join(root, 'd%03d' % (index // 20), 'd%03d' % index))
+    for index in range(files):
+        extension = '.csv' if index % 4 == 0 else '.txt'
+        directory = index % directories
+        open(os.path.join(root, 'd%03d' % (directory // 20), 'd%03d' % directory, 'f%06d%s' % (index, extension)), 'w').close()
+
+def run(source, readers=1):
+    counters = [Counter('counter-%d' % index) for index in range(readers)]
+    for counter in counters:
+        source.add(counter)
+    engine = Engine()
+    engine.add(source)
+    start = time.time()
+    engine.start()
+    return time.time() - start, [counter.count for counter in counters]
+
+def best(factory, readers=1):
+    return min(run(factory(), readers) for attempt in range(3))
+
+def main(files=200000, directories=200, threads=4):
+    set_log_level(logging.WARNING)
+    root = tempfile.mkdtemp()
+    try:
+        generate(root, files, directories)
+        walk = lambda: WalkSource('source', root).addFilter(FilePredicate(r'\.csv$'))
+        directory = lambda **kwargs: sources.DirectorySource('source', root, threads=threads, **kwargs).addFilter(FilePredicate(r'\.csv$'))
+
+        runs = [('os.walk', walk, 1), ('scandir', directory, 1)]
+        for name, factory, readers in runs:
+            elapsed, counts = best(factory, readers)
+            print "%-8s %6.2fs %8.0f files/s, %s accepted" % (name, elapsed, files / elapsed, counts[0])
+
+        scandir, sources.scandir = sources.scandir, None
+        try:
+            elapsed, counts = best(directory)
+        finally:
+            sources.scandir = scandir
+        print "%-8s %6.2fs %8.0f files/s, %s accepted" % ('listdir', elapsed, files / elapsed, counts[0])
+
+        elapsed, counts = best(lambda: directory(fanOut=True), 3)
+        print "%-8s %6.2fs %8.0f files/s, %s accepted per reader" % ('fanOut', elapsed, files / elapsed, '/'.join(map(str, counts)))
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the per-message cost of `Actor.emit` for nodes with 1, 10 and 100 children.
+
+The children are not started, so only the fan-out itself is measured: going through
+the children and inserting the message into their inboxes. The best of three runs
+of `messages` emits is reported.
+
+    python benchmarks/fanout_children.py [messages]
+"""
+
+import sys, time, logging
+from tributary.core import Actor, Message
+from tributary.log import set_log_level
+
+class Node(Actor):
+    def process(self, message=None):
+        pass
+
+def run(children, messages):
+    node = Node('node')
+    for index in range(children):
+        node.add(Node('child-%d' % index))
+    message = Message(value=0)
+    start = time.time()
+    for index in range(messages):
+        node.emit('data', message)
+    return time.time() - start
+
+def main(messages=20000):
+    set_log_level(logging.WARNING)
+    for children in (1, 10, 100):
+        elapsed = min(run(children, messages) for attempt in range(3))
+        print "%3d children: %6.2fus per message, %5.2fus per delivery" % (
+            children, elapsed / messages * 1e6, elapsed / messages / children * 1e6)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
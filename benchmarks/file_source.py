@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the throughput of FileSource on a large file.
+
+A CSV-like file of `megabytes` MB is generated in a temporary directory and read by a
+FileSource whose child counts the messages. The first `naive` MB of the same file are
+also read with a readline loop emitting one message per line, the way sources were
+written before FileSource. The throughput in MB/s and messages/s is reported, with
+the maximum resident size of the process, which stays flat whatever the size of the
+file.
+
+    python benchmarks/file_source.py [megabytes] [naive]
+"""
+
+import os, sys, time, logging, resource, tempfile, shutil
+from tributary.core import Actor, Engine, Message, now
+from tributary.events import DATA
+from tributary.streams import StreamProducer
+from tributary.sources import FileSource
+from tributary.log import set_log_level
+
+class Counter(Actor):
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.count = 0
+
+    def process(self, message=None):
+        self.count += 1
+
+    def processBatch(self, messages):
+        self.count += len(messages)
+
+class ReadlineSource(StreamProducer):
+    """Reads `size` bytes of a file line by line, one emit per line"""
+    def __init__(self, name, filename, size):
+        super(ReadlineSource, self).__init__(name)
+        self.filename = filename
+        self.size = size
+
+    def process(self, message=None):
+        read = 0
+        with open(self.filename, 'rb') as f:
+            for line in f:
+                read += len(line)
+                if read > self.size:
+                    break
+                self.emit(DATA, Message.fromDict({'filename': self.filename, 'line': line.rstrip('\n')}, now()))
+
+def generate(filename, megabytes):
+    line = ''.join('%d,2020-01-01T%02d:%02d:%02d.%06d,sensor-%d,%.3f,%.3f,status-ok,region-%d\n' % (
+        index, index // 3600 % 24, index // 60 % 60, index % 60, index * 7 % 1000000, index % 97, index * 0.125,
+        index * -0.5, index % 7) for index in range(10000))
+    with open(filename, 'wb') as f:
+        while f.tell() < megabytes << 20:
+            f.write(line)
+
+def run(source):
+    counter = Counter('counter')
+    source.add(counter)
+    engine = Engine()
+    engine.add(source)
+    start = time.time()
+    engine.start()
+    return time.time() - start, counter.count
+
+def report(name, megabytes, elapsed, count):
+    print "%-9s %6.0f MB in %6.2fs: %5.1f MB/s, %7.0f messages/s, max RSS %4.0f MB" % (
+        name, megabytes, elapsed, megabytes / elapsed, count / elapsed,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+def main(megabytes=1024, naive=100):
+    set_log_level(logging.WARNING)
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'input.csv')
+        generate(filename, megabytes)
+        size = os.path.getsize(filename) / float(1 << 20)
+
+        elapsed, count = run(FileSource('source', filename))
+        report('FileSource', size, elapsed, count)
+
+        elapsed, count = run(ReadlineSource('source', filename, naive << 20))
+        report('readline', naive, elapsed, count)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
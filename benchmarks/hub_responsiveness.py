@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures how long the hub is held by an actor making blocking calls, with and without
+the threadpool offload.
+
+The actor handles `messages` messages, each one blocking for `block` milliseconds
+(an unpatched `time.sleep`, like a blocking client library). Next to it a ticker
+greenlet sleeps for 1ms in a loop and records how late it wakes up. The worst and the
+mean lateness of the ticker are reported with the time taken by the actor.
+
+    python benchmarks/hub_responsiveness.py [messages] [block] [threads]
+"""
+
+import sys, time, logging
+import gevent
+from tributary.core import Actor, Message
+from tributary.events import StopMessage
+from tributary.log import set_log_level
+
+class Blocking(Actor):
+    def __init__(self, name, block, **kwargs):
+        super(Blocking, self).__init__(name, **kwargs)
+        self.block = block
+
+    def process(self, message=None):
+        time.sleep(self.block)
+
+def ticker(delays, interval=0.001):
+    while True:
+        start = time.time()
+        gevent.sleep(interval)
+        delays.append(time.time() - start - interval)
+
+def run(messages, block, threads):
+    actor = Blocking('blocking', block, threads=threads)
+    for index in range(messages):
+        actor.insert(Message(value=index))
+    actor.insert(StopMessage.envelope())
+    delays = []
+    tick = gevent.spawn(ticker, delays)
+    gevent.sleep(0.01)
+    del delays[:]
+
+    start = time.time()
+    actor.start()
+    actor.join()
+    elapsed = time.time() - start
+    tick.kill()
+    return elapsed, max(delays), sum(delays) / len(delays)
+
+def main(messages=200, block=10, threads=4):
+    set_log_level(logging.WARNING)
+    for name, size in (('hub', None), ('threads=%d' % threads, threads)):
+        elapsed, worst, mean = run(messages, block / 1000.0, size)
+        print "%-10s %5.2fs for %d messages, ticker late by %6.2fms at worst, %5.2fms on average" % (
+            name, elapsed, messages, worst * 1000, mean * 1000)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
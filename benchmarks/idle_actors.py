@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the CPU used by a wide pipeline of idle actors and its throughput.
+
+A root actor has `actors` children. The children are left idle for `idle` seconds
+while the CPU time of the process is measured. Then the root emits `messages`
+messages, each one delivered to every child (fan-out), and a separate actor receives
+`messages` messages while the children stay idle next to it (busy). The best of
+three runs is reported for the throughputs.
+
+    python benchmarks/idle_actors.py [actors] [messages] [idle]
+"""
+
+import os, sys, time, logging
+import gevent
+from tributary.core import Actor, Message
+from tributary.log import set_log_level
+
+class Counter(Actor):
+    """Counts the messages it receives"""
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.count = 0
+
+    def process(self, message=None):
+        self.count += 1
+
+def cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+def deliver(source, receivers, messages):
+    """Returns the seconds taken to deliver `messages` messages to every receiver"""
+    for receiver in receivers:
+        receiver.count = 0
+    start = time.time()
+    for index in range(messages):
+        source.emit('data', Message(value=index))
+    while any(receiver.count < messages for receiver in receivers):
+        gevent.sleep(0.001)
+    return time.time() - start
+
+def main(actors=200, messages=2000, idle=2.0):
+    set_log_level(logging.WARNING)
+    root = Counter('root')
+    children = [Counter('counter-%d' % index) for index in range(actors)]
+    for child in children:
+        root.add(child)
+    busy = Counter('busy')
+    busy.add(Counter('consumer'))
+    consumer = busy['consumer']
+    root.start()
+    busy.start()
+    gevent.sleep(0.1)
+
+    start, used = time.time(), cpu()
+    gevent.sleep(idle)
+    used = cpu() - used
+    elapsed = time.time() - start
+    print "idle:    %d actors, %.2fs CPU in %.2fs (%.0f%% of a core)" % (actors, used, elapsed, 100.0 * used / elapsed)
+
+    elapsed = min(deliver(root, children, messages) for run in range(3))
+    print "fan-out: %d messages x %d children in %.2fs (%.0f deliveries/s)" % (
+        messages, actors, elapsed, messages * actors / elapsed)
+
+    elapsed = min(deliver(busy, [consumer], messages * 10) for run in range(3))
+    print "busy:    %d messages to 1 actor next to %d idle ones in %.2fs (%.0f messages/s)" % (
+        messages * 10, actors, elapsed, messages * 10 / elapsed)
+
+    root.stop()
+    busy.stop()
+    gevent.joinall([root, busy, consumer] + children, timeout=5)
+
+if __name__ == '__main__':
+    main(*[float(arg) if '.' in arg else int(arg) for arg in sys.argv[1:]])
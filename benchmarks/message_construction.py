@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the construction rate and the memory of messages.
+
+`messages` messages of 3 parameters are built with `Message(...)`, with
+`Message.fromDict` and with a copy of the previous Message class, which has a
+`__dict__` and takes a `datetime` timestamp. The memory is the growth of the resident
+size of the process while the messages are kept, per message. Each kind is measured
+in a new process so the memory freed by the previous one is not reused. The best of
+three runs is reported for the rates.
+
+    python benchmarks/message_construction.py [messages]
+"""
+
+import sys, os, time, datetime, subprocess
+from tributary.core import Message, MessageContent
+
+class LegacyMessage(object):
+    """The Message class before the timestamps were stored as nanoseconds"""
+    def __init__(self, **kwargs):
+        super(LegacyMessage, self).__init__()
+        self.datetime = datetime.datetime.utcnow()
+        self._channel = 'data'
+        self._forward = False
+        self.data = MessageContent(**kwargs)
+
+BUILDERS = {
+    'legacy': lambda index: LegacyMessage(index=index, name='row', value=0.5),
+    'message': lambda index: Message(index=index, name='row', value=0.5),
+    'fromDict': lambda index: Message.fromDict({'index': index, 'name': 'row', 'value': 0.5}),
+}
+
+def resident():
+    """Resident size of the process in bytes"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def measure(kind, messages):
+    build = BUILDERS[kind]
+    before = resident()
+    kept = [build(index) for index in range(messages)]
+    size = float(resident() - before) / len(kept)
+    del kept
+    rate = 0
+    for attempt in range(3):
+        start = time.time()
+        kept = [build(index) for index in range(messages)]
+        rate = max(rate, messages / (time.time() - start))
+        del kept
+    print kind, rate, size
+
+def main(messages=500000):
+    for kind in ('legacy', 'message', 'fromDict'):
+        output = subprocess.check_output([sys.executable, __file__, kind, str(messages)])
+        name, rate, size = output.split()
+        print "%-8s %8.0f messages/s, %5.0f bytes per message" % (name, float(rate), float(size))
+
+if __name__ == '__main__':
+    # a kind and a number of messages measure that kind in this process
+    if len(sys.argv) > 2:
+        measure(sys.argv[1], int(sys.argv[2]))
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the parsing sources with the naive per-line loops they replace.
+
+A CSV file and a JSON-lines file of `megabytes` MB are generated, with the columns
+`ts_ms,word,value,text` and a schema. Each one is read by a producer building one
+`Message(**row)` per line and emitting it, then by CSVSource / JSONLinesSource in row
+and columnar mode. A child counts the rows. The three ways of reading a file take
+turns for `runs` rounds, so they are measured under the same load, and the best
+round of each is reported in rows per second with the gain over the per-line loop.
+
+    python benchmarks/parsers.py [megabytes] [runs]
+"""
+
+import os, sys, time, csv, json, logging, tempfile, shutil
+from tributary.core import Actor, Engine, Message, MessageBatch
+from tributary.events import DATA
+from tributary.streams import StreamProducer
+from tributary.parsers import CSVSource, JSONLinesSource
+from tributary.log import set_log_level
+
+SCHEMA = [('ts_ms', int), ('word', str), ('value', float), ('text', str)]
+
+class Counter(Actor):
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.count = 0
+
+    def process(self, message=None):
+        self.count += len(message) if isinstance(message, MessageBatch) else 1
+
+    def processBatch(self, messages):
+        self.count += len(messages)
+
+class LineSource(StreamProducer):
+    """Parses one line at a time and emits one message per row"""
+    def __init__(self, name, filename, kind):
+        super(LineSource, self).__init__(name)
+        self.filename = filename
+        self.kind = kind
+
+    def process(self, message=None):
+        with open(self.filename, 'rb') as f:
+            if self.kind == 'csv':
+                names = next(csv.reader(f))
+                for values in csv.reader(f):
+                    row = dict(zip(names, values))
+                    row['ts_ms'], row['value'] = int(row['ts_ms']), float(row['value'])
+                    message = Message(**row)
+                    message.ns = row['ts_ms'] * 1000000
+                    self.emit(DATA, message)
+            else:
+                for line in f:
+                    row = json.loads(line)
+                    message = Message(**dict((str(name), value) for name, value in row.items()))
+                    message.ns = row['ts_ms'] * 1000000
+                    self.emit(DATA, message)
+
+def generate(directory, megabytes):
+    start = 1600000000000
+    rows = [(start + index, 'word%d' % (index % 113), index * 0.37, 'some text for row %d' % index) for index in range(10000)]
+    block = ''.join('%d,%s,%r,%s\n' % row for row in rows)
+    lines = ''.join(json.dumps(dict(zip([name for name, kind in SCHEMA], row))) + '\n' for row in rows)
+    filenames = []
+    for name, header, content in (('rows.csv', 'ts_ms,word,value,text\n', block), ('rows.json', '', lines)):
+        filename = os.path.join(directory, name)
+        with open(filename, 'wb') as f:
+            f.write(header)
+            while f.tell() < megabytes << 20:
+                f.write(content)
+        filenames.append(filename)
+    return filenames
+
+def run(source):
+    """Returns the rows read per second"""
+    counter = Counter('counter')
+    source.add(counter)
+    engine = Engine()
+    engine.add(source)
+    start = time.time()
+    engine.start()
+    return counter.count / (time.time() - start)
+
+def main(megabytes=20, runs=3):
+    set_log_level(logging.WARNING)
+    directory = tempfile.mkdtemp()
+    try:
+        csvFile, jsonFile = generate(directory, megabytes)
+        for kind, filename, source in (('csv', csvFile, CSVSource), ('json', jsonFile, JSONLinesSource)):
+            factories = [
+                ('per-line loop', lambda: LineSource('source', filename, kind)),
+                ('rows', lambda: source('source', filename, schema=SCHEMA, timeField='ts_ms', timeUnit='ms')),
+                ('columnar', lambda: source('source', filename, schema=SCHEMA, timeField='ts_ms', timeUnit='ms', columnar=True)),
+            ]
+            rates = [0] * len(factories)
+            for attempt in range(runs):
+                for index, (mode, factory) in enumerate(factories):
+                    rates[index] = max(rates[index], run(factory()))
+            for (mode, factory), rate in zip(factories, rates):
+                print "%-4s %-13s %8.0f rows/s, %4.1fx" % (kind, mode, rate, rate / rates[0])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
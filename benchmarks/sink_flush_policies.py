@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the throughput of the file sinks under each flush and sync policy.
+
+A producer emits `messages` messages of 4 parameters in batches of 1000 into a sink
+writing to a temporary directory:
+
+    null         an actor dropping the messages, the cost of the producer alone
+    per-message  f.write(json.dumps(...)) for each message, the way sinks were written
+    per-fsync    the same followed by flush and fsync, on `synced` messages only
+    JSONLinesSink, FileSink, CSVSink and BinarySink under the NEVER, deadline, GROUP
+    and ALWAYS policies, with a 1 MB or a 64 KB buffer
+
+The variants take turns for `runs` rounds and the best round of each is reported in
+messages per second and MB written per second, with the writes and syncs it made.
+
+    python benchmarks/sink_flush_policies.py [messages] [synced] [runs]
+"""
+
+import os, sys, time, json, logging, tempfile, shutil
+from tributary.core import Actor, Engine, Message, MessageBatch, deser
+from tributary.events import DATA
+from tributary.streams import StreamProducer
+from tributary.sinks import FileSink, JSONLinesSink, CSVSink, BinarySink, Sync
+from tributary.log import set_log_level
+
+class Producer(StreamProducer):
+    def __init__(self, name, count):
+        super(Producer, self).__init__(name)
+        self.count = count
+
+    def process(self, message=None):
+        for start in range(0, self.count, 1000):
+            self.emitBatch(DATA, [Message.fromDict({'id': index, 'sensor': 'sensor-%d' % (index % 50), 'value': index * 0.25, 'ok': True},
+                                                   10 ** 18 + index) for index in range(start, min(start + 1000, self.count))])
+
+class NullSink(Actor):
+    def process(self, message=None):
+        pass
+
+    def processBatch(self, messages):
+        pass
+
+class PerMessageSink(Actor):
+    """Writes each message as a JSON line, optionally flushed and synced"""
+    def __init__(self, name, filename, sync=False):
+        super(PerMessageSink, self).__init__(name)
+        self.filename = filename
+        self.sync = sync
+        self.file = None
+
+    def preProcess(self, message=None):
+        self.file = open(self.filename, 'w')
+
+    def process(self, message=None):
+        for row in (message if isinstance(message, MessageBatch) else [message]):
+            self.file.write(json.dumps(row.data.__dict__, default=deser) + '\n')
+            if self.sync:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def postProcess(self, message=None):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def run(sink, count, filename):
+    """Returns the elapsed time and the size of the output"""
+    producer = Producer('producer', count)
+    producer.add(sink)
+    engine = Engine()
+    engine.add(producer)
+    start = time.time()
+    engine.start()
+    elapsed = time.time() - start
+    return elapsed, os.path.getsize(filename) if os.path.exists(filename) else 0
+
+def main(messages=1000000, synced=5000, runs=3):
+    set_log_level(logging.WARNING)
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'output')
+    fields = ['id', 'sensor', 'value', 'ok']
+    small = 1 << 16
+    try:
+        variants = [
+            ('null', messages, lambda: NullSink('sink')),
+            ('per-message', messages, lambda: PerMessageSink('sink', filename)),
+            ('per-fsync', synced, lambda: PerMessageSink('sink', filename, sync=True)),
+            ('json NEVER', messages, lambda: JSONLinesSink('sink', filename)),
+            ('json deadline 10ms', messages, lambda: JSONLinesSink('sink', filename, bufferSize=1 << 30, flushInterval=0.01)),
+            ('json GROUP 1s', messages, lambda: JSONLinesSink('sink', filename, sync=Sync.GROUP)),
+            ('json GROUP 100ms 64K', messages, lambda: JSONLinesSink('sink', filename, sync=Sync.GROUP, syncInterval=0.1, bufferSize=small)),
+            ('json ALWAYS', messages, lambda: JSONLinesSink('sink', filename, sync=Sync.ALWAYS)),
+            ('json ALWAYS 64K', messages, lambda: JSONLinesSink('sink', filename, sync=Sync.ALWAYS, bufferSize=small)),
+            ('file NEVER', messages, lambda: FileSink('sink', filename, field='sensor')),
+            ('csv NEVER', messages, lambda: CSVSink('sink', filename, fields)),
+            ('binary NEVER', messages, lambda: BinarySink('sink', filename)),
+            ('binary GROUP 1s', messages, lambda: BinarySink('sink', filename, sync=Sync.GROUP)),
+        ]
+        results = [None] * len(variants)
+        for attempt in range(runs):
+            for index, (name, count, factory) in enumerate(variants):
+                if os.path.exists(filename):
+                    os.remove(filename)
+                sink = factory()
+                elapsed, size = run(sink, count, filename)
+                if results[index] is None or elapsed < results[index][0]:
+                    results[index] = (elapsed, size, getattr(sink, 'writes', ''), getattr(sink, 'syncs', ''))
+        for (name, count, factory), (elapsed, size, writes, syncs) in zip(variants, results):
+            print "%-20s %8d messages %6.2fs %7.0f messages/s %5.1f MB/s %5s writes %5s syncs" % (
+                name, count, elapsed, count / elapsed, size / elapsed / (1 << 20), writes, syncs)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -33,6 +33,7 @@ setup(
                   '--tags', '--long'],
     },
     install_requires=install_requires,
+    extras_require={'numpy': ['numpy'], 'scandir': ['scandir']},
     tests_require=test_requires,
     test_suite='nose.collector',
     classifiers=[
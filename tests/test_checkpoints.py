@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, tempfile, shutil, os, sys, json, time, signal, subprocess
+
+ROWS = 5000
+
+# Sums the values of a CSV file and writes the running totals, slowly enough to be killed
+PIPELINE = '''
+import sys, logging
+import gevent
+from tributary.core import Actor, Engine, Message
+from tributary.events import DATA
+from tributary.parsers import CSVSource
+from tributary.sinks import CSVSink
+from tributary.checkpoints import Checkpointer
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Total(Actor):
+    def __init__(self, name):
+        # the bounded inbox slows the source down, which injects barriers as it reads
+        super(Total, self).__init__(name, maxsize=2)
+        self.total = 0
+        self.processed = 0
+
+    def process(self, message=None):
+        self.total += message.data.value
+        self.processed += 1
+        self.emit(DATA, Message(index=message.data.index, total=self.total))
+        if message.data.index % 10 == 0:
+            gevent.sleep(0.001)
+
+    def snapshot(self):
+        return {'total': self.total}
+
+    def restore(self, state):
+        self.total = state['total']
+
+source = CSVSource('source', sys.argv[1], chunkSize=512)
+total = Total('total')
+source.add(total)
+total.add(CSVSink('sink', sys.argv[2], ['index', 'total'], flushInterval=0.01))
+engine = Engine(checkpointer=Checkpointer('checkpointer', sys.argv[3], interval=0.05))
+engine.add(source)
+engine.start()
+print total.processed
+'''
+
+class KillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, 'input.csv')
+        with open(self.input, 'wb') as f:
+            f.write('index,value\n' + ''.join('%d,%d\n' % (index, index % 7) for index in range(ROWS)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self, output, checkpoints):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        return subprocess.Popen([sys.executable, '-c', PIPELINE, self.input, output, checkpoints], env=env, stdout=subprocess.PIPE)
+
+    def checkpoint(self, checkpoints):
+        try:
+            with open(os.path.join(checkpoints, 'MANIFEST.json')) as f:
+                return json.load(f)['id']
+        except (IOError, ValueError):
+            return 0
+
+    def test_kill_and_restart(self):
+        output = os.path.join(self.directory, 'output.csv')
+        checkpoints = os.path.join(self.directory, 'checkpoints')
+        process = self.start(output, checkpoints)
+        deadline = time.time() + 30
+        while self.checkpoint(checkpoints) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(None, process.poll(), "The run completed before it was killed")
+        os.kill(process.pid, signal.SIGKILL)
+        process.wait()
+
+        # the restarted run resumes from the last checkpoint
+        process = self.start(output, checkpoints)
+        processed = int(process.communicate()[0])
+        self.assertEqual(0, process.returncode)
+        self.assertTrue(0 < processed < ROWS, processed)
+
+        # the output is the one of an uninterrupted run
+        reference = os.path.join(self.directory, 'reference.csv')
+        process = self.start(reference, os.path.join(self.directory, 'reference'))
+        self.assertEqual(ROWS, int(process.communicate()[0]))
+        totals = [sum(index % 7 for index in range(row + 1)) for row in range(ROWS)]
+        with open(reference, 'rb') as f:
+            expected = f.read()
+        self.assertEqual('index,total\n' + ''.join('%d,%d\n' % (index, total) for index, total in enumerate(totals)), expected)
+        with open(output, 'rb') as f:
+            self.assertEqual(expected, f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, datetime, io
+import numpy
+from tributary.core import Message, MessageBatch
+from tributary import codec
+
+def sample(count):
+    messages = []
+    for index in range(count):
+        message = Message(id=index, name='sensor-%d' % (index % 5), value=index * 0.5, ok=bool(index % 2),
+                          tags=['a', u'b\xe9'], when=datetime.datetime(2020, 1, 1, 0, 0, index % 60, 250),
+                          missing=None, big=2 ** 70, pair=(1, 'x'), nested={'x': [1, 2.5]}, blob=set([index]))
+        message.forward = bool(index % 3)
+        messages.append(message)
+
+    # a message with other parameters uses a second schema
+    messages.append(Message.create('other', id=-1, text=u'☃'))
+    return messages
+
+def rows(messages):
+    return [(message.ns, message.channel, message.forward, dict(message.data.items())) for message in messages]
+
+class CodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        messages = sample(100)
+        self.assertEqual(rows(messages), rows(codec.decode(codec.encode(messages))))
+
+    def test_frozen_data(self):
+        messages = sample(10)
+        expected = rows(messages)
+        for message in messages:
+            message.data.freeze()
+        data = codec.encode([message.envelope('data', True) for message in messages])
+        decoded = codec.decode(data)
+        self.assertEqual([row[:1] + ('data', True) + row[3:] for row in expected], rows(decoded))
+
+        # the decoded data belongs to the receiver
+        decoded[0].data.set('id', 42)
+        self.assertEqual(42, decoded[0].data.get('id'))
+
+    def test_stream_in_chunks(self):
+        messages = sample(50)
+        encoder, decoder = codec.Encoder(), codec.Decoder()
+        data = encoder.encode(messages[:20]) + encoder.encode(messages[20:])
+        decoded = []
+        for start in range(0, len(data), 7):
+            decoded.extend(decoder.feed(data[start:start + 7]))
+        self.assertEqual(rows(messages), rows(decoded))
+        self.assertEqual(b'', decoder.buffer)
+
+    def test_without_interning(self):
+        messages = sample(10)
+        encoder = codec.Encoder(intern=False)
+        first, second = encoder.encode(messages[:5]), encoder.encode(messages[5:])
+        self.assertEqual(rows(messages[5:]), rows(codec.Decoder().feed(second)))
+        decoder = codec.Decoder()
+        self.assertEqual(rows(messages), rows(decoder.feed(first) + decoder.feed(second)))
+
+    def test_batch(self):
+        batch = MessageBatch.fromMessages([Message(x=index, y=index / 3.0, s='q%d' % index) for index in range(10)] + [Message(x=10)])
+        batch.data.freeze()
+        decoded = codec.decode(codec.encode([batch]))[0]
+        self.assertTrue(isinstance(decoded, MessageBatch))
+        self.assertEqual(batch.times.tolist(), decoded.times.tolist())
+        for name in ('x', 'y', 's'):
+            self.assertEqual(batch.data.get(name).tolist(), decoded.data.get(name).tolist())
+            self.assertEqual(batch.presence(name).tolist(), decoded.presence(name).tolist())
+        self.assertEqual(rows(batch.toMessages()), rows(decoded.toMessages()))
+
+    def test_object_column(self):
+        batch = MessageBatch([1, 2], obj=numpy.array([{'a': 1}, None], dtype=object))
+        self.assertEqual([{'a': 1}, None], codec.decode(codec.encode([batch]))[0].data.obj.tolist())
+
+    def test_pickle_not_allowed(self):
+        # the object columns are encoded without pickle
+        batch = MessageBatch([1, 2], obj=numpy.array([{'a': 1}, u'x'], dtype=object))
+        decoded = codec.Decoder(allowPickle=False).feed(codec.Encoder().encode([batch]))[0]
+        self.assertEqual([{'a': 1}, u'x'], decoded.data.obj.tolist())
+
+        messages = sample(1)
+        data = codec.Encoder().encode(messages)
+        self.assertRaises(ValueError, codec.Decoder(allowPickle=False).feed, data)
+        self.assertEqual(rows(messages), rows(codec.Decoder().feed(data)))
+
+    def test_read_messages(self):
+        messages = sample(100)
+        self.assertEqual(rows(messages), rows(codec.readMessages(io.BytesIO(codec.encode(messages)), 64)))
+
+    def test_invalid_input(self):
+        data = codec.encode(sample(3))
+        self.assertRaises(ValueError, codec.decode, data[:-1])
+        self.assertRaises(ValueError, codec.decode, b'XXXX' + data[4:])
+
+if __name__ == '__main__':
+    unittest.main()
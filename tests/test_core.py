@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, pickle, logging, datetime, time
+from tributary.core import Actor, Engine, ExecutionContext, Message, MessageBatch, Overflow
+from tributary.events import StopMessage, CHECKPOINT, DATA, STOP, START
+from tributary.streams import StreamElement, StreamProducer, LimitPredicate
+from tributary.overrides import StaticParamOverride, CopyParamOverride, RenameParamOverride, FunctionOverride, \
+    AddParamOverride, TimeBiasOverride
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Collector(Actor):
+    """Keeps the values of the messages it processes"""
+    def __init__(self, name, **kwargs):
+        super(Collector, self).__init__(name, **kwargs)
+        self.values = []
+
+    def process(self, message=None):
+        self.values.append(message.data.value)
+
+class BatchCollector(Collector):
+    """Keeps the sizes of the batches it processes as well"""
+    def __init__(self, name, **kwargs):
+        super(BatchCollector, self).__init__(name, **kwargs)
+        self.batches = []
+
+    def processBatch(self, messages):
+        self.batches.append(len(messages))
+        super(BatchCollector, self).processBatch(messages)
+
+class BatchStream(StreamElement):
+    def __init__(self, name):
+        super(BatchStream, self).__init__(name)
+        self.values = []
+        self.batches = []
+
+    def process(self, message=None):
+        self.values.append(message.data.value)
+
+    def processBatch(self, messages):
+        self.batches.append(len(messages))
+        super(BatchStream, self).processBatch(messages)
+
+def data(value):
+    return Message.create(DATA, value=value)
+
+def stop(actor):
+    actor.insert(StopMessage.envelope())
+    actor.start()
+    actor.join(timeout=2)
+
+class Sleeper(Actor):
+    """Sleeps in its threadpool, longer for the first messages, and emits the values"""
+    def process(self, message=None):
+        value = message.data.value
+        if value == 2:
+            raise ValueError(value)
+        time.sleep(0.05 if value < 3 else 0.01)
+        self.emit(DATA, Message(value=value))
+
+class Recorder(Actor):
+    """Keeps the channels and values of every message it receives"""
+    def __init__(self, name):
+        super(Recorder, self).__init__(name)
+        self.received = []
+
+    def insert(self, message):
+        self.received.append((message.channel, message.data.get('value')))
+
+class Counter(StreamProducer):
+    """Emits 20 values and keeps the value it was at when each ping was handled"""
+    def __init__(self, name):
+        super(Counter, self).__init__(name)
+        self.current = None
+        self.pings = []
+        self.on('ping', lambda message: self.pings.append(self.current))
+
+    def process(self, message=None):
+        for value in range(20):
+            self.current = value
+            self.emit(DATA, Message(value=value))
+
+class Pinger(Actor):
+    """Pings the producer when it receives the value 5"""
+    def process(self, message=None):
+        if message.data.value == 5:
+            self.getContext().sendTo('counter', 'ping', Message())
+
+class InboxOverflowTest(unittest.TestCase):
+
+    def test_drop_oldest_keeps_stop(self):
+        actor = Collector('collector', maxsize=2, overflow=Overflow.DROP_OLDEST)
+        actor.insert(data(0))
+        actor.insert(StopMessage.envelope())
+        for value in range(1, 4):
+            actor.insert(data(value))
+        actor.start()
+        actor.join(timeout=2)
+        self.assertTrue(actor.dead)
+
+        # the older data was dropped, not the stop
+        self.assertEqual([3], actor.values)
+
+    def test_drop_oldest_drops_data_only(self):
+        actor = Collector('collector', maxsize=3, overflow=Overflow.DROP_OLDEST)
+        barrier = Message.create(CHECKPOINT, id=1)
+        actor.insert(barrier)
+        for value in range(5):
+            actor.insert(data(value))
+        entries = list(actor.inbox.queue)
+        self.assertIs(barrier, entries[0])
+        self.assertEqual([3, 4], [entry.data.value for entry in entries[1:]])
+
+    def test_control_messages_are_queued_when_full(self):
+        for overflow in (Overflow.BLOCK, Overflow.DROP_NEWEST, Overflow.ERROR):
+            actor = Collector('collector', maxsize=1, overflow=overflow)
+            actor.insert(data(0))
+            actor.insert(StopMessage.envelope())
+            self.assertEqual(2, actor.inbox.qsize())
+
+            actor.start()
+            actor.join(timeout=2)
+            self.assertTrue(actor.dead)
+            self.assertEqual([0], actor.values)
+
+    def test_drop_oldest_with_batches(self):
+        actor = Collector('collector', maxsize=2, overflow=Overflow.DROP_OLDEST)
+        actor.insertBatch([data(0), data(1)])
+        actor.insertBatch([data(2), data(3)])
+        actor.insert(data(4))
+        actor.insert(StopMessage.envelope())
+        actor.start()
+        actor.join(timeout=2)
+        self.assertEqual([2, 3, 4], actor.values)
+
+class BatchDispatchTest(unittest.TestCase):
+
+    def test_one_inbox_entry_per_child(self):
+        parent = Actor('parent')
+        children = [BatchCollector('child%d' % index) for index in range(2)]
+        for child in children:
+            parent.add(child)
+        parent.emitBatch(DATA, [Message(value=value) for value in range(5)])
+        entries = [list(child.inbox.queue) for child in children]
+        self.assertEqual([1, 1], [len(queue) for queue in entries])
+        # the batch is shared by the children
+        self.assertIs(entries[0][0], entries[1][0])
+
+        for child in children:
+            stop(child)
+            self.assertEqual([5], child.batches)
+            self.assertEqual(range(5), child.values)
+
+    def test_default_process_batch(self):
+        actor = Collector('collector')
+        actor.insertBatch([data(value) for value in range(3)])
+        actor.insert(data(3))
+        actor.insertBatch([data(value) for value in range(4, 6)])
+        stop(actor)
+        self.assertEqual(range(6), actor.values)
+
+    def test_control_batches_handled_one_by_one(self):
+        actor = BatchCollector('collector')
+        barriers = []
+        actor.on(CHECKPOINT, barriers.append)
+        actor.insertBatch([Message.create(CHECKPOINT, id=index) for index in range(3)])
+        stop(actor)
+        self.assertEqual([], actor.batches)
+        self.assertEqual([0, 1, 2], [barrier.data.id for barrier in barriers])
+
+    def test_stream_filters_batches(self):
+        # the messages left by the filters are processed as one batch
+        stream = BatchStream('stream')
+        stream.addFilter(LimitPredicate(3))
+        stream.insertBatch([data(value) for value in range(5)])
+        stop(stream)
+        self.assertEqual([3], stream.batches)
+        self.assertEqual(range(3), stream.values)
+
+class ThreadOffloadTest(unittest.TestCase):
+
+    def run_actor(self, messages, **kwargs):
+        actor = Sleeper('sleeper', threads=4, **kwargs)
+        recorder = Recorder('recorder')
+        actor.add(recorder)
+        errors = []
+        actor.log_exception = errors.append
+        for message in messages:
+            actor.insert(message)
+        stop(actor)
+        return [entry for entry in recorder.received if entry[0] != START], errors
+
+    def test_order_and_stop(self):
+        # the first messages take longer, their outputs are still emitted first
+        received, errors = self.run_actor([data(value) for value in range(8)])
+        self.assertEqual([(DATA, value) for value in range(8) if value != 2], received[:7])
+        self.assertEqual(STOP, received[-1][0])
+
+    def test_unordered(self):
+        received, errors = self.run_actor([data(value) for value in range(8)], ordered=False)
+        self.assertNotEqual(range(8), [value for channel, value in received[:7]])
+        self.assertEqual([0, 1, 3, 4, 5, 6, 7], sorted(value for channel, value in received[:7]))
+        self.assertEqual(STOP, received[-1][0])
+
+    def test_checkpoint_waits(self):
+        barrier = Message.create(CHECKPOINT, id=1)
+        received, errors = self.run_actor([data(0), data(1), barrier, data(3), data(4)])
+        self.assertEqual([(DATA, 0), (DATA, 1), (CHECKPOINT, None), (DATA, 3), (DATA, 4)], received[:5])
+
+    def test_errors_are_logged(self):
+        received, errors = self.run_actor([data(value) for value in range(4)])
+        self.assertEqual(1, len(errors))
+        self.assertEqual([0, 1, 3], [value for channel, value in received if channel == DATA])
+
+class RoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = ExecutionContext()
+        self.actors = [Collector(name) for name in ('alpha-1', 'alpha-2', 'beta')]
+        for actor in self.actors:
+            actor.setContext(self.context)
+
+    def test_route(self):
+        alpha1, alpha2, beta = self.actors
+        self.context.tag('beta', 'odd')
+        self.context.tag('alpha-1', 'odd')
+        self.assertEqual((beta,), self.context.route('beta'))
+        self.assertEqual((alpha1, alpha2), self.context.route('alpha-*'))
+        self.assertEqual((beta, alpha1), self.context.route('#odd'))
+        self.assertEqual((), self.context.route('gamma'))
+
+        # the cached routes are resolved again once actors are added
+        gamma = Collector('gamma')
+        gamma.setContext(self.context)
+        self.assertEqual((gamma,), self.context.route('gamma'))
+        self.assertEqual((alpha1, alpha2, beta, gamma), self.context.route('*'))
+
+    def test_send_to(self):
+        self.context.tag('alpha-2', 'tagged')
+        received = dict((actor.name, []) for actor in self.actors)
+        for actor in self.actors:
+            actor.on('ping', lambda message, name=actor.name: received[name].append(message))
+        message = Message(value=1)
+        self.context.sendTo('alpha-*', 'ping', message)
+        self.context.sendTo('#tagged', 'ping', message)
+        self.context.sendTo('beta', 'ping', message)
+        self.assertRaises(Exception, self.context.sendTo, 'gamma', 'ping', message)
+        for actor in self.actors:
+            stop(actor)
+
+        self.assertEqual({'alpha-1': 1, 'alpha-2': 2, 'beta': 1}, dict((name, len(messages)) for name, messages in received.items()))
+        # the receivers share the data and keep the timestamp
+        for messages in received.values():
+            for ping in messages:
+                self.assertEqual(('ping', message.ns), (ping.channel, ping.ns))
+                self.assertTrue(ping.data is message.data)
+
+    def test_running_producer(self):
+        # the producer handles the ping while it is still emitting
+        counter = Counter('counter')
+        counter.add(Pinger('pinger'))
+        engine = Engine()
+        engine.add(counter)
+        engine.start()
+        self.assertEqual(1, len(counter.pings))
+        self.assertTrue(5 <= counter.pings[0] <= 6, counter.pings)
+
+class MessageTest(unittest.TestCase):
+
+    def test_slots(self):
+        message = Message(value=1)
+        self.assertFalse(hasattr(message, '__dict__'))
+        self.assertRaises(AttributeError, setattr, message, 'other', 1)
+
+    def test_timestamp(self):
+        message = Message.fromDict({'value': 1}, 1600000000123456789)
+        self.assertEqual(datetime.datetime(2020, 9, 13, 12, 26, 40, 123456), message.datetime)
+        self.assertEqual(1600000000.123456789, message.utc)
+
+        # the cached datetime follows the timestamp
+        message.ns = 1000
+        self.assertEqual(datetime.datetime(1970, 1, 1, 0, 0, 0, 1), message.datetime)
+        message.datetime = datetime.datetime(2020, 9, 13, 12, 26, 40, 5)
+        self.assertEqual(1600000000000005000, message.ns)
+        self.assertTrue(isinstance(Message().ns, (int, long)))
+
+    def test_from_rows(self):
+        rows = [{'value': index} for index in range(3)]
+        messages = Message.fromRows(rows, [10, 20, 30])
+        self.assertEqual([(10, DATA, False, 0), (20, DATA, False, 1), (30, DATA, False, 2)],
+                         [(message.ns, message.channel, message.forward, message.data.value) for message in messages])
+        # the dictionaries are used as they are, and frozen
+        self.assertTrue(messages[0].data.__dict__ is rows[0])
+        self.assertRaises(TypeError, setattr, messages[0].data, 'value', 5)
+
+    def test_pickle(self):
+        for frozen in (False, True):
+            message = Message.create(CHECKPOINT, forward=True, value=1, name='row')
+            if frozen:
+                message.data.freeze()
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                restored = pickle.loads(pickle.dumps(message, protocol))
+                self.assertEqual((message.ns, CHECKPOINT, True), (restored.ns, restored.channel, restored.forward))
+                self.assertEqual(dict(message.data.items()), dict(restored.data.items()))
+                self.assertEqual(message.datetime, restored.datetime)
+
+    def test_envelope(self):
+        message = Message(value=1)
+        envelope = message.envelope(CHECKPOINT, True)
+        self.assertIs(message.data, envelope.data)
+        self.assertEqual((message.ns, CHECKPOINT, True), (envelope.ns, envelope.channel, envelope.forward))
+        self.assertEqual((DATA, False), (message.channel, message.forward))
+
+class FrozenMessageTest(unittest.TestCase):
+
+    def test_frozen_data_rejects_mutation(self):
+        message = Message(value=1)
+        message.data.freeze()
+        self.assertRaises(TypeError, message.data.set, 'value', 2)
+        self.assertRaises(TypeError, message.data.__setitem__, 'other', 2)
+        self.assertRaises(TypeError, setattr, message.data, 'value', 2)
+        self.assertRaises(TypeError, message.data.__delitem__, 'value')
+        self.assertRaises(TypeError, message.data.update, value=2)
+        self.assertEqual({'value': 1}, dict(message.data.items()))
+
+        # the copy can be changed
+        copy = message.copy()
+        copy.data.set('value', 2)
+        self.assertEqual((1, 2), (message.data.value, copy.data.value))
+        self.assertEqual(message.ns, copy.ns)
+
+    def test_emit_freezes(self):
+        parent = Actor('parent')
+        parent.add(Collector('child'))
+        message = Message(value=1)
+        parent.emit(DATA, message)
+        self.assertRaises(TypeError, message.data.set, 'value', 2)
+
+    def test_overrides_copy_shared_messages(self):
+        overrides = [StaticParamOverride('value', 0), CopyParamOverride('value', 'other'), RenameParamOverride('value', 'other'),
+                     FunctionOverride('value', str), AddParamOverride('value', 1),
+                     TimeBiasOverride(datetime.timedelta(seconds=1))]
+        for override in overrides:
+            # two streams with the same parent receive the same data
+            parent = Actor('parent')
+            siblings = [StreamElement('override'), Collector('plain')]
+            siblings[0].addOverride(override)
+            for sibling in siblings:
+                parent.add(sibling)
+            message = Message(value=1)
+            parent.emit(DATA, message)
+
+            received = [sibling.inbox.get() for sibling in siblings]
+            self.assertIs(received[0].data, received[1].data)
+            modified = siblings[0].modify(received[0])
+            self.assertIsNot(received[0], modified)
+            self.assertEqual({'value': 1}, dict(received[1].data.items()))
+            self.assertEqual(message.ns, received[1].ns)
+
+class MessageBatchTest(unittest.TestCase):
+
+    def messages(self):
+        messages = [Message(value=index, name='row %d' % index) for index in range(5)]
+        messages[2].data.set('extra', 2.5)
+        for index, message in enumerate(messages):
+            message.ns = 1000 + index
+        return messages
+
+    def rows(self, messages):
+        return [(message.ns, dict(message.data.items())) for message in messages]
+
+    def test_round_trip(self):
+        messages = self.messages()
+        batch = MessageBatch.fromMessages(messages)
+        self.assertEqual(5, len(batch))
+        self.assertEqual([False, False, True, False, False], batch.presence('extra').tolist())
+        self.assertEqual(self.rows(messages), self.rows(batch.toMessages()))
+
+    def test_select(self):
+        messages = self.messages()
+        batch = MessageBatch.fromMessages(messages)
+        selected = batch.select(batch.data.value >= 2)
+        self.assertEqual(self.rows(messages[2:]), self.rows(selected.toMessages()))
+
+    def test_pickle(self):
+        batch = MessageBatch.fromMessages(self.messages())
+        batch.data.freeze()
+        restored = pickle.loads(pickle.dumps(batch, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(self.rows(batch.toMessages()), self.rows(restored.toMessages()))
+
+    def test_column_length(self):
+        self.assertRaises(ValueError, MessageBatch, [1, 2], value=[1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, logging
+from tributary.core import Actor, Engine, ExecutionContext, Message
+from tributary.streams import StreamElement, StreamProducer, LimitPredicate
+from tributary.metrics import MetricsRegistry
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Producer(StreamProducer):
+    def process(self, message=None):
+        for index in range(10):
+            self.emit('data', Message(index=index))
+
+class Forward(StreamElement):
+    def process(self, message=None):
+        self.scatter(message)
+
+class Collector(Actor):
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.messages = []
+
+    def process(self, message=None):
+        self.messages.append(message)
+
+def build(ctx=None):
+    producer = Producer('producer')
+    forward = Forward('forward')
+    forward.addFilter(LimitPredicate(7))
+    collector = Collector('collector')
+    producer.add(forward)
+    forward.add(collector)
+    engine = Engine(ctx)
+    engine.add(producer)
+    return engine, producer, forward, collector
+
+class MetricsTest(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        engine, producer, forward, collector = build()
+        engine.start()
+        self.assertEqual(7, len(collector.messages))
+        self.assertEqual(None, engine._context.metrics)
+        self.assertEqual(None, forward.metrics)
+
+    def test_summary_requires_metrics(self):
+        engine, producer, forward, collector = build()
+        self.assertRaises(ValueError, engine.start, summary=True)
+
+    def test_counts(self):
+        engine, producer, forward, collector = build(ExecutionContext(metrics=True))
+        engine.start(summary=True)
+        metrics = engine._context.metrics
+        self.assertEqual(10, metrics['producer'].emitted)
+        self.assertEqual(10, metrics['forward'].received)
+        self.assertEqual([3], metrics['forward'].filtered)
+        self.assertEqual(7, metrics['forward'].emitted)
+        self.assertEqual(7, metrics[collector].received)
+        self.assertEqual(7, metrics[collector].handled)
+        self.assertEqual(['actor', 'producer', 'forward', 'collector'], [line.split()[0] for line in metrics.summary()])
+
+    def test_actors_with_the_same_name(self):
+        registry = MetricsRegistry()
+        first, second = Collector('collector'), Collector('collector')
+        self.assertTrue(registry.register(first) is not registry.register(second))
+        self.assertTrue(registry.register(first) is registry[first])
+        self.assertEqual(2, len(registry.report()))
+        # a name is only enough when it is unique
+        self.assertRaises(KeyError, registry.__getitem__, 'collector')
+        self.assertRaises(KeyError, registry.__getitem__, 'missing')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, datetime, logging
+from tributary.core import Message, MessageBatch, BaseOverride
+from tributary.streams import StreamElement, LimitPredicate, SkipPredicate, SkipLimitPredicate
+from tributary.predicates import compileModifiers
+from tributary.overrides import TimeBiasOverride, StaticParamOverride, CopyParamOverride, RenameParamOverride, \
+    FunctionOverride, StringTypeOverride, FloatTypeOverride, IntTypeOverride, MultiplyParamOverride, \
+    AddParamOverride, SubtractParamOverride, DivideParamOverride
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+START = 1600000000 * 10 ** 9
+
+def messages():
+    result = []
+    for index in range(10):
+        params = {'a': index - 4, 'b': index * 0.25, 's': '%d' % (index * 3)}
+        if index % 3:
+            params['p'] = index * 7
+        result.append(Message.fromDict(params, START + index * 1234567))
+    return result
+
+def rows(messages):
+    # the types are compared as well, 1 and 1.0 are not the same result
+    return [(message.ns, sorted((name, type(value).__name__, value) for name, value in message.data.items()))
+            for message in messages]
+
+OVERRIDES = [
+    TimeBiasOverride(datetime.timedelta(seconds=-3, microseconds=5)),
+    StaticParamOverride('s', 'static'),
+    StaticParamOverride('p', 1),
+    CopyParamOverride('a', 'c'),
+    CopyParamOverride('p', 'c'),
+    CopyParamOverride('p', 'a'),
+    RenameParamOverride('a', 'c'),
+    RenameParamOverride('p', 'c'),
+    RenameParamOverride('p', 'a'),
+    RenameParamOverride('missing', 'a'),
+    FunctionOverride('a', abs),
+    FunctionOverride('p', lambda value: 'p%d' % value),
+    StringTypeOverride('a'),
+    StringTypeOverride('b'),
+    FloatTypeOverride('a'),
+    FloatTypeOverride('s'),
+    IntTypeOverride('b'),
+    IntTypeOverride('s'),
+    IntTypeOverride('p'),
+    MultiplyParamOverride('a', 3),
+    MultiplyParamOverride('s', 2),
+    AddParamOverride('b', 1),
+    AddParamOverride('p', 0.5),
+    AddParamOverride('s', 'x'),
+    SubtractParamOverride('a', 2),
+    DivideParamOverride('a', 3),
+    DivideParamOverride('b', 2),
+    DivideParamOverride('p', 2),
+]
+
+class BatchOverrideTest(unittest.TestCase):
+
+    def test_every_override(self):
+        for override in OVERRIDES:
+            batch = MessageBatch.fromMessages(messages())
+            batch.data.freeze()
+            expected = [override.apply(message) for message in messages()]
+            result = override.applyBatch(batch)
+            self.assertTrue(isinstance(result, MessageBatch))
+            self.assertEqual(rows(expected), rows(result.toMessages()), override)
+
+    def test_stream(self):
+        # a stream applies the modifiers to the columns of a batch
+        def modifiers():
+            return [MultiplyParamOverride('a', 2), LimitPredicate(6), TimeBiasOverride(datetime.timedelta(seconds=1)),
+                    IntTypeOverride('b'), SkipPredicate(1)]
+        stream = StreamElement('stream')
+        for modifier in modifiers():
+            if isinstance(modifier, BaseOverride):
+                stream.addOverride(modifier)
+            else:
+                stream.addFilter(modifier)
+        result = stream.modify(MessageBatch.fromMessages(messages()))
+
+        pipeline = compileModifiers(modifiers())
+        expected = [message for message in (pipeline(message) for message in messages()) if message is not None]
+        self.assertEqual(5, len(expected))
+        self.assertEqual(rows(expected), rows(result.toMessages()))
+
+class CountingPredicateTest(unittest.TestCase):
+
+    def check(self, factory, expected):
+        values = range(20)
+
+        # compiled, one message at a time
+        pipeline = compileModifiers([factory()])
+        self.assertEqual(expected, [value for value in values if pipeline(Message(value=value)) is not None])
+
+        # masks, the count carries over from one batch to the next
+        predicate = factory()
+        selected = []
+        for start in range(0, 20, 7):
+            batch = MessageBatch(range(start, min(start + 7, 20)), value=values[start:start + 7])
+            selected.extend(batch.data.value[predicate.mask(batch)].tolist())
+        self.assertEqual(expected, selected)
+
+    def test_limit(self):
+        self.check(lambda: LimitPredicate(5), range(5))
+        self.check(lambda: LimitPredicate(0), [])
+
+    def test_skip(self):
+        self.check(lambda: SkipPredicate(5), range(5, 20))
+        self.check(lambda: SkipPredicate(0), range(20))
+
+    def test_skip_limit(self):
+        self.check(lambda: SkipLimitPredicate(3, 10), range(3, 13))
+        self.check(lambda: SkipLimitPredicate(15, 10), range(15, 20))
+        self.check(lambda: LimitPredicate(4, offset=2), range(2, 6))
+
+    def test_stream_limit(self):
+        stream = StreamElement('stream').limit(4, 3)
+        self.assertEqual(range(3, 7), [value for value in range(20) if stream.modify(Message(value=value)) is not None])
+        stream = StreamElement('stream').skip(2)
+        self.assertEqual(range(2, 20), [value for value in range(20) if stream.modify(Message(value=value)) is not None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, logging, time
+import gevent
+from tributary.core import Engine, Message
+from tributary.streams import StreamElement, StreamProducer
+from tributary.parallel import ProcessPoolElement, PartitionedStreamElement
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Producer(StreamProducer):
+    """Emits `count` messages with a key among `keys`, the last tenth as a batch"""
+    def __init__(self, name, count, keys=7):
+        super(Producer, self).__init__(name)
+        self.count = count
+        self.keys = keys
+
+    def process(self, message=None):
+        single = self.count - self.count // 10
+        for index in range(single):
+            self.emit('data', Message(index=index, key='key%d' % (index % self.keys)))
+        self.emitBatch('data', [Message(index=index, key='key%d' % (index % self.keys))
+                                for index in range(single, self.count)])
+
+class Square(StreamElement):
+    def process(self, message=None):
+        self.scatter(Message(index=message.data.index, square=message.data.index ** 2))
+
+class SlowSquare(Square):
+    def process(self, message=None):
+        time.sleep(0.2)
+        super(SlowSquare, self).process(message)
+
+class Failing(StreamElement):
+    def process(self, message=None):
+        if message.data.index == 3:
+            raise ValueError(message.data.index)
+        self.scatter(message)
+
+class KeyCounter(StreamElement):
+    """Emits how many messages of its key it has seen so far"""
+    def __init__(self, name):
+        super(KeyCounter, self).__init__(name)
+        self.seen = {}
+
+    def process(self, message=None):
+        key = message.data.key
+        self.seen[key] = self.seen.get(key, 0) + 1
+        self.scatter(Message(key=key, seen=self.seen[key], replica=self.name))
+
+class Collector(StreamElement):
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.messages = []
+
+    def process(self, message=None):
+        self.messages.append(message.data)
+
+def run(producer, node):
+    collector = Collector('collector')
+    producer.add(node)
+    node.add(collector)
+    engine = Engine()
+    engine.add(producer)
+    engine.start()
+    return collector.messages
+
+class ProcessPoolElementTest(unittest.TestCase):
+
+    def test_ordered_results(self):
+        messages = run(Producer('producer', 200), ProcessPoolElement('pool', Square, ('worker',), processes=3, batchSize=7))
+        self.assertEqual([(index, index ** 2) for index in range(200)],
+                         [(data.index, data.square) for data in messages])
+
+    def test_unordered_results(self):
+        pool = ProcessPoolElement('pool', Square, ('worker',), processes=3, batchSize=7, ordered=False)
+        messages = run(Producer('producer', 200), pool)
+        self.assertEqual(range(200), sorted(data.index for data in messages))
+
+    def test_hub_threadpool_is_free(self):
+        # more batches in flight than threads in the hub's threadpool
+        pool = ProcessPoolElement('pool', SlowSquare, ('worker',), processes=2, batchSize=1, inflight=20)
+        collector = Collector('collector')
+        pool.add(collector)
+        pool.preProcess()
+        pool.processBatch([Message(index=index) for index in range(20)])
+        gevent.sleep(0.05)
+        start = time.time()
+        gevent.get_hub().threadpool.apply(int)
+        self.assertTrue(time.time() - start < 0.1)
+        pool.postProcess()
+        self.assertEqual(20, collector.inbox.qsize())
+
+    def test_worker_errors(self):
+        pool = ProcessPoolElement('pool', Failing, ('worker',), processes=2, batchSize=2)
+        errors = []
+        pool.log_exception = errors.append
+        messages = run(Producer('producer', 10), pool)
+        self.assertEqual(1, len(errors))
+        self.assertEqual([0, 1, 4, 5, 6, 7, 8, 9], [data.index for data in messages])
+
+class PartitionedStreamElementTest(unittest.TestCase):
+
+    def check(self, processes):
+        node = PartitionedStreamElement('part', KeyCounter, 'key', 3, processes=processes)
+        messages = run(Producer('producer', 350), node)
+        self.assertEqual(350, len(messages))
+
+        # every key is handled by a single replica, which sees all of its messages
+        replicas = {}
+        for data in messages:
+            replicas.setdefault(data.key, set()).add(data.replica)
+        self.assertTrue(all(len(names) == 1 for names in replicas.values()))
+        self.assertEqual([50] * 7, [max(data.seen for data in messages if data.key == key) for key in sorted(replicas)])
+
+    def test_greenlets(self):
+        self.check(False)
+
+    def test_processes(self):
+        self.check(True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, tempfile, shutil, os, json, logging
+from tributary.core import Actor, Engine
+from tributary.parsers import CSVSource, JSONLinesSource
+from tributary.predicates import InclusiveTimePredicate
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+START = 1600000000
+
+class Collector(Actor):
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.rows = []
+
+    def process(self, message=None):
+        self.rows.append((message.ns, dict(message.data.items())))
+
+def run(source):
+    collector = Collector('collector')
+    source.add(collector)
+    engine = Engine()
+    engine.add(source)
+    engine.start()
+    return collector.rows
+
+class Chunks(object):
+    """Records the offsets of the chunks processed by a source"""
+    def processChunk(self, filename, chunk):
+        self.chunks.append(self.position[1])
+        super(Chunks, self).processChunk(filename, chunk)
+
+class ChunkedCSVSource(Chunks, CSVSource):
+    chunks = None
+
+class ChunkedJSONLinesSource(Chunks, JSONLinesSource):
+    chunks = None
+
+class ParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(content)
+        return filename
+
+class TimeSortedTest(ParserTest):
+
+    def setUp(self):
+        super(TimeSortedTest, self).setUp()
+        self.csv = self.write('rows.csv', 'time,value\n' + ''.join('%d,%d\n' % (START + index, index) for index in range(20000)))
+        self.json = self.write('rows.json', ''.join(json.dumps({'time': START + index, 'value': index}) + '\n' for index in range(20000)))
+
+    def check(self, source, timeSorted):
+        source.chunks = []
+        source.addFilter(InclusiveTimePredicate(START + 15000, START + 15100))
+        rows = run(source)
+        self.assertEqual(range(15000, 15100), [data['value'] for ns, data in rows])
+        self.assertEqual([(START + 15000 + index) * 10 ** 9 for index in range(100)], [ns for ns, data in rows])
+        if timeSorted:
+            # the file is bisected to the chunk holding the start, the reading stops after the end
+            self.assertTrue(len(source.chunks) <= 2, source.chunks)
+            self.assertTrue(source.chunks[0] > 0)
+        else:
+            self.assertTrue(len(source.chunks) > 50)
+
+    def test_csv(self):
+        for timeSorted in (True, False):
+            self.check(ChunkedCSVSource('source', self.csv, timeField='time', timeSorted=timeSorted, chunkSize=4096), timeSorted)
+
+    def test_json(self):
+        for timeSorted in (True, False):
+            self.check(ChunkedJSONLinesSource('source', self.json, timeField='time', timeSorted=timeSorted, chunkSize=4096), timeSorted)
+
+    def test_csv_columnar(self):
+        source = ChunkedCSVSource('source', self.csv, timeField='time', timeSorted=True, columnar=True, chunkSize=4096)
+        source.chunks = []
+        source.addFilter(InclusiveTimePredicate(START + 15000, START + 15100))
+        rows = run(source)
+        self.assertEqual(1, len(rows))
+        self.assertTrue(len(source.chunks) <= 2)
+
+    def test_range_outside_of_the_file(self):
+        for start in (START - 100, START + 30000):
+            source = ChunkedCSVSource('source', self.csv, timeField='time', timeSorted=True, chunkSize=4096)
+            source.chunks = []
+            source.addFilter(InclusiveTimePredicate(start, start + 50))
+            self.assertEqual([], run(source))
+            self.assertTrue(len(source.chunks) <= 1)
+
+class ErrorTest(ParserTest):
+
+    def test_invalid_times(self):
+        content = 'time,value\n%d,0\nnot a time,1\n,2\n%d,3\n' % (START, START + 3)
+        for columnar in (False, True):
+            source = CSVSource('source', self.write('rows.csv', content), timeField='time', columnar=columnar)
+            rows = run(source)
+            self.assertEqual(2, source.errors)
+            if columnar:
+                self.assertEqual([0, 3], list(rows[0][1]['value']))
+            else:
+                self.assertEqual([(START * 10 ** 9, 0), ((START + 3) * 10 ** 9, 3)], [(ns, data['value']) for ns, data in rows])
+
+    def test_invalid_iso_times(self):
+        content = ''.join(json.dumps({'time': time, 'value': index}) + '\n' for index, time in
+                          enumerate(['2020-09-13T12:26:40', 'yesterday', None, '2020-09-13T12:26:43']))
+        source = JSONLinesSource('source', self.write('rows.json', content), timeField='time', timeUnit='iso')
+        rows = run(source)
+        self.assertEqual(2, source.errors)
+        self.assertEqual([(START * 10 ** 9, 0), ((START + 3) * 10 ** 9, 3)], [(ns, data['value']) for ns, data in rows])
+
+    def test_inferred_int_widened(self):
+        # the types are inferred from the first chunk, later floats do not fit
+        content = 'time,value\n' + ''.join('%d,%d\n' % (START + index, index) for index in range(200))
+        content += '%d,2.5\n%d,abc\n%d,\n' % (START + 200, START + 201, START + 202)
+        source = CSVSource('source', self.write('rows.csv', content), timeField='time', chunkSize=1024)
+        rows = run(source)
+        self.assertEqual(1, source.errors)
+        self.assertEqual(float, dict(source.schema)['value'])
+        self.assertEqual(range(200) + [2.5, None], [data['value'] for ns, data in rows])
+
+    def test_invalid_values(self):
+        content = 'time,value\n%d,1\n%d,abc\n%d,\n%d,4\n' % tuple(range(START, START + 4))
+        for columnar in (False, True):
+            source = CSVSource('source', self.write('rows.csv', content), schema=[('time', int), ('value', int)],
+                               timeField='time', columnar=columnar)
+            rows = run(source)
+            self.assertEqual(1, source.errors)
+            if columnar:
+                # missing values are NaN
+                values = rows[0][1]['value']
+                self.assertEqual([1.0, 4.0], [values[0], values[2]])
+                self.assertTrue(values[1] != values[1])
+            else:
+                self.assertEqual([1, None, 4], [data['value'] for ns, data in rows])
+
+    def test_quoted_line_breaks(self):
+        texts = ['a "quoted"\nline break', 'plain', ',\n\n,', 'x' * 100 + '\n' + 'y' * 100]
+        content = 'time,text\n' + ''.join('%d,"%s"\n' % (START + index, texts[index % 4].replace('"', '""')) for index in range(100))
+        for chunkSize in (64, 1024, 1 << 20):
+            source = CSVSource('source', self.write('rows.csv', content), timeField='time', chunkSize=chunkSize)
+            rows = run(source)
+            self.assertEqual(0, source.errors)
+            self.assertEqual([texts[index % 4] for index in range(100)], [data['text'] for ns, data in rows])
+
+    def test_several_objects_on_a_line(self):
+        content = '{"a": 1}\n{"a": 2},{"a": 3}\n[4, 5]\n{"a": 6}\n'
+        for columnar in (False, True):
+            source = JSONLinesSource('source', self.write('rows.json', content), columnar=columnar)
+            rows = run(source)
+            self.assertEqual(2, source.errors)
+            if columnar:
+                self.assertEqual([1, 6], list(rows[0][1]['a']))
+            else:
+                self.assertEqual([1, 6], [data['a'] for ns, data in rows])
+
+    def test_json_schema(self):
+        # the values of per-row messages are converted like the columns
+        content = '{"a": "1", "b": 2, "c": "x"}\n{"a": 2.0, "b": "2.5"}\n{"a": "abc", "b": 1}\n{"b": null, "c": 3}\n'
+        source = JSONLinesSource('source', self.write('rows.json', content), schema=[('a', int), ('b', float)])
+        rows = run(source)
+        self.assertEqual(1, source.errors)
+        self.assertEqual([{'a': 1, 'b': 2.0, 'c': 'x'}, {'a': 2, 'b': 2.5}, {'b': None, 'c': 3}], [data for ns, data in rows])
+        self.assertEqual([(int, float)] * 2, [(type(data['a']), type(data['b'])) for ns, data in rows[:2]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, random
+from tributary.core import Message, BasePredicate, BaseOverride
+from tributary.predicates import InclusiveTimePredicate, ExclusiveTimePredicate, LessThanTimePredicate, \
+    GreaterThanTimePredicate, AndPredicate, OrPredicate, ReversePredicate, ParamEqualPredicate, \
+    ParamNotEqualPredicate, ParamLessThanPredicate, ParamLessThanOrEqualToPredicate, ParamGreaterThanPredicate, \
+    ParamGreaterThanOrEqualToPredicate, ParamInPredicate, ParamNotInPredicate, ParamContainsPredicate, \
+    compilePredicate, compileModifiers
+from tributary.streams import LimitPredicate
+from tributary.overrides import AddParamOverride, StaticParamOverride
+
+START = 1600000000
+
+class OddEqualPredicate(ParamEqualPredicate):
+    """A subclass overriding `eval`, which is called through `apply`"""
+    def eval(self, value):
+        return value % 2 == 1
+
+def leaf(rand):
+    kind = rand.randrange(12)
+    valid = rand.random() < 0.5
+    if kind < 6:
+        classes = [ParamEqualPredicate, ParamNotEqualPredicate, ParamLessThanPredicate,
+                   ParamLessThanOrEqualToPredicate, ParamGreaterThanPredicate, ParamGreaterThanOrEqualToPredicate]
+        return classes[kind](rand.choice(['a', 'c']), rand.randrange(10), valid)
+    elif kind == 6:
+        return ParamInPredicate('a', rand.sample(range(10), 3), valid)
+    elif kind == 7:
+        return ParamNotInPredicate('c', rand.sample(range(10), 3), valid)
+    elif kind == 8:
+        return ParamContainsPredicate('b', rand.choice('xyz'))
+    elif kind == 9:
+        start = START + rand.randrange(100)
+        return rand.choice([InclusiveTimePredicate, ExclusiveTimePredicate])(start, start + rand.randrange(1, 50))
+    elif kind == 10:
+        return rand.choice([LessThanTimePredicate, GreaterThanTimePredicate])(START + rand.randrange(100))
+    return OddEqualPredicate('a', 0, valid)
+
+def tree(rand, depth):
+    if depth <= 1:
+        return leaf(rand)
+    kind = rand.randrange(3)
+    if kind == 2:
+        return ReversePredicate(tree(rand, depth - 1))
+    group = AndPredicate() if kind == 0 else OrPredicate()
+    for index in range(rand.randrange(1, 4)):
+        group.addPredicate(tree(rand, rand.randrange(1, depth)) if index else tree(rand, depth - 1))
+    return group
+
+def messages(rand, count):
+    result = []
+    for index in range(count):
+        params = {'a': rand.randrange(10), 'b': ''.join(rand.sample('xyzw', 2))}
+        if rand.random() < 0.7:
+            params['c'] = rand.randrange(10)
+        result.append(Message.fromDict(params, (START + rand.randrange(100)) * 10 ** 9))
+    return result
+
+def interpret(modifiers, message):
+    """Applies the modifiers one after the other"""
+    for modifier in modifiers:
+        if isinstance(modifier, BasePredicate):
+            if not modifier.apply(message):
+                return None
+        else:
+            message = modifier.apply(message)
+    return message
+
+class CompiledPredicateTest(unittest.TestCase):
+
+    def test_random_trees(self):
+        rand = random.Random(42)
+        rows = messages(rand, 100)
+        for depth in range(1, 6):
+            for attempt in range(80):
+                predicate = tree(rand, depth)
+                compiled = compilePredicate(predicate)
+                self.assertEqual([bool(predicate.apply(row)) for row in rows], [bool(compiled.apply(row)) for row in rows],
+                                 compiled.source)
+
+    def test_empty_groups(self):
+        row = Message(a=1)
+        self.assertTrue(compilePredicate(AndPredicate()).apply(row))
+        self.assertFalse(compilePredicate(OrPredicate()).apply(row))
+
+    def test_modifiers(self):
+        rand = random.Random(7)
+        rows = messages(rand, 100)
+        for attempt in range(50):
+            modifiers = []
+            for index in range(rand.randrange(1, 6)):
+                if rand.random() < 0.3:
+                    modifiers.append(rand.choice([AddParamOverride('a', 3), StaticParamOverride('c', rand.randrange(10))]))
+                else:
+                    modifiers.append(tree(rand, rand.randrange(1, 4)))
+
+            expected = [interpret(modifiers, row) for row in rows]
+            counts = [0] * len(modifiers)
+            for function in (compileModifiers(modifiers), compileModifiers(modifiers, counts)):
+                results = [function(row) for row in rows]
+                self.assertEqual([None if row is None else (row.ns, dict(row.data.items())) for row in expected],
+                                 [None if row is None else (row.ns, dict(row.data.items())) for row in results])
+
+            # the rejected messages are counted by the filter which rejected them
+            self.assertEqual(expected.count(None), sum(counts))
+            for index, modifier in enumerate(modifiers):
+                if isinstance(modifier, BaseOverride):
+                    self.assertEqual(0, counts[index])
+
+    def test_stateful_predicates(self):
+        # the predicates which are not inlined keep their state
+        rows = messages(random.Random(3), 10)
+        limit = compileModifiers([OrPredicate().addPredicate(ParamEqualPredicate('a', -1)), LimitPredicate(4)])
+        self.assertEqual(rows[:4], [row for row in rows if limit(row) is not None])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, logging
+import gevent
+from tributary.core import Engine, ExecutionContext, Message
+from tributary.streams import StreamElement, StreamProducer
+from tributary.events import StopMessage
+from tributary.remote import RemoteActor, RemoteEndpoint
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Producer(StreamProducer):
+    def process(self, message=None):
+        for index in range(1000):
+            self.emit('data', Message(index=index))
+        self.emitBatch('data', [Message(index=index) for index in range(1000, 1500)])
+
+class Collector(StreamElement):
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.values = []
+        self.starts = self.stops = 0
+
+    def preProcess(self, message=None):
+        self.starts += 1
+
+    def postProcess(self, message=None):
+        self.stops += 1
+
+    def process(self, message=None):
+        self.values.append(message.data.index)
+
+class Thing(object):
+    """A value only the pickle fallback can encode"""
+    def __init__(self, value):
+        self.value = value
+
+class ThingProducer(StreamProducer):
+    def process(self, message=None):
+        self.emit('data', Message(index=0, thing=Thing(0)))
+
+class RemoteActorTest(unittest.TestCase):
+
+    def run_engines(self, producer, target, allowPickle=False):
+        context = ExecutionContext()
+        receiver = Engine(context)
+        collector = Collector('collector')
+        receiver.add(collector)
+        endpoint = RemoteEndpoint('endpoint', context, allowPickle=allowPickle)
+        errors = []
+        endpoint.log_exception = errors.append
+        host, port = endpoint.address
+
+        sender = Engine()
+        producer.add(RemoteActor('proxy', host, port, target, batchSize=64, window=2))
+        sender.add(producer)
+
+        receiving, sending = gevent.spawn(receiver.start), gevent.spawn(sender.start)
+        sending.join(timeout=10)
+        self.assertTrue(sending.ready())
+
+        # the collector does not receive the STOP of a connection which was closed
+        if not receiving.ready():
+            collector.insert(StopMessage.envelope())
+        receiving.join(timeout=10)
+        self.assertTrue(receiving.ready())
+        return collector, errors
+
+    def test_pipeline_over_tcp(self):
+        context = ExecutionContext()
+        receiver = Engine(context)
+        collector = Collector('collector')
+        receiver.add(collector)
+        host, port = RemoteEndpoint('endpoint', context, '127.0.0.1', 0).address
+
+        sender = Engine()
+        producer = Producer('producer')
+        producer.add(RemoteActor('proxy', host, port, 'collector', batchSize=64, window=2))
+        sender.add(producer)
+
+        engines = [gevent.spawn(receiver.start), gevent.spawn(sender.start)]
+        gevent.joinall(engines, timeout=30)
+        self.assertTrue(all(engine.ready() for engine in engines))
+
+        # every message arrives once, in order, and the remote actor is started once
+        self.assertEqual(range(1500), collector.values)
+        self.assertEqual(1, collector.starts)
+        self.assertTrue(collector.stops >= 1)
+
+    def test_unknown_target(self):
+        # the endpoint closes the connection and the sender stops instead of waiting for credits
+        collector, errors = self.run_engines(Producer('producer'), 'missing')
+        self.assertEqual(1, len(errors))
+        self.assertEqual([], collector.values)
+
+    def test_pickle_rejected(self):
+        collector, errors = self.run_engines(ThingProducer('producer'), 'collector')
+        self.assertEqual(1, len(errors))
+        self.assertEqual([], collector.values)
+
+        collector, errors = self.run_engines(ThingProducer('producer'), 'collector', allowPickle=True)
+        self.assertEqual([], errors)
+        self.assertEqual([0], collector.values)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, tempfile, shutil, os, logging
+import gevent
+from tributary.core import Actor, Engine, Message, MessageBatch
+from tributary.streams import StreamProducer
+from tributary.sinks import Sync, FileSink, JSONLinesSink, CSVSink, BinarySink
+from tributary.parsers import CSVSource, JSONLinesSource
+from tributary.codec import readMessages
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+START = 1600000000 * 10 ** 9
+
+def rows(count):
+    return [Message.fromDict({'index': index, 'name': 'name "%d",\n' % index, 'value': index * 0.5}, START + index * 1000)
+            for index in range(count)]
+
+class Producer(StreamProducer):
+    """Emits the given messages, the last half as a batch"""
+    def __init__(self, name, messages):
+        super(Producer, self).__init__(name)
+        self.messages = messages
+
+    def process(self, message=None):
+        half = len(self.messages) // 2
+        for message in self.messages[:half]:
+            self.emit('data', message)
+        rest = self.messages[half:]
+        self.emit('data', MessageBatch([message.ns for message in rest],
+                                       **dict((name, [message.data[name] for message in rest]) for name in ('index', 'name', 'value'))))
+
+def run(producer, *nodes):
+    for node in nodes:
+        producer.add(node)
+    engine = Engine()
+    engine.add(producer)
+    engine.start()
+    return engine
+
+class Collector(Actor):
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.messages = []
+
+    def process(self, message=None):
+        self.messages.append(message)
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def content(self):
+        with open(self.filename, 'rb') as f:
+            return f.read()
+
+class FlushTest(SinkTest):
+
+    def lines(self, start, stop):
+        return ''.join('%d\n' % index for index in range(start, stop))
+
+    def test_size_flush(self):
+        sink = FileSink('sink', self.filename, field='index', bufferSize=20, flushInterval=None)
+        sink.preProcess()
+        for index in range(10):
+            sink.process(Message(index=index))
+        # the buffer is written each time it holds 20 bytes
+        self.assertEqual(self.lines(0, 10), self.content())
+        self.assertEqual(1, sink.writes)
+        sink.process(Message(index=10))
+        self.assertEqual(self.lines(0, 10), self.content())
+        sink.postProcess()
+        self.assertEqual(self.lines(0, 11), self.content())
+        self.assertEqual(2, sink.writes)
+        self.assertEqual(11, sink.count)
+
+    def test_deadline_flush(self):
+        sink = FileSink('sink', self.filename, field='index', flushInterval=0.05)
+        sink.preProcess()
+        sink.process(Message(index=0))
+        gevent.sleep(0.01)
+        sink.process(Message(index=1))
+        self.assertEqual('', self.content())
+        # the deadline is set by the first buffered record
+        gevent.sleep(0.06)
+        self.assertEqual(self.lines(0, 2), self.content())
+        self.assertEqual(1, sink.writes)
+        sink.process(Message(index=2))
+        gevent.sleep(0.06)
+        self.assertEqual(self.lines(0, 3), self.content())
+        self.assertEqual(2, sink.writes)
+        sink.postProcess()
+        self.assertEqual(2, sink.writes)
+
+    def test_order_across_flushes(self):
+        # size and deadline flushes interleave with single messages and batches
+        sink = FileSink('sink', self.filename, field='index', bufferSize=50, flushInterval=0.002)
+        sink.preProcess()
+        index = 0
+        for step in range(100):
+            if step % 3:
+                sink.process(Message(index=index))
+                index += 1
+            else:
+                size = step % 7 + 1
+                sink.processBatch([Message(index=index)] + [MessageBatch([START] * size, index=range(index + 1, index + size + 1))])
+                index += size + 1
+            if step % 5 == 0:
+                gevent.sleep(0.003)
+        sink.postProcess()
+        self.assertEqual(self.lines(0, index), self.content())
+        self.assertEqual(index, sink.count)
+        self.assertTrue(sink.writes > 10)
+
+    def test_engine_stop_writes_buffer(self):
+        messages = rows(1000)
+        sink = FileSink('sink', self.filename, field='index', flushInterval=None)
+        run(Producer('producer', messages), sink)
+        self.assertEqual(self.lines(0, 1000), self.content())
+        self.assertEqual(1, sink.writes)
+
+    def test_group_sync(self):
+        sink = FileSink('sink', self.filename, field='index', bufferSize=1, sync=Sync.GROUP, syncInterval=0.05)
+        sink.preProcess()
+        for index in range(10):
+            sink.process(Message(index=index))
+        # the writes wait for a single sync
+        self.assertEqual(10, sink.writes)
+        self.assertEqual(0, sink.syncs)
+        gevent.sleep(0.06)
+        self.assertEqual(1, sink.syncs)
+        sink.process(Message(index=10))
+        self.assertEqual(1, sink.syncs)
+        # the sink syncs the last writes when it stops
+        sink.postProcess()
+        self.assertEqual(2, sink.syncs)
+        self.assertEqual(self.lines(0, 11), self.content())
+
+    def test_always_sync(self):
+        sink = FileSink('sink', self.filename, field='index', bufferSize=1, sync=Sync.ALWAYS)
+        sink.preProcess()
+        for index in range(5):
+            sink.process(Message(index=index))
+        sink.postProcess()
+        self.assertEqual(5, sink.syncs)
+
+    def test_restore_truncates(self):
+        sink = FileSink('sink', self.filename, field='index')
+        sink.preProcess()
+        for index in range(5):
+            sink.process(Message(index=index))
+        state = sink.snapshot()
+        for index in range(5, 8):
+            sink.process(Message(index=index))
+        sink.postProcess()
+        self.assertEqual(self.lines(0, 8), self.content())
+
+        # the records written after the checkpoint are dropped, then written again
+        sink = FileSink('sink', self.filename, field='index')
+        sink.restore(state)
+        sink.preProcess()
+        for index in range(5, 10):
+            sink.process(Message(index=index))
+        sink.postProcess()
+        self.assertEqual(self.lines(0, 10), self.content())
+        self.assertEqual(10, sink.count)
+
+class RoundTripTest(SinkTest):
+
+    def check(self, messages, results):
+        self.assertEqual([message.ns for message in messages], [message.ns for message in results])
+        # the time field read back is the timestamp
+        self.assertEqual([dict(message.data.items()) for message in messages],
+                         [dict(item for item in message.data.items() if item[0] != 'time') for message in results])
+
+    def test_json_lines(self):
+        messages = rows(100)
+        run(Producer('producer', messages), JSONLinesSink('sink', self.filename, timeField='time', flushInterval=None, bufferSize=500))
+        collector = Collector('collector')
+        source = JSONLinesSource('source', self.filename, timeField='time', timeUnit='ns')
+        run(source, collector)
+        self.check(messages, collector.messages)
+
+    def test_csv(self):
+        messages = rows(100)
+        run(Producer('producer', messages), CSVSink('sink', self.filename, ['index', 'name', 'value'], timeField='time', bufferSize=500))
+        self.assertTrue(self.content().startswith('time,index,name,value\n'))
+        collector = Collector('collector')
+        run(CSVSource('source', self.filename, timeField='time', timeUnit='ns', chunkSize=256), collector)
+        self.check(messages, collector.messages)
+
+    def test_binary(self):
+        messages = rows(100)
+        run(Producer('producer', messages), BinarySink('sink', self.filename, bufferSize=500))
+        with open(self.filename, 'rb') as f:
+            results = list(readMessages(f))
+        # the batch is written as it is
+        self.assertEqual(51, len(results))
+        self.assertTrue(isinstance(results[-1], MessageBatch))
+        self.check(messages, results[:-1] + results[-1].toMessages())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, tempfile, shutil, os, random, logging
+from tributary.core import Actor, Engine
+from tributary.sources import FileSource, DirectorySource
+from tributary.predicates import FilePredicate, ParamContainsPredicate
+import tributary.sources
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+class Collector(Actor):
+    def __init__(self, name, field='line'):
+        super(Collector, self).__init__(name)
+        self.field = field
+        self.values = []
+
+    def process(self, message=None):
+        self.values.append(message.data.get(self.field))
+
+def run(source, children=1, field='line'):
+    collectors = [Collector('collector-%d' % index, field) for index in range(children)]
+    for collector in collectors:
+        source.add(collector)
+    engine = Engine()
+    engine.add(source)
+    engine.start()
+    return collectors[0].values if children == 1 else collectors
+
+class SourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'wb') as f:
+            f.write(content)
+        return filename
+
+class FileSourceTest(SourceTest):
+
+    def setUp(self):
+        super(FileSourceTest, self).setUp()
+        generator = random.Random(3)
+
+        # records shorter and longer than the chunks, the last one without separator
+        self.lines = ['x' * generator.choice([0, 1, 5, 100, 70000]) + str(index) for index in range(500)]
+        self.filename = self.write('lines.txt', '\n'.join(self.lines))
+        self.empty = self.write('empty.txt', '')
+
+    def test_chunk_sizes(self):
+        for chunkSize in (7, 4096, 1 << 16, 1 << 22):
+            source = FileSource('source', [self.filename, self.empty, self.filename], chunkSize=chunkSize, batchSize=33)
+            self.assertEqual(self.lines * 2, run(source))
+            self.assertEqual((self.filename, os.path.getsize(self.filename)), source.position)
+
+    def test_separator(self):
+        filename = self.write('records.txt', '|'.join(self.lines) + '|')
+        self.assertEqual(self.lines, run(FileSource('source', filename, separator='|', chunkSize=1000)))
+
+    def test_filename(self):
+        self.assertEqual([self.filename] * len(self.lines), run(FileSource('source', self.filename), field='filename'))
+
+    def test_resume(self):
+        source = FileSource('source', [self.empty, self.filename])
+        offset = len('\n'.join(self.lines[:200])) + 1
+        source.restore({'position': (self.filename, offset), 'done': False})
+        self.assertEqual(self.lines[200:], run(source))
+
+class DirectorySourceTest(SourceTest):
+
+    def setUp(self):
+        super(DirectorySourceTest, self).setUp()
+        self.files = []
+        for index in range(300):
+            path = os.path.join('dir%d' % (index % 7), 'sub%d' % (index % 3), 'file%d.%s' % (index, 'csv' if index % 2 else 'txt'))
+            self.files.append(self.write(path, ''))
+        self.files.append(self.write('top.csv', ''))
+
+    def csv(self, recursive=True):
+        return sorted(path for path in self.files if path.endswith('.csv') and (recursive or os.path.dirname(path) == self.directory))
+
+    def test_file_filters(self):
+        source = DirectorySource('source', self.directory, batchSize=16)
+        source.addFilter(FilePredicate(r'\.csv$'))
+        self.assertEqual(self.csv(), sorted(run(source, field='filename')))
+
+    def test_other_filters_after_file_filters(self):
+        source = DirectorySource('source', self.directory)
+        source.addFilter(FilePredicate(r'\.csv$')).addFilter(ParamContainsPredicate('filename', 'dir3'))
+        self.assertEqual([path for path in self.csv() if 'dir3' in path], sorted(run(source, field='filename')))
+
+    def test_not_recursive(self):
+        source = DirectorySource('source', self.directory, recursive=False)
+        source.addFilter(FilePredicate(r'\.csv$'))
+        self.assertEqual(self.csv(recursive=False), run(source, field='filename'))
+
+    def test_without_scandir(self):
+        scandir, tributary.sources.scandir = tributary.sources.scandir, None
+        try:
+            source = DirectorySource('source', self.directory, threads=2)
+            self.assertEqual(sorted(self.files), sorted(run(source, field='filename')))
+        finally:
+            tributary.sources.scandir = scandir
+
+    def test_fan_out(self):
+        source = DirectorySource('source', self.directory, batchSize=10, fanOut=True)
+        collectors = run(source, children=3, field='filename')
+        self.assertEqual(sorted(self.files), sorted(sum([collector.values for collector in collectors], [])))
+        self.assertTrue(all(collector.values for collector in collectors))
+
+    def test_not_time_sorted(self):
+        self.assertRaises(ValueError, DirectorySource, 'source', self.directory, timeSorted=True)
+
+if __name__ == '__main__':
+    unittest.main()
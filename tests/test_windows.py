@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest, random, logging
+import gevent
+from tributary.core import Actor, Engine, Message, MessageBatch
+from tributary.streams import StreamProducer, StreamCounter
+from tributary.windows import TumblingWindow, SlidingWindow, SessionWindow
+from tributary.log import set_log_level
+
+set_log_level(logging.WARNING)
+
+SECOND = 10 ** 9
+BASE = 1600000000 * SECOND
+
+def events(count=2000, seed=1):
+    """Returns sorted (ns, key, value) tuples over a minute, at microsecond precision
+    so the times of the results (in seconds) convert back exactly"""
+    generator = random.Random(seed)
+    return sorted((BASE + generator.randint(0, 60 * 10 ** 6) * 1000, generator.choice('ab'), generator.random())
+                  for index in range(count))
+
+def toNs(seconds):
+    return int(round(seconds * 10 ** 6)) * 1000
+
+class Producer(StreamProducer):
+    """Emits the events in lists of messages, or in columnar batches if `columnar`"""
+    def __init__(self, name, events, columnar=False):
+        super(Producer, self).__init__(name)
+        self.events = events
+        self.columnar = columnar
+
+    def process(self, message=None):
+        messages = []
+        for ns, key, value in self.events:
+            message = Message(key=key, value=value)
+            message.ns = ns
+            messages.append(message)
+        for start in range(0, len(messages), 100):
+            if self.columnar:
+                self.emit('data', MessageBatch.fromMessages(messages[start:start + 100]))
+            else:
+                self.emitBatch('data', messages[start:start + 100])
+
+class Collector(Actor):
+    """Keeps the parameters of the data messages inserted into its inbox, processed or not"""
+    def __init__(self, name):
+        super(Collector, self).__init__(name)
+        self.results = []
+
+    def insert(self, message):
+        if message.channel == 'data':
+            self.results.append(dict(message.data.items()))
+        super(Collector, self).insert(message)
+
+    def insertBatch(self, messages):
+        for message in messages:
+            self.insert(message)
+
+    def process(self, message=None):
+        pass
+
+def run(node, events, columnar=False):
+    collector = Collector('collector')
+    producer = Producer('producer', events, columnar)
+    producer.add(node)
+    node.add(collector)
+    engine = Engine()
+    engine.add(producer)
+    engine.start()
+    return collector.results
+
+def slidingWindows(events, size, slide):
+    """Returns the values of every (key, end) window, computed from scratch"""
+    windows = {}
+    for ns, key, value in events:
+        end = (ns // slide + 1) * slide
+        while end - size <= ns:
+            windows.setdefault((key, end), []).append(value)
+            end += slide
+    return windows
+
+def sessions(events, gap):
+    """Returns the values of every (key, start, end) session, computed from scratch"""
+    found = {}
+    for key in set(key for ns, key, value in events):
+        current = None
+        for ns, value in [(ns, value) for ns, k, value in events if k == key]:
+            if current is None or ns - current[1] > gap:
+                current = [ns, ns, []]
+                found[key, current[0]] = current
+            current[1] = ns
+            current[2].append(value)
+    return dict(((key, start, end), values) for (key, start), (start, end, values) in found.items())
+
+class WindowTest(unittest.TestCase):
+
+    def assertAggregates(self, values, result):
+        mean = sum(values) / len(values)
+        self.assertEqual(len(values), result['count'])
+        self.assertAlmostEqual(sum(values), result['sum'])
+        self.assertEqual(min(values), result['min'])
+        self.assertEqual(max(values), result['max'])
+        self.assertAlmostEqual(mean, result['mean'])
+        self.assertAlmostEqual(sum((value - mean) ** 2 for value in values) / len(values), result['variance'])
+
+    def checkSliding(self, node, size, slide, columnar=False):
+        data = events()
+        results = run(node, data, columnar)
+        expected = slidingWindows(data, size * SECOND, slide * SECOND)
+        self.assertEqual(sorted(expected), sorted((result['key'], toNs(result['end'])) for result in results))
+        for result in results:
+            self.assertAggregates(expected[result['key'], toNs(result['end'])], result)
+            self.assertAlmostEqual(size, result['end'] - result['start'])
+
+    def test_sliding(self):
+        self.checkSliding(SlidingWindow('window', 'value', 10, 3, key='key'), 10, 3)
+
+    def test_sliding_columnar(self):
+        self.checkSliding(SlidingWindow('window', 'value', 10, 3, key='key'), 10, 3, columnar=True)
+
+    def test_tumbling(self):
+        self.checkSliding(TumblingWindow('window', 'value', 5, key='key'), 5, 5)
+
+    def test_session(self):
+        data = events()
+        results = run(SessionWindow('window', 'value', 0.05, key='key'), data)
+        expected = sessions(data, SECOND // 20)
+        found = dict(((result['key'], toNs(result['start']), toNs(result['end'])), result)
+                     for result in results)
+        self.assertEqual(len(expected), len(results))
+        self.assertEqual(sorted(expected), sorted(found))
+        for key, values in expected.items():
+            self.assertAggregates(values, found[key])
+
+    def test_late_messages(self):
+        data = events(100)
+        late = [(BASE - 60 * SECOND, 'a', 1.0)]
+        window = SlidingWindow('window', 'value', 10, 3, key='key')
+        results = run(window, data + late)
+        self.assertEqual(1, window.late)
+        self.assertEqual(len(slidingWindows(data, 10 * SECOND, 3 * SECOND)), len(results))
+
+class SlowCounter(StreamCounter):
+    """Lags behind the producer, so the STOP of the engine is queued behind the one of
+    the producer"""
+    def process(self, message=None):
+        gevent.sleep(0.001)
+        super(SlowCounter, self).process(message)
+
+class SinkTest(unittest.TestCase):
+
+    def test_counter_publishes_once(self):
+        for counter in (StreamCounter('counter'), SlowCounter('counter')):
+            results = run(counter, events(250))
+            self.assertEqual([{'name': 'counter', 'count': 250}], results)
+
+if __name__ == '__main__':
+    unittest.main()
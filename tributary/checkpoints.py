@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module takes checkpoints of the state of a running engine so that a stopped
+run can be resumed from its last checkpoint instead of from the start.
+
+A checkpoint starts at the sources: each one takes its snapshot where it is covered
+by its read position (see `StreamProducer.injectBarriers`) and emits a barrier after
+the messages it emitted before. Every node takes its snapshot once the barrier has
+arrived from all of its parents and passes it on, so the snapshots of a checkpoint
+reflect the same messages. Nodes with several parents keep processing the messages
+of the parents whose barrier has arrived, these messages are processed again after a
+restart.
+
+Snapshots are pickled by the nodes, then written by the threadpool of the hub while
+the data keeps flowing. Only the states which changed since the previous checkpoint
+are written; a manifest refers to the file holding the latest state of each node.
+"""
+
+import os, json, hashlib
+import cPickle as pickle
+import gevent
+from gevent.event import Event
+from gevent.lock import Semaphore
+from .core import Actor, Message, Service
+from .events import CHECKPOINT
+
+__all__ = ['Checkpointer']
+
+MANIFEST = 'MANIFEST.json'
+
+class Checkpointer(Service):
+    """Checkpointer takes a checkpoint of the nodes of an engine every `interval` seconds
+    and keeps them in the `path` directory. It is given to the `Engine`, which restores
+    the last checkpoint before starting the nodes. States are found by the names of the
+    nodes, which must not change between runs.
+
+    A checkpoint is skipped if the previous one has not completed yet. The nodes which have
+    stopped do not take part in the following checkpoints, their last state is kept.
+    Checkpoints which do not complete before the sources stop are discarded.
+    """
+    def __init__(self, name, path, interval=60.0):
+        super(Checkpointer, self).__init__(name)
+        self.path = path
+        self.interval = interval
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # top level nodes, nodes taking part in the checkpoints and their number of parents
+        self.roots = []
+        self.actors = {}
+        self.parents = {}
+
+        # id of the last checkpoint started and of the last one written
+        self.last = 0
+        self.written = 0
+
+        # checkpoint id -> nodes taking part, barriers received by each node and pickled snapshots
+        self.expected = {}
+        self.barriers = {}
+        self.snapshots = {}
+
+        # checkpoint file holding the latest state of each node, and its digest
+        self.files = {}
+        self.digests = {}
+
+        self._writes = []
+        self._lock = Semaphore()
+        self._progress = Event()
+
+    def setup(self, nodes):
+        """Finds the nodes reachable from the top level nodes and counts their parents"""
+        self.roots = list(nodes)
+        self.actors = {}
+        self.parents = {}
+        pending = list(nodes)
+        for node in nodes:
+            self.parents[node.name] = 1
+        while pending:
+            node = pending.pop()
+            if not isinstance(node, Actor) or node.name in self.actors:
+                continue
+            self.actors[node.name] = node
+            for child in node.children:
+                self.parents[child.name] = self.parents.get(child.name, 0) + 1
+                pending.append(child)
+
+            # replicas are fed by their node (see `PartitionedStreamElement`)
+            for replica in getattr(node, 'replicas', ()):
+                self.parents[replica.name] = 1
+                pending.append(replica)
+
+    def restore(self, nodes):
+        """Restores the states of the last checkpoint, if any"""
+        self.setup(nodes)
+        manifest = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(manifest):
+            return
+        with open(manifest) as f:
+            content = json.load(f)
+        self.last = self.written = content['id']
+        self.files = dict((str(name), number) for name, number in content['states'].items())
+
+        loaded = {}
+        for name, number in self.files.items():
+            if number not in loaded:
+                with open(self.filename(number), 'rb') as f:
+                    loaded[number] = pickle.load(f)
+            blob = loaded[number][name]
+            self.digests[name] = hashlib.sha1(blob).digest()
+            if name in self.actors:
+                self.actors[name].restore(pickle.loads(blob))
+        self.log_info("Restored checkpoint %s (%s states)", self.last, len(self.files))
+
+    def filename(self, number):
+        return os.path.join(self.path, 'checkpoint-%010d.pickle' % number)
+
+    def run(self):
+        """Starts a checkpoint every `interval` seconds"""
+        while True:
+            gevent.sleep(self.interval)
+            if not self.barriers:
+                self.trigger()
+
+    def trigger(self):
+        """Starts a checkpoint by sending a barrier to the top level nodes"""
+        self.last += 1
+        self.expected[self.last] = set(name for name, actor in self.actors.items() if not actor.dead)
+        self.barriers[self.last] = {}
+        self.snapshots[self.last] = {}
+        barrier = Message.create(CHECKPOINT, id=self.last)
+        barrier.data.freeze()
+        for root in self.roots:
+            if root.name in self.expected[self.last]:
+                root.requestCheckpoint(barrier.envelope())
+        return self.last
+
+    def align(self, actor, number):
+        """Counts a barrier received by a node. Returns True once it has been received from
+        every parent of the node, which then takes its snapshot."""
+        barriers = self.barriers.get(number)
+        if barriers is None:
+            # the checkpoint was discarded
+            return False
+        count = barriers[actor.name] = barriers.get(actor.name, 0) + 1
+        return count >= self.parents.get(actor.name, 1)
+
+    def acknowledge(self, number, actor, state):
+        """Records the snapshot of a node. The checkpoint is written once every node has
+        taken its snapshot."""
+        snapshots = self.snapshots.get(number)
+        if snapshots is None or actor.name not in self.expected[number]:
+            return
+        snapshots[actor.name] = None if state is None else pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        self._progress.set()
+        self._progress = Event()
+        if len(snapshots) == len(self.expected[number]):
+            del self.expected[number]
+            del self.barriers[number]
+            del self.snapshots[number]
+            self._writes.append(gevent.spawn(self.write, number, snapshots))
+
+    def wait(self, number, actors):
+        """Waits until the given nodes have taken their snapshot for a checkpoint"""
+        while True:
+            snapshots = self.snapshots.get(number)
+            if snapshots is None or all(actor.name in snapshots for actor in actors):
+                return
+            self._progress.wait()
+
+    def write(self, number, snapshots):
+        """Writes a checkpoint in the threadpool of the hub, one at a time"""
+        with self._lock:
+            try:
+                gevent.get_hub().threadpool.apply(self._write, (number, snapshots))
+            except Exception:
+                self.log_exception("Error writing checkpoint %s" % number)
+            else:
+                self.written = number
+                self.log_debug("Checkpoint %s written", number)
+        self._writes.remove(gevent.getcurrent())
+
+    def _write(self, number, snapshots):
+        """Writes the states which changed, then the manifest, then removes the files
+        which are not referred to anymore. Runs in a native thread."""
+        changed = {}
+        for name, blob in snapshots.items():
+            digest = None if blob is None else hashlib.sha1(blob).digest()
+            if digest != self.digests.get(name):
+                changed[name] = blob
+                self.digests[name] = digest
+
+        if changed:
+            self._writeFile(self.filename(number), pickle.dumps(dict((name, blob) for name, blob in changed.items() if blob is not None), pickle.HIGHEST_PROTOCOL))
+            for name, blob in changed.items():
+                if blob is None:
+                    self.files.pop(name, None)
+                else:
+                    self.files[name] = number
+
+        # the manifest is replaced at once, a crash leaves the previous one
+        manifest = os.path.join(self.path, MANIFEST)
+        self._writeFile(manifest + '.tmp', json.dumps({'id': number, 'states': self.files}))
+        os.rename(manifest + '.tmp', manifest)
+
+        referenced = set(self.files.values())
+        for filename in os.listdir(self.path):
+            if filename.startswith('checkpoint-') and int(filename[11:21]) not in referenced:
+                os.remove(os.path.join(self.path, filename))
+
+    def _writeFile(self, filename, data):
+        with open(filename, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def join(self):
+        """Waits for the checkpoints being written"""
+        gevent.joinall(list(self._writes))
+        self.expected.clear()
+        self.barriers.clear()
+        self.snapshots.clear()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module encodes messages in a compact binary format, for transport between
+processes and hosts as well as for files. An encoded stream is a sequence of records,
+each one starting with its type and the length of its body:
+
+    S   defines an interned string (a channel or a parameter name) by its id
+    K   defines a schema: the names and the types of the parameters of a message
+    M   a message: timestamp (ns), channel id, forward flag, schema id and the values
+    B   a MessageBatch: timestamps and columns as raw arrays
+
+Strings and schemas are written once per stream and referred to by id after that, so
+an `Encoder` and a `Decoder` keep the ones they have seen. Each schema has a `struct`
+layout for the numbers, booleans, datetimes and string lengths of its messages, which
+are then packed and unpacked with a single call.
+"""
+
+import struct, datetime
+import cPickle as pickle
+from .core import Message, MessageBatch, MessageContent, EPOCH
+from .utilities import toNanoseconds
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['Encoder', 'Decoder', 'encode', 'decode', 'readMessages', 'MAGIC']
+
+# Encoded files start with this
+MAGIC = b'TRB\x01'
+
+_STRING = b'S'
+_SCHEMA = b'K'
+_MESSAGE = b'M'
+_BATCH = b'B'
+
+# type and length of the body of a record
+_RECORD = struct.Struct('!cI')
+
+# record type and length, ns, channel, forward, schema (or rows and columns)
+_HEAD = '!cIqIBI'
+_HEAD_SIZE = struct.calcsize(_HEAD)
+_BATCH_HEAD = struct.Struct('!qIBII')
+
+_ID = struct.Struct('!I')
+_INT = struct.Struct('!q')
+_FLOAT = struct.Struct('!d')
+_LENGTH = struct.Struct('!I')
+_COLUMN = struct.Struct('!IIBI')
+
+# parameter name and kind
+_FIELD = struct.Struct('!Ic')
+
+# Kinds of parameters with a fixed size in the layout of a schema: int, bool, float and
+# datetime; the lengths of str (and unicode) values, which follow the fixed part. Other
+# values ('v') are tagged and come last.
+_KINDS = {int: 'q', bool: '?', float: 'd', datetime.datetime: 't', str: 's', unicode: 'u'}
+_CODES = {'q': 'q', '?': '?', 'd': 'd', 't': 'q', 's': 'I', 'u': 'I', 'v': ''}
+
+_MIN_INT = -2 ** 63
+_MAX_INT = 2 ** 63 - 1
+
+class Encoder(object):
+    """Encoder turns messages into records. It supports None, bool, int, long, float, str,
+    unicode, datetime, list, tuple, dict and NumPy scalars; other values are pickled.
+    Datetimes are stored as UTC nanoseconds and decoded as naive UTC datetimes.
+
+    The strings interned by one call of `encode` are not written again by the next calls,
+    so the output of an encoder must be decoded in order by a single `Decoder`. With
+    `intern` set to False the output of every call can be decoded on its own."""
+    def __init__(self, intern=True):
+        super(Encoder, self).__init__()
+        self.intern = intern
+        self.strings = {}
+        self.schemas = {}
+        self.encoders = {
+            type(None): self._none,
+            bool: self._bool,
+            int: self._int,
+            long: self._int,
+            float: self._float,
+            str: self._str,
+            unicode: self._unicode,
+            datetime.datetime: self._datetime,
+            list: self._list,
+            tuple: self._tuple,
+            dict: self._dict,
+        }
+
+    def encode(self, messages):
+        """Returns the records of a list of messages (or MessageBatch instances)"""
+        if not self.intern:
+            self.strings = {}
+            self.schemas = {}
+        out = []
+        for message in messages:
+            if isinstance(message, MessageBatch):
+                self._batch(message, out)
+            else:
+                self._message(message, out)
+        return b''.join(out)
+
+    def _intern(self, value, out):
+        """Returns the id of a string, defining it first if this encoder has not seen it"""
+        sid = self.strings.get(value)
+        if sid is None:
+            sid = self.strings[value] = len(self.strings)
+            data = value.encode('utf-8') if isinstance(value, unicode) else value
+            out.append(_RECORD.pack(_STRING, _ID.size + len(data)))
+            out.append(_ID.pack(sid))
+            out.append(data)
+        return sid
+
+    def _schema(self, key, out):
+        """Defines the schema of messages with the given parameter names and kinds"""
+        names, kinds = key
+        sid = len(self.schemas)
+        body = [_ID.pack(sid), _LENGTH.pack(len(names))]
+        for name, kind in zip(names, kinds):
+            body.append(_FIELD.pack(self._intern(name, out), kind))
+        body = b''.join(body)
+        out.append(_RECORD.pack(_SCHEMA, len(body)))
+        out.append(body)
+
+        layout = struct.Struct(_HEAD + ''.join([_CODES[kind] for kind in kinds]))
+        positions = [i for i, kind in enumerate(kinds) if kind != 'v']
+        strings = [i for i, kind in enumerate(kinds) if kind in 'su']
+        datetimes = [i for i, kind in enumerate(kinds) if kind == 't']
+        others = [i for i, kind in enumerate(kinds) if kind == 'v']
+        schema = self.schemas[key] = (sid, layout, positions if others else None, strings, datetimes, others)
+        return schema
+
+    def _message(self, message, out):
+        fields = message.data.__dict__
+        names = tuple(fields)
+        values = fields.values()
+        key = (names, ''.join([_KINDS.get(type(value), 'v') for value in values]))
+        schema = self.schemas.get(key)
+        if schema is None:
+            schema = self._schema(key, out)
+        sid, layout, positions, strings, datetimes, others = schema
+
+        tail = []
+        for i in strings:
+            value = values[i]
+            if type(value) is unicode:
+                value = value.encode('utf-8')
+            values[i] = len(value)
+            tail.append(value)
+        for i in datetimes:
+            values[i] = toNanoseconds(values[i])
+        for i in others:
+            self._value(values[i], tail)
+        if positions is not None:
+            values = [values[i] for i in positions]
+
+        tail = b''.join(tail)
+        channel = self._intern(message._channel, out)
+        out.append(layout.pack(_MESSAGE, layout.size - _RECORD.size + len(tail), message._ns,
+                               channel, message._forward, sid, *values))
+        out.append(tail)
+
+    def _batch(self, batch, out):
+        columns = batch.data.__dict__.items()
+        body = [_BATCH_HEAD.pack(batch._ns, self._intern(batch._channel, out), batch._forward, len(batch), len(columns)),
+                batch.times.astype('<i8').tostring()]
+        for name, column in columns:
+            if column.dtype.hasobject:
+                data = []
+                self._list(column.tolist(), data)
+                data = b''.join(data)
+            else:
+                data = column.tostring()
+            mask = batch.present.get(name)
+            body.append(_COLUMN.pack(self._intern(name, out), self._intern(column.dtype.str, out), mask is not None, len(data)))
+            body.append(data)
+            if mask is not None:
+                body.append(mask.astype(bool).tostring())
+        body = b''.join(body)
+        out.append(_RECORD.pack(_BATCH, len(body)))
+        out.append(body)
+
+    def _value(self, value, out):
+        encoder = self.encoders.get(type(value))
+        if encoder is None:
+            self._other(value, out)
+        else:
+            encoder(value, out)
+
+    def _none(self, value, out):
+        out.append(b'N')
+
+    def _bool(self, value, out):
+        out.append(b'T' if value else b'F')
+
+    def _int(self, value, out):
+        if _MIN_INT <= value <= _MAX_INT:
+            out.append(b'i')
+            out.append(_INT.pack(value))
+        else:
+            data = str(value)
+            out.append(b'I')
+            out.append(_LENGTH.pack(len(data)))
+            out.append(data)
+
+    def _float(self, value, out):
+        out.append(b'd')
+        out.append(_FLOAT.pack(value))
+
+    def _str(self, value, out):
+        out.append(b's')
+        out.append(_LENGTH.pack(len(value)))
+        out.append(value)
+
+    def _unicode(self, value, out):
+        data = value.encode('utf-8')
+        out.append(b'u')
+        out.append(_LENGTH.pack(len(data)))
+        out.append(data)
+
+    def _datetime(self, value, out):
+        out.append(b't')
+        out.append(_INT.pack(toNanoseconds(value)))
+
+    def _list(self, value, out):
+        out.append(b'l')
+        out.append(_LENGTH.pack(len(value)))
+        for item in value:
+            self._value(item, out)
+
+    def _tuple(self, value, out):
+        out.append(b'(')
+        out.append(_LENGTH.pack(len(value)))
+        for item in value:
+            self._value(item, out)
+
+    def _dict(self, value, out):
+        out.append(b'm')
+        out.append(_LENGTH.pack(len(value)))
+        for key, item in value.iteritems():
+            self._value(key, out)
+            self._value(item, out)
+
+    def _other(self, value, out):
+        if numpy is not None and isinstance(value, numpy.generic):
+            self._value(value.item(), out)
+        else:
+            data = pickle.dumps(value, 2)
+            out.append(b'o')
+            out.append(_LENGTH.pack(len(data)))
+            out.append(data)
+
+class Decoder(object):
+    """Decoder turns records back into messages. Data can be fed in chunks of any size,
+    incomplete records are kept until the rest arrives. Unpickling runs arbitrary code, so
+    data which does not come from a trusted source should be decoded with `allowPickle`
+    set to False: pickled values then raise a ValueError."""
+    def __init__(self, allowPickle=True):
+        super(Decoder, self).__init__()
+        self.allowPickle = allowPickle
+        self.strings = []
+        self.schemas = []
+        self.buffer = b''
+
+    def feed(self, data):
+        """Decodes the complete records received so far and returns their messages"""
+        buf = self.buffer + data if self.buffer else data
+        end = len(buf)
+        offset = 0
+        messages = []
+        while offset + _RECORD.size <= end:
+            kind, length = _RECORD.unpack_from(buf, offset)
+            start = offset + _RECORD.size
+            if start + length > end:
+                break
+            if kind == _MESSAGE:
+                # the layout of a message includes the record header
+                messages.append(self._message(buf, offset))
+            elif kind == _STRING:
+                self._define(self.strings, _ID.unpack_from(buf, start)[0], buf[start + _ID.size:start + length])
+            elif kind == _SCHEMA:
+                self._schema(buf, start)
+            elif kind == _BATCH:
+                messages.append(self._batch(buf, start))
+            else:
+                raise ValueError("Unknown record type: %r" % kind)
+            offset = start + length
+        self.buffer = buf[offset:]
+        return messages
+
+    def _define(self, table, index, value):
+        if index != len(table):
+            # an encoder which does not intern starts over with every call
+            del table[index:]
+        table.append(value)
+
+    def _schema(self, buf, offset):
+        sid, count = _ID.unpack_from(buf, offset)[0], _LENGTH.unpack_from(buf, offset + _ID.size)[0]
+        offset += _ID.size + _LENGTH.size
+        names = []
+        kinds = []
+        for i in range(count):
+            name, kind = _FIELD.unpack_from(buf, offset)
+            offset += _FIELD.size
+            names.append(self.strings[name])
+            kinds.append(kind)
+
+        layout = struct.Struct(_HEAD + ''.join([_CODES[kind] for kind in kinds]))
+        fields = zip(names, kinds)
+        fixed = [name for name, kind in fields if kind != 'v']
+        strings = [(name, kind == 'u') for name, kind in fields if kind in 'su']
+        datetimes = [name for name, kind in fields if kind == 't']
+        others = [name for name, kind in fields if kind == 'v']
+        self._define(self.schemas, sid, (layout, fixed, strings, datetimes, others))
+
+    def _message(self, buf, offset):
+        sid = _ID.unpack_from(buf, offset + _HEAD_SIZE - _ID.size)[0]
+        layout, fixed, strings, datetimes, others = self.schemas[sid]
+        values = layout.unpack_from(buf, offset)
+        offset += layout.size
+        fields = dict(zip(fixed, values[6:]))
+
+        for name, unicode_ in strings:
+            length = fields[name]
+            offset += length
+            fields[name] = buf[offset - length:offset].decode('utf-8') if unicode_ else buf[offset - length:offset]
+        for name in datetimes:
+            fields[name] = EPOCH + datetime.timedelta(microseconds=fields[name] // 1000)
+        for name in others:
+            fields[name], offset = self._value(buf, offset)
+
+        message = object.__new__(Message)
+        message._ns = values[2]
+        message._datetime = None
+        message._channel = self.strings[values[3]]
+        message._forward = bool(values[4])
+        message.data = content = object.__new__(MessageContent)
+        content.__dict__ = fields
+        return message
+
+    def _batch(self, buf, offset):
+        if numpy is None:
+            raise ImportError("Decoding a MessageBatch requires numpy")
+        ns, channel, forward, rows, count = _BATCH_HEAD.unpack_from(buf, offset)
+        offset += _BATCH_HEAD.size
+        strings = self.strings
+        times = numpy.frombuffer(buf, '<i8', rows, offset).astype(numpy.int64)
+        offset += rows * 8
+        columns = {}
+        present = {}
+        for i in range(count):
+            name, dtype, masked, length = _COLUMN.unpack_from(buf, offset)
+            name, dtype = strings[name], numpy.dtype(strings[dtype])
+            offset += _COLUMN.size
+            if dtype.hasobject:
+                columns[name] = numpy.array(self._value(buf, offset)[0], dtype=object)
+            else:
+                columns[name] = numpy.frombuffer(buf, dtype, rows, offset).copy()
+            offset += length
+            if masked:
+                present[name] = numpy.frombuffer(buf, bool, rows, offset).copy()
+                offset += rows
+
+        batch = object.__new__(MessageBatch)
+        batch._ns = ns
+        batch._datetime = None
+        batch._channel = strings[channel]
+        batch._forward = bool(forward)
+        batch.data = content = object.__new__(MessageContent)
+        content.__dict__ = columns
+        batch.times = times
+        batch.present = present
+        return batch
+
+    def _value(self, buf, offset):
+        """Returns a value and the offset after it"""
+        tag = buf[offset]
+        offset += 1
+        if tag == b'i':
+            return _INT.unpack_from(buf, offset)[0], offset + 8
+        elif tag == b'd':
+            return _FLOAT.unpack_from(buf, offset)[0], offset + 8
+        elif tag == b's' or tag == b'u' or tag == b'I' or tag == b'o':
+            length = _LENGTH.unpack_from(buf, offset)[0]
+            offset += 4
+            data = buf[offset:offset + length]
+            if tag == b'u':
+                data = data.decode('utf-8')
+            elif tag == b'I':
+                data = long(data)
+            elif tag == b'o':
+                if not self.allowPickle:
+                    raise ValueError("Pickled values are not allowed")
+                data = pickle.loads(data)
+            return data, offset + length
+        elif tag == b'N':
+            return None, offset
+        elif tag == b'T':
+            return True, offset
+        elif tag == b'F':
+            return False, offset
+        elif tag == b't':
+            ns = _INT.unpack_from(buf, offset)[0]
+            return EPOCH + datetime.timedelta(microseconds=ns // 1000), offset + 8
+        elif tag == b'l' or tag == b'(':
+            count = _LENGTH.unpack_from(buf, offset)[0]
+            offset += 4
+            items = []
+            for i in range(count):
+                item, offset = self._value(buf, offset)
+                items.append(item)
+            return (tuple(items) if tag == b'(' else items), offset
+        elif tag == b'm':
+            count = _LENGTH.unpack_from(buf, offset)[0]
+            offset += 4
+            items = {}
+            for i in range(count):
+                key, offset = self._value(buf, offset)
+                items[key], offset = self._value(buf, offset)
+            return items, offset
+        raise ValueError("Unknown value type: %r" % tag)
+
+def encode(messages):
+    """Encodes a list of messages, starting with `MAGIC`"""
+    return MAGIC + Encoder().encode(messages)
+
+def decode(data):
+    """Decodes the output of `encode`"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not an encoded message stream")
+    decoder = Decoder()
+    messages = decoder.feed(data[len(MAGIC):])
+    if decoder.buffer:
+        raise ValueError("Truncated message stream")
+    return messages
+
+def readMessages(stream, chunkSize=1 << 16):
+    """Yields the messages of a file starting with `MAGIC`, reading `chunkSize` bytes at a time"""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not an encoded message stream")
+    decoder = Decoder()
+    while True:
+        chunk = stream.read(chunkSize)
+        if not chunk:
+            break
+        for message in decoder.feed(chunk):
+            yield message
+    if decoder.buffer:
+        raise ValueError("Truncated message stream")
@@ -4,14 +4,47 @@
 from tributary import *
 from . import exceptions
 from .log import *
-from .utilities import validateType
-import datetime, calendar, json
+from .utilities import validateType, validateIn, Enum
+from .metrics import MetricsRegistry
+import datetime, calendar, fnmatch, json, logging, time, threading
+from itertools import izip
 import gevent
 from gevent import Greenlet
-from gevent.queue import Queue, Empty
+from gevent.queue import Queue
 from gevent.pool import Group
+from gevent.lock import BoundedSemaphore
+from gevent.threadpool import ThreadPool
 
-__all__ = ['BasePredicate', 'BaseOverride', 'Message', 'Actor', 'Engine', 'ExecutionContext', 'Service', 'SynchronousActor']
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['BasePredicate', 'BaseOverride', 'Message', 'MessageBatch', 'Actor', 'Engine', 'ExecutionContext', 'Service', 'SynchronousActor', 'Overflow']
+
+# Placed in an inbox to wake a parked actor without delivering a message
+_WAKEUP = object()
+
+# Policies applied when a data message is inserted into a full inbox
+Overflow = Enum('BLOCK', 'DROP_OLDEST', 'DROP_NEWEST', 'ERROR')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Messages emitted by a call running in a threadpool, per thread
+_offloaded = threading.local()
+
+def _captureEmits(function, message):
+    """Calls the function and returns the (channel, message, forward) tuples it emitted."""
+    _offloaded.outputs = outputs = []
+    try:
+        function(message)
+    finally:
+        del _offloaded.outputs
+    return outputs
+
+def now():
+    """Returns the current UTC time as integer nanoseconds since the epoch."""
+    return int(time.time() * 1000000) * 1000
 
 def deser(obj):
     """Default JSON serializer."""
@@ -35,14 +68,34 @@ class BasePredicate(object):
     def apply(self, message):
         raise NotImplementedError("apply")
 
+    def mask(self, batch):
+        """Evaluates the filter over a MessageBatch and returns a boolean array with one
+        value per row. By default `apply` is called for every row."""
+        return numpy.fromiter((bool(self.apply(message)) for message in batch.toMessages()), dtype=bool, count=len(batch))
+
+    def timeRange(self):
+        """Returns the (start, stop) timestamps in nanoseconds outside of which the filter
+        rejects every message, None meaning unbounded. Sources emitting messages sorted by
+        time use it to skip ahead or stop early (see `StreamProducer.exhausted`)."""
+        return None, None
+
 
 class BaseOverride(object):
     """BaseOverride is the parent class for all overrides."""
 
     def apply(self, message):
-        """Overrides the message (or it's contents) with something else. This method should return the updated message."""
+        """Overrides the message (or it's contents) with something else. This method should return the updated message.
+        Emitted messages are shared by every receiving node, so overrides must not modify them in place. Use
+        `message.copy()` before changing the data or `message.envelope()` before changing the timestamp."""
         raise NotImplementedError("apply")
 
+    def applyBatch(self, batch):
+        """Overrides the rows of a MessageBatch and returns the resulting batch. By default
+        `apply` is called for every row, subclasses override it to work on the columns."""
+        result = MessageBatch.fromMessages([self.apply(message) for message in batch.toMessages()], batch.channel, batch.forward)
+        result.ns = batch.ns
+        return result
+
 
 class MessageContent(object):
     """docstring for MessageContent"""
@@ -99,11 +152,36 @@ class MessageContent(object):
     def __setitem__(self, name, value):
         self.set(name, value)
 
+    def copy(self):
+        """Returns a writable shallow copy of the parameters."""
+        content = MessageContent()
+        content.__dict__.update(self.__dict__)
+        return content
+
+    def freeze(self):
+        """Makes the parameters read-only. Emitted messages are frozen so they can be shared by several nodes."""
+        self.__class__ = FrozenMessageContent
+
     def __str__(self):
         keys = ', '.join([('%s=%s' % (k, v)) for k, v in self.items()])
         return 'Message(%s)' % keys.encode('string-escape')
         # return json.dumps(dict(self), default=deser)
 
+class FrozenMessageContent(MessageContent):
+    """Read-only MessageContent. Use `copy` to get a writable version."""
+
+    def __setattr__(self, name, value):
+        raise TypeError("Message data is frozen, copy the message before changing '%s'" % name)
+
+    def __delattr__(self, name):
+        raise TypeError("Message data is frozen, copy the message before deleting '%s'" % name)
+
+    def update(self, **kwargs):
+        raise TypeError("Message data is frozen, copy the message before updating it")
+
+    def freeze(self):
+        pass
+
 class Message(object):
     """
     Message is the base class for transferring data from one node to another as well 
@@ -112,10 +190,16 @@ class Message(object):
     This class has several useful features. Every Message instance has a timestamp
     associated with it. The attributes of messages can be accessed via the 
     `getitem` and the `getattr` functions.
+
+    The timestamp is stored as integer nanoseconds since the epoch (`ns`). The
+    `datetime` and `utc` views are derived from it when they are first accessed.
     """
+    __slots__ = ('_ns', '_datetime', '_channel', '_forward', 'data')
+
     def __init__(self, **kwargs):
         super(Message, self).__init__()
-        self.datetime = datetime.datetime.utcnow()
+        self._ns = now()
+        self._datetime = None
         # self._source = None
         self._channel = 'data'
         self._forward = False
@@ -131,6 +215,39 @@ class Message(object):
         msg.forward = forward
         return msg
 
+    @staticmethod
+    def fromDict(params, ns=None, channel='data', forward=False):
+        """Creates a message whose parameters are the given dictionary, which is used as is
+        instead of being copied. This is the fastest way for sources to build many messages."""
+        msg = object.__new__(Message)
+        msg._ns = now() if ns is None else ns
+        msg._datetime = None
+        msg._channel = channel
+        msg._forward = forward
+        msg.data = content = object.__new__(MessageContent)
+        content.__dict__ = params
+        return msg
+
+    @staticmethod
+    def fromRows(rows, times, channel='data', forward=False):
+        """Creates a message per dictionary of `rows`, used as is like with `fromDict`,
+        timestamped with `times` (ns). The data of the messages is frozen. Several times
+        faster than calling `fromDict` for each row."""
+        new = object.__new__
+        messages = []
+        append = messages.append
+        for params, ns in izip(rows, times):
+            msg = new(Message)
+            msg._ns = ns
+            msg._datetime = None
+            msg._channel = channel
+            msg._forward = forward
+            msg.data = content = new(MessageContent)
+            content.__dict__ = params
+            content.__class__ = FrozenMessageContent
+            append(msg)
+        return messages
+
     @property
     def channel(self):
         return self._channel
@@ -147,18 +264,48 @@ class Message(object):
     def forward(self, value):
         self._forward = value
 
+    @property
+    def ns(self):
+        """Timestamp in nanoseconds since the epoch"""
+        return self._ns
+
+    @ns.setter
+    def ns(self, value):
+        self._ns = value
+        self._datetime = None
+
+    def envelope(self, channel=None, forward=None):
+        """Returns a new message sharing the timestamp and the data of this one. This is
+        how a message is delivered to each node without copying its data."""
+        env = object.__new__(type(self))
+        env._ns = self._ns
+        env._datetime = self._datetime
+        env._channel = self._channel if channel is None else channel
+        env._forward = self._forward if forward is None else forward
+        env.data = self.data
+        return env
+
+    def copy(self):
+        """Returns a copy of this message whose data can be modified."""
+        msg = self.envelope()
+        msg.data = self.data.copy()
+        return msg
+
     @property
     def utc(self):
-        return self._utc
+        """Timestamp in seconds since the epoch"""
+        return self._ns / 1e9
 
     @property
     def datetime(self):
+        if self._datetime is None:
+            self._datetime = EPOCH + datetime.timedelta(microseconds=self._ns // 1000)
         return self._datetime
 
     @datetime.setter
     def datetime(self, value):
+        self._ns = (calendar.timegm(value.timetuple()) * 1000000 + value.microsecond) * 1000
         self._datetime = value
-        self._utc = calendar.timegm(value.timetuple()) + value.microsecond / 1000000.
 
     # @property
     # def source(self):
@@ -167,16 +314,15 @@ class Message(object):
     # def source(self, value):
     #     self._source = value    
 
-    # def __getstate__(self):
-    #     return self.__dict__
+    def __getstate__(self):
+        return (self._ns, self._channel, self._forward, self.data)
 
-    # def __setstate__(self, state):
-    #     for k, v in state.items():
-    #         self.__dict__[k] = v
-    #     return self
+    def __setstate__(self, state):
+        self._ns, self._channel, self._forward, self.data = state
+        self._datetime = None
 
     def __iter__(self):
-        return iter(self.__dict__)
+        return iter(('datetime', 'channel', 'forward', 'data'))
 
     def __repr__(self):
         return '%s(channel=%s, datetime=%s, forward=%s, data=%s)' % (
@@ -187,49 +333,236 @@ class Message(object):
             self.data)
         # return json.dumps((self.__dict__), default=deser)
 
+class MessageBatch(Message):
+    """
+    MessageBatch stores many messages column-wise. Every parameter is a NumPy array in
+    `data` and the timestamps of the rows (nanoseconds since the epoch) are stored in
+    `times`. Parameters which are missing from some rows have a boolean mask in `present`.
+
+    A MessageBatch is emitted like any other Message. Nodes which only handle single
+    messages can use `toMessages` to get the rows back.
+    """
+    __slots__ = ('times', 'present')
+
+    def __init__(self, times, present=None, **columns):
+        if numpy is None:
+            raise ImportError("MessageBatch requires numpy")
+        times = numpy.asarray(times, dtype=numpy.int64)
+        for name, column in columns.items():
+            column = numpy.asarray(column)
+            if len(column) != len(times):
+                raise ValueError("Column '%s' has %s rows; expected %s" % (name, len(column), len(times)))
+            columns[name] = column
+        super(MessageBatch, self).__init__(**columns)
+        self.times = times
+        self.present = present or {}
+
+    @staticmethod
+    def fromMessages(messages, channel='data', forward=False):
+        """Creates a batch from a list of messages. The columns are the union of their parameters."""
+        messages = list(messages)
+        contents = [vars(message.data) for message in messages]
+
+        # parameter names in the order they are first seen
+        names = []
+        for content in contents:
+            for name in content:
+                if name not in names:
+                    names.append(name)
+
+        columns = {}
+        present = {}
+        for name in names:
+            rows = [i for i, content in enumerate(contents) if name in content]
+            if len(rows) == len(contents):
+                columns[name] = numpy.asarray([content[name] for content in contents])
+            else:
+                values = numpy.asarray([contents[i][name] for i in rows])
+                column = numpy.zeros(len(contents), dtype=values.dtype)
+                column[rows] = values
+                mask = numpy.zeros(len(contents), dtype=bool)
+                mask[rows] = True
+                columns[name] = column
+                present[name] = mask
+
+        batch = MessageBatch([message.ns for message in messages], present, **columns)
+        batch.channel = channel
+        batch.forward = forward
+        return batch
+
+    def toMessages(self):
+        """Returns the rows of this batch as a list of messages."""
+        columns = [(name, column.tolist(), self.present.get(name)) for name, column in self.data.items()]
+        times = self.times.tolist()
+        messages = []
+        for i in range(len(times)):
+            message = Message()
+            message.ns = times[i]
+            message.channel = self.channel
+            message.forward = self.forward
+            for name, values, mask in columns:
+                if mask is None or mask[i]:
+                    message.data.set(name, values[i])
+            messages.append(message)
+        return messages
+
+    def presence(self, name):
+        """Returns a boolean mask of the rows which have the given parameter."""
+        if name in self.present:
+            return self.present[name]
+        elif name in self.data.keys():
+            return numpy.ones(len(self.times), dtype=bool)
+        return numpy.zeros(len(self.times), dtype=bool)
+
+    def select(self, rows):
+        """Returns a new batch with the rows selected by a boolean mask or an index array."""
+        columns = dict((name, column[rows]) for name, column in self.data.items())
+        present = dict((name, mask[rows]) for name, mask in self.present.items())
+        batch = MessageBatch(self.times[rows], present, **columns)
+        batch.ns = self.ns
+        batch.channel = self.channel
+        batch.forward = self.forward
+        return batch
+
+    def envelope(self, channel=None, forward=None):
+        env = super(MessageBatch, self).envelope(channel, forward)
+        env.times = self.times
+        env.present = self.present
+        return env
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getstate__(self):
+        return (Message.__getstate__(self), self.times, self.present)
+
+    def __setstate__(self, state):
+        Message.__setstate__(self, state[0])
+        self.times, self.present = state[1:]
+
+    def __repr__(self):
+        return '%s(channel=%s, datetime=%s, forward=%s, rows=%s, fields=%s)' % (
+            type(self).__name__,
+            self.channel,
+            self.datetime,
+            self.forward,
+            len(self),
+            ', '.join(self.data.keys()))
+
 class Actor(Greenlet):
-    """This is the base class for every node in the process tree. `Actor` manages the children of the various process nodes."""
-    def __init__(self, name):
+    """This is the base class for every node in the process tree. `Actor` manages the children of the various process nodes.
+
+    By default the inbox is unbounded. If `maxsize` is given, data messages inserted into a
+    full inbox are handled according to `overflow` (see `Overflow`); BLOCK makes the sender
+    wait cooperatively until there is room and DROP_OLDEST drops the oldest queued data.
+    Control messages (STOP, checkpoint barriers...) are never dropped nor delayed, they are
+    queued even if the inbox is full. Listeners on `events.HIGH_WATERMARK` and
+    `events.LOW_WATERMARK` are notified when the inbox depth crosses the watermarks, which
+    default to `maxsize` and half of it.
+
+    If `threads` is given, `process` runs in a threadpool of that size so blocking calls do
+    not freeze the other nodes. At most `inflight` messages (default: `threads`) are processed
+    at once and the messages emitted by `process` are sent from the hub once it returns, in
+    the order the messages were received if `ordered` is True. `offloadLifecycle` runs
+    `preProcess` and `postProcess` in the threadpool as well.
+    """
+    def __init__(self, name, maxsize=None, overflow=Overflow.BLOCK, highWatermark=None, lowWatermark=None,
+                 threads=None, inflight=None, ordered=True, offloadLifecycle=False):
         super(Actor, self).__init__()
-        self.inbox = Queue()
+        validateIn("overflow", overflow, Overflow.__dict__.values())
+        self.inbox = Queue(maxsize)
         self.name = name
         self.running = False
         self._context = None
 
+        # set with the context if it keeps metrics (see `metrics.ActorMetrics`)
+        self.metrics = None
+
+        # backpressure settings
+        self.overflow = overflow
+        if highWatermark is None and maxsize:
+            highWatermark = maxsize
+        if lowWatermark is None and highWatermark:
+            lowWatermark = highWatermark // 2
+        self.highWatermark = highWatermark
+        self.lowWatermark = lowWatermark
+        self._throttled = False
+
+        # threadpool settings
+        self.threadpool = None
+        if threads:
+            self.threadpool = ThreadPool(threads)
+            self.ordered = ordered
+            self._slots = BoundedSemaphore(inflight or threads)
+            self._offloads = []
+
+            # emits from the threadpool are collected and sent from the hub
+            self.emit = self._emitFromThread
+            self.emitBatch = self._emitBatchFromThread
+
         # stores results of node if required
         # self._state = Message()
 
-        # child nodes
+        # child nodes, and the same nodes in insertion order for fan-out
         self._children = {}
+        self._ordered = ()
 
         # listeners
         self.listeners = {}
 
+        preProcess, process, postProcess = self.preProcess, self.process, self.postProcess
+        if self.threadpool is not None:
+            process = lambda msg: self.offload(self.process, msg)
+            if offloadLifecycle:
+                preProcess = lambda msg: self.callInThread(self.preProcess, msg)
+                postProcess = lambda msg: self.callInThread(self.postProcess, msg)
+
         # all 'normal' messages go through self.process
-        self.on(events.DATA, self.process)
+        self.on(events.DATA, process)
 
         # on node start, execute preProcess
-        self.on(events.START, self.preProcess)
+        self.on(events.START, preProcess)
         self.on(events.START, lambda msg: setattr(self, 'running', True))
 
         # on node stop, set running to false, flush the queue and execute postProcess
         self.on(events.STOP, self.flush)
-        self.on(events.STOP, self.postProcess)
+        if self.threadpool is not None:
+            self.on(events.STOP, self.joinOffloads)
+        self.on(events.STOP, postProcess)
         # self.on(events.STOP, lambda msg: setattr(self, 'running', False))
         # self.on(events.STOP, self.kill)
 
         # on kill, call postProcess
-        self.on(events.KILL, self.postProcess)
+        if self.threadpool is not None:
+            self.on(events.KILL, self.joinOffloads)
+        self.on(events.KILL, postProcess)
         self.on(events.KILL, lambda msg: setattr(self, 'running', False))
+        self.on(events.KILL, self.wakeup)
         # self.on(events.KILL, self.kill)
 
+        # checkpoint barriers, see `barrier`
+        self.on(events.CHECKPOINT, self.barrier)
+
         # listen to exceptions
         self.link_exception(self.handleException)
+        self.link_exception(self._countError)
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        # the upper-cased alias is cached for logging
+        self._name = value
+        self._alias = str(value).upper()
 
     def setContext(self, ctx):
         """Sets the execution context"""
         ctx.addActor(self)
         self._context = ctx
+        if ctx.metrics is not None:
+            self.metrics = ctx.metrics.register(self)
         for child in self.children:
             child.setContext(ctx)
 
@@ -244,12 +577,16 @@ class Actor(Greenlet):
 
     def sleep(self, seconds):
         """Makes the node sleep for the given seconds"""
-        self.log_trace("Sleeping %ss..." % seconds)
+        self.log_trace("Sleeping %ss...", seconds)
         gevent.sleep(seconds)
 
     def handleException(self, exc):
         pass
 
+    def _countError(self, greenlet):
+        if self.metrics is not None:
+            self.metrics.errors += 1
+
     def stop(self):
         """Stop self and children"""
         self.handle(events.StopMessage)
@@ -272,6 +609,7 @@ class Actor(Greenlet):
     def clear(self):
         """Removes all children from this node"""
         self._children = {}
+        self._ordered = ()
 
     def __len__(self):
         return len(self._children)
@@ -283,6 +621,7 @@ class Actor(Greenlet):
             if node.name in self._children:
                 raise Exception("Same name siblings are not allowed. Child node, %s, already exists." % node.name)
             self._children[node.name] = (len(self._children), node)
+            self._ordered += (node,)
         else:
             name = str(node.name)
             num = 0
@@ -291,6 +630,7 @@ class Actor(Greenlet):
                 name = (node.name+"-"+str(num))
             node.name = name
             self._children[name] = (len(self._children), node)
+            self._ordered += (node,)
         return self
 
     def __getitem__(self, name):
@@ -307,8 +647,8 @@ class Actor(Greenlet):
 
     @property
     def children(self):
-        """Returns a list of chilren in the order they were added."""
-        return (element for index, element in sorted(self._children.values()))
+        """Returns a tuple of children in the order they were added."""
+        return self._ordered
 
     def hasChildren(self):
         """Returns True if the node has any children."""
@@ -318,7 +658,8 @@ class Actor(Greenlet):
         """Removes the child with the given name. Raises NodeDoesNotExist exception if the child does not exist."""
         if not name in self._children:
             raise exceptions.NodeDoesNotExist(name)
-        del self._children[name]
+        node = self._children.pop(name)[1]
+        self._ordered = tuple(child for child in self._ordered if child is not node)
 
     def __isub__(self, child):
         del self[child]
@@ -331,7 +672,7 @@ class Actor(Greenlet):
         return "<%s: name=\"%s\">" % (self.__class__.__name__, self.name)
 
     def __iter__(self):
-        return self.children
+        return iter(self._ordered)
 
     def preProcess(self, message=None):
         """Pre processes the data source. Can be overriden."""
@@ -341,12 +682,49 @@ class Actor(Greenlet):
         """This is the function which generates the results."""
         raise NotImplementedError("process")
 
+    def processBatch(self, messages):
+        """Processes a batch of data messages. By default every data listener is called
+        once per message. Override it to work on the whole batch at once."""
+        listeners = self.listeners.get(events.DATA, ())
+        for message in messages:
+            for function in listeners:
+                function(message)
+
     def postProcess(self, message=None):
         """Post processes the data source. Can be overriden.
         Assumes inbox has been flushed and should close any open files / connections.
         """
         pass
 
+    def snapshot(self):
+        """Returns the state of the node, which must be picklable, for a checkpoint. It is
+        taken once every message before the barrier has been processed and none after it.
+        Stateless nodes return None."""
+        return None
+
+    def restore(self, state):
+        """Restores the state returned by `snapshot` before the node starts"""
+        pass
+
+    def requestCheckpoint(self, barrier):
+        """Starts a checkpoint from this node. Sources override it to emit the barrier
+        where their snapshot covers everything they have emitted."""
+        self.insert(barrier)
+
+    def barrier(self, message):
+        """Handles the barrier of a checkpoint. Once it has arrived from every parent, the
+        snapshot is taken and the barrier is passed on to the children, after the
+        messages emitted so far."""
+        checkpointer = self._context.checkpointer if self._context is not None else None
+        if checkpointer is not None and not checkpointer.align(self, message.data.id):
+            return
+        if self.threadpool is not None:
+            self.joinOffloads()
+        if checkpointer is not None:
+            checkpointer.acknowledge(message.data.id, self, self.snapshot())
+        for child in self.children:
+            child.insert(message.envelope())
+
     def flush(self, message=None):
         """Empties the queue"""
 
@@ -360,34 +738,121 @@ class Actor(Greenlet):
         #     self.tick()
 
         self.log_debug("Flushing Queue...")
-        if not self.inbox.empty():
-            for message in self.inbox:
+        while not self.inbox.empty():
+            message = self.inbox.get_nowait()
+            if isinstance(message, list):
+                self.handleBatch(message)
+            elif message is not _WAKEUP:
                 self.handle(message)
         self.running = False
 
+        # the actor may be parked on its inbox if the stop came from another greenlet
+        self.wakeup()
+
+    def wakeup(self, message=None):
+        """Wakes the actor if it is waiting on an empty inbox so it can re-check `running`"""
+        # a non-empty inbox wakes the actor on its own
+        if self.inbox.empty():
+            self.inbox.put_nowait(_WAKEUP)
+
+    def receive(self):
+        """Blocks until the next message (or list of messages for a batch) arrives.
+        Returns None if the actor was only woken up."""
+        message = self.inbox.get()
+        if self._throttled and self.inbox.qsize() <= self.lowWatermark:
+            self._throttled = False
+            self.notify(events.LOW_WATERMARK)
+        if message is _WAKEUP:
+            return None
+        return message
+
+    def notify(self, channel):
+        """Calls the listeners of a channel with the current inbox depth. The notification is not forwarded to children."""
+        if channel in self.listeners:
+            message = Message.create(channel, name=self.name, depth=self.inbox.qsize())
+            for function in self.listeners[channel]:
+                function(message)
+
     def execute(self):
         """Executes the preProcess, process, postProcess, scatter and gather methods"""
         self.running = True
 
         self.log_info("Starting...")
+        metrics = self.metrics
         while self.running:
-            # self.log("Running...")
-            try:
-                message = self.inbox.get_nowait()
+            # parks the greenlet until a message (or a wakeup) is inserted
+            message = self.receive()
+            if metrics is not None and message is not None and (isinstance(message, list) or message.channel == events.DATA):
+                start = time.time()
+                if isinstance(message, list):
+                    self.handleBatch(message)
+                else:
+                    self.handle(message)
+                metrics.observe(time.time() - start)
+            elif isinstance(message, list):
+                self.handleBatch(message)
+            elif message is not None:
                 self.handle(message)
 
-                # yield to event loop after processing the message
-                self.tick()
-
-            except Empty:
-                # Empty signifies that the queue is empty, so yield to another node
+            # only yield if there is more work queued, an empty inbox
+            # already yields to the event loop inside `receive`
+            if not self.inbox.empty():
                 self.tick()
-                # pass
 
         # self.tick()
         # self.stop()
         self.log_info("Exiting...")
 
+    def offload(self, function, message):
+        """Calls `function(message)` in the threadpool without waiting for it. Waits
+        (cooperatively) while `inflight` calls are running."""
+        self._slots.acquire()
+        previous = self._offloads[-1] if self.ordered and self._offloads else None
+        self._offloads.append(gevent.spawn(self._offloaded, function, message, previous))
+
+    def _offloaded(self, function, message, previous):
+        try:
+            outputs = self.threadpool.apply(_captureEmits, (function, message))
+        except Exception:
+            self.log_exception("Error in '%s': %s" % (self.__class__.__name__, self.name))
+            outputs = []
+        finally:
+            self._slots.release()
+
+        # keeps the order of the messages
+        if previous is not None:
+            previous.join()
+        self._emitAll(outputs)
+        self._offloads.remove(gevent.getcurrent())
+
+    def callInThread(self, function, message=None):
+        """Calls `function(message)` in the threadpool and waits (cooperatively) for it.
+        The messages it emitted are sent once it returns."""
+        self._emitAll(self.threadpool.apply(_captureEmits, (function, message)))
+
+    def joinOffloads(self, message=None):
+        """Waits until every offloaded call has finished and its messages are sent"""
+        gevent.joinall(list(self._offloads))
+
+    def _emitAll(self, outputs):
+        for channel, message, forward in outputs:
+            if isinstance(message, list):
+                type(self).emitBatch(self, channel, message, forward)
+            else:
+                type(self).emit(self, channel, message, forward)
+
+    def _emitFromThread(self, channel, message, forward=False):
+        outputs = getattr(_offloaded, 'outputs', None)
+        if outputs is None:
+            return type(self).emit(self, channel, message, forward)
+        outputs.append((channel, message, forward))
+
+    def _emitBatchFromThread(self, channel, messages, forward=False):
+        outputs = getattr(_offloaded, 'outputs', None)
+        if outputs is None:
+            return type(self).emitBatch(self, channel, messages, forward)
+        outputs.append((channel, list(messages), forward))
+
     def _run(self):
         self.execute()
 
@@ -401,30 +866,40 @@ class Actor(Greenlet):
         any child nodes. This essentially allows a node to send special messages 
         to any nodes listening."""
         validateType('message', Message, message)
-        message.channel = channel
-        message.forward = forward
+
+        # the data is shared by every child, each one gets its own envelope
+        message.data.freeze()
         # message.source = self
-        self.log_debug("Sending message: %s on channel: %s" % (message, channel))
+        self.log_debug("Sending message: %s on channel: %s", message, channel)
+        if self.metrics is not None and channel == events.DATA:
+            self.metrics.emitted += len(message) if isinstance(message, MessageBatch) else 1
         for child in self.children:
-            child.insert(message)
+            child.insert(message.envelope(channel, forward))
             # child.inbox.put_nowait(message)
 
         # yields to event loop
         self.tick()
 
     def emitBatch(self, channel, messages, forward=False):
-        """Add all messages to child queues before yielding"""
+        """Sends several messages on the same channel. Each child receives the batch
+        as a single inbox entry and handles it with one call to `handleBatch`."""
+        debug = log_enabled(logging.DEBUG)
+        batch = []
         for message in messages:
-            message.channel = channel
-            message.forward = forward
+            validateType('message', Message, message)
+            message.data.freeze()
+            batch.append(message.envelope(channel, forward))
             # message.source = self
-            self.log_debug("Sending message: %s on channel: %s" % (message, channel))
+            if debug:
+                self.log_debug("Sending message: %s on channel: %s", message, channel)
+
+        # the batch is shared by every child
+        messages = batch
+        if self.metrics is not None and channel == events.DATA:
+            self.metrics.emitted += len(messages)
+        if messages:
             for child in self.children:
-                # child.inbox.queue.extend(messages)
-                child.insert(message)
-
-        # for child in self.children:
-            # child.inbox.queue.extend(messages)
+                child.insertBatch(messages)
 
         # yields to event loop
         self.tick()
@@ -444,12 +919,31 @@ class Actor(Greenlet):
         """Registers event listeners based on a channel.
         Note: All functions registered should have 2 arguments. The first is current node (ie. self) and the second is the data being transferred.
         """
-        self.log_trace("Registering function on channel '%s'" % (channel))
+        self.log_trace("Registering function on channel '%s'", channel)
         if channel in self.listeners:
             self.listeners[channel].append(function)
         else:
             self.listeners[channel] = [function]
 
+    def handleBatch(self, messages):
+        """Handles a batch of messages sharing one channel. Data batches are passed to
+        `processBatch` and forwarded as a batch, others are handled one by one."""
+        if not messages:
+            return
+        first = messages[0]
+        if first.channel != events.DATA:
+            for message in messages:
+                self.handle(message)
+            return
+
+        self.processBatch(messages)
+
+        # forwards the batch if allowed
+        if first.forward:
+            self.log_trace("Forwarding batch on channel: %s", first.channel)
+            for child in self.children:
+                child.insertBatch(messages)
+
     def handle(self, message):
         """Handles events received on a given channel and forwards it if allowed."""
 
@@ -464,53 +958,101 @@ class Actor(Greenlet):
 
         # forwards message if allowed
         if message.forward:
-            self.log_trace("Forwarding message on channel: %s" % message.channel)
+            self.log_trace("Forwarding message on channel: %s", message.channel)
             for child in self.children:
-                child.insert(message)
+                child.insert(message.envelope())
                 # child.handle(message)
                 # child.inbox.put_nowait(message)
             # self.tick()
 
     def insert(self, message):
-        """Inserts a new message to be handled"""
-        self.inbox.put_nowait(message)
+        """Inserts a new message to be handled. Data messages sent to a full inbox are
+        handled according to the overflow policy, control messages are always queued."""
+        self._enqueue(message, message.channel)
+
+    def insertBatch(self, messages):
+        """Inserts a batch of messages as a single inbox entry"""
+        if messages:
+            self._enqueue(messages, messages[0].channel)
+
+    def _enqueue(self, item, channel):
+        if self.inbox.full():
+            if channel != events.DATA:
+                # past `maxsize`, the actor is not waiting on a non-empty inbox
+                self.inbox.queue.append(item)
+                return
+            elif self.overflow == Overflow.DROP_NEWEST:
+                return
+            elif self.overflow == Overflow.DROP_OLDEST:
+                if not self._dropOldest():
+                    # only control messages are queued, the new data is the oldest
+                    return
+            elif self.overflow == Overflow.ERROR:
+                raise exceptions.InboxFull(self.name)
+
+        # blocks the sending greenlet while the inbox is full
+        self.inbox.put(item)
+
+        metrics = self.metrics
+        if metrics is not None and channel == events.DATA:
+            # columnar batches count their rows
+            metrics.received += len(item) if isinstance(item, (list, MessageBatch)) else 1
+            depth = self.inbox.qsize()
+            if depth > metrics.peak:
+                metrics.peak = depth
+
+        if self.highWatermark and not self._throttled and self.inbox.qsize() >= self.highWatermark:
+            self._throttled = True
+            self.notify(events.HIGH_WATERMARK)
+
+    def _dropOldest(self):
+        """Removes the oldest data entry (message or batch) of the inbox. Returns False
+        if there is none."""
+        queue = self.inbox.queue
+        for index, entry in enumerate(queue):
+            if entry is not _WAKEUP and (entry[0] if isinstance(entry, list) else entry).channel == events.DATA:
+                del queue[index]
+                return True
+        return False
 
     def log(self, msg):
         """Logging capability is baked into every Node."""
         self.log_info(msg)
 
-    def log_debug(self, msg):
+    def log_debug(self, msg, *args):
         """Logs a DEBUG message"""
-        log_debug(str(self.name).upper(), msg)
+        log_debug(self._alias, msg, *args)
 
-    def log_info(self, msg):
+    def log_info(self, msg, *args):
         """Logs an INFO message"""
-        log_info(str(self.name).upper(), msg)
+        log_info(self._alias, msg, *args)
 
-    def log_warning(self, msg):
+    def log_warning(self, msg, *args):
         """Logs a WARNING message"""
-        log_warning(str(self.name).upper(), msg)
+        log_warning(self._alias, msg, *args)
 
     def log_error(self, msg):
         """Logs an ERROR message"""
-        log_error(str(self.name).upper(), msg)
+        log_error(self._alias, msg)
 
     def log_critical(self, msg):
         """Logs a CRITICAL message"""
-        log_critical(str(self.name).upper(), msg)
+        log_critical(self._alias, msg)
 
     def log_exception(self, msg):
-        """Logs an exception"""
-        log_exception(str(self.name).upper(), msg)
+        """Logs an exception, counted in the errors of the actor"""
+        if self.metrics is not None:
+            self.metrics.errors += 1
+        log_exception(self._alias, msg)
 
-    def log_trace(self, msg):
+    def log_trace(self, msg, *args):
         """Logs low-level debug message"""
-        log_trace(str(self.name).upper(), msg)
+        log_trace(self._alias, msg, *args)
 
 
 class Engine(object):
     """docstring for Engine"""
-    def __init__(self, ctx=None):
+    def __init__(self, ctx=None, checkpointer=None):
         super(Engine, self).__init__()
         self.nodes = []
 
@@ -520,6 +1062,11 @@ class Engine(object):
         else:
             self._context = ExecutionContext()
 
+        # periodic checkpoints, restored when the engine starts
+        if checkpointer is not None:
+            self._context.checkpointer = checkpointer
+            self._context.addService(checkpointer)
+
     def _link(self, node):
         print node
 
@@ -529,21 +1076,34 @@ class Engine(object):
         node.setContext(self._context)
         self.nodes.append(node)
     
-    def start(self):
-        """Starts all the nodes"""
+    def start(self, summary=False):
+        """Starts all the nodes. If `summary` is True, the metrics of the actors are
+        logged once they have stopped, which requires a context keeping metrics (see
+        `ExecutionContext`)."""
+        if summary and self._context.metrics is None:
+            raise ValueError("A summary requires an execution context with metrics")
         start = datetime.datetime.now()
         log_script_activity("Engine", "Engine started...")
+        checkpointer = self._context.checkpointer
+        if checkpointer is not None:
+            checkpointer.restore(self.nodes)
         for node in self.nodes:
             node.start()
+        ticker = gevent.spawn(checkpointer.run) if checkpointer is not None else None
         try:
             gevent.joinall(self.nodes)
         except (KeyboardInterrupt, SystemExit):
             log_script_activity("Engine", "Ctrl-C: Stopping processes")
+        if ticker is not None:
+            ticker.kill()
 
         # signal stop
         for node in self.nodes:
             node.stop()
 
+        # waits for the descendants to handle the stop as well
+        gevent.joinall([actor for actor in self._context.actors.values() if isinstance(actor, Actor)])
+
         # joining all the services
         for name, svc in self._context.services.items():
             log_script_activity("Engine", "Joining: %s" % name)
@@ -551,32 +1111,76 @@ class Engine(object):
 
         elapsed = datetime.datetime.now() - start
         log_script_activity("Engine", "Elapsed: %s" % elapsed)
+        if summary:
+            for line in self._context.metrics.summary():
+                log_script_activity("Engine", line)
 
         # for node in self.nodes:
         #     gevent.joinall(list(node.children))
 
 class ExecutionContext(object):
-    """docstring for ExecutionContext"""
-    def __init__(self):
+    """ExecutionContext holds the actors and services of an engine. The metrics of the
+    actors are only kept if `metrics` is True (see `metrics.MetricsRegistry`)."""
+    def __init__(self, metrics=False):
         super(ExecutionContext, self).__init__()
         self.actors = {}
         self.services = {}
 
+        # metrics of the actors, if enabled
+        self.metrics = MetricsRegistry() if metrics else None
+
+        # takes the checkpoints of the engine, if enabled (see `checkpoints.Checkpointer`)
+        self.checkpointer = None
+
+        # actor names by tag, and the actors of every target resolved by `route`
+        self.tags = {}
+        self._routes = {}
+
     def addActor(self, actor):
         """Adds an actor to the execution context"""
         if isinstance(actor, (Actor, SynchronousActor)):
             self.actors[actor.name] = actor
+            self._routes.clear()
         else:
             raise Exception("Not an actor: " + str(actor))
 
+    def tag(self, actor_name, *tags):
+        """Tags an actor, messages sent to '#tag' are delivered to every actor with the tag"""
+        for tag in tags:
+            names = self.tags.setdefault(tag, [])
+            if actor_name not in names:
+                names.append(actor_name)
+        self._routes.clear()
+
+    def route(self, target):
+        """Returns the actors a message sent to `target` is delivered to. The target is
+        the name of an actor, '#' followed by a tag, or a name pattern with shell-style
+        wildcards. Routes are resolved once and cached until actors or tags are added."""
+        route = self._routes.get(target)
+        if route is None:
+            if target in self.actors:
+                route = (self.actors[target],)
+            elif target.startswith('#'):
+                route = tuple(self.actors[name] for name in self.tags.get(target[1:], ()) if name in self.actors)
+            else:
+                route = tuple(self.actors[name] for name in sorted(fnmatch.filter(self.actors.keys(), target)))
+            self._routes[target] = route
+        return route
+
     def sendTo(self, actor_name, channel, msg, forward=False):
-        """Allows sending a message to another actor which is not directly listening"""
-        if actor_name in self.actors:
-            self.actors[actor_name].handle(Message.create(channel, forward, **dict(msg.data.items())))
-            # self.actors[actor_name].emit(channel, msg, forward)
-        else:
+        """Allows sending a message to another actor which is not directly listening. The
+        message is inserted into the inbox of the actor (or of every actor matching the
+        target, see `route`) and handled by its own greenlet. The data is shared, not copied,
+        and the timestamp of the message is kept."""
+        route = self.route(actor_name)
+        if not route:
             raise Exception("Actor not found: " + actor_name)
 
+        # the data is shared by the receivers, as with `Actor.emit`
+        msg.data.freeze()
+        for actor in route:
+            actor.insert(msg.envelope(channel, forward))
+
     def addService(self, srv):
         """Adds a service to the context. Services are not actors. They are meant to be used if global state needs to be maintained."""
         if isinstance(srv, Service):
@@ -597,6 +1201,16 @@ class Service(object):
         super(Service, self).__init__()
         self.name = name
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        # the upper-cased alias is cached for logging
+        self._name = value
+        self._alias = str(value).upper()
+
     def join(self):
         pass
 
@@ -604,33 +1218,33 @@ class Service(object):
         """Logging capability is baked into every Node."""
         self.log_info(msg)
 
-    def log_debug(self, msg):
+    def log_debug(self, msg, *args):
         """Logs a DEBUG message"""
-        log_debug(str(self.name).upper(), msg)
+        log_debug(self._alias, msg, *args)
 
-    def log_info(self, msg):
+    def log_info(self, msg, *args):
         """Logs an INFO message"""
-        log_info(str(self.name).upper(), msg)
+        log_info(self._alias, msg, *args)
 
-    def log_warning(self, msg):
+    def log_warning(self, msg, *args):
         """Logs a WARNING message"""
-        log_warning(str(self.name).upper(), msg)
+        log_warning(self._alias, msg, *args)
 
     def log_error(self, msg):
         """Logs an ERROR message"""
-        log_error(str(self.name).upper(), msg)
+        log_error(self._alias, msg)
 
     def log_critical(self, msg):
         """Logs a CRITICAL message"""
-        log_critical(str(self.name).upper(), msg)
+        log_critical(self._alias, msg)
 
     def log_exception(self, msg):
         """Logs an exception"""
-        log_exception(str(self.name).upper(), msg)
+        log_exception(self._alias, msg)
 
-    def log_trace(self, msg):
+    def log_trace(self, msg, *args):
         """Logs low-level debug message"""
-        log_trace(str(self.name).upper(), msg)
+        log_trace(self._alias, msg, *args)
 
 
 class SynchronousActor(object):
@@ -644,8 +1258,9 @@ class SynchronousActor(object):
         # stores results of node if required
         # self._state = Message()
 
-        # child nodes
+        # child nodes, and the same nodes in insertion order for fan-out
         self._children = {}
+        self._ordered = ()
 
         # listeners
         self.listeners = {}
@@ -671,6 +1286,16 @@ class SynchronousActor(object):
         # listen to exceptions
         # self.link_exception(self.handleException)
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        # the upper-cased alias is cached for logging
+        self._name = value
+        self._alias = str(value).upper()
+
     def setContext(self, ctx):
         """Sets the execution context"""
         ctx.addActor(self)
@@ -708,6 +1333,7 @@ class SynchronousActor(object):
     def clear(self):
         """Removes all children from this node"""
         self._children = {}
+        self._ordered = ()
 
     def __len__(self):
         return len(self._children)
@@ -718,6 +1344,7 @@ class SynchronousActor(object):
             if node.name in self._children:
                 raise Exception("Same name siblings are not allowed. Child node, %s, already exists." % node.name)
             self._children[node.name] = (len(self._children), node)
+            self._ordered += (node,)
         else:
             name = str(node.name)
             num = 0
@@ -726,6 +1353,7 @@ class SynchronousActor(object):
                 name = (node.name+"-"+str(num))
             node.name = name
             self._children[name] = (len(self._children), node)
+            self._ordered += (node,)
         return self
 
     def __getitem__(self, name):
@@ -742,8 +1370,8 @@ class SynchronousActor(object):
 
     @property
     def children(self):
-        """Returns a list of chilren in the order they were added."""
-        return (element for index, element in sorted(self._children.values()))
+        """Returns a tuple of children in the order they were added."""
+        return self._ordered
 
     def hasChildren(self):
         """Returns True if the node has any children."""
@@ -753,7 +1381,8 @@ class SynchronousActor(object):
         """Removes the child with the given name. Raises NodeDoesNotExist exception if the child does not exist."""
         if not name in self._children:
             raise exceptions.NodeDoesNotExist(name)
-        del self._children[name]
+        node = self._children.pop(name)[1]
+        self._ordered = tuple(child for child in self._ordered if child is not node)
 
     def __isub__(self, child):
         del self[child]
@@ -766,7 +1395,7 @@ class SynchronousActor(object):
         return "<%s: name=\"%s\">" % (self.__class__.__name__, self.name)
 
     def __iter__(self):
-        return self.children
+        return iter(self._ordered)
 
     def preProcess(self, message=None):
         """Pre processes the data source. Can be overriden."""
@@ -776,6 +1405,14 @@ class SynchronousActor(object):
         """This is the function which generates the results."""
         raise NotImplementedError("process")
 
+    def processBatch(self, messages):
+        """Processes a batch of data messages. By default every data listener is called
+        once per message. Override it to work on the whole batch at once."""
+        listeners = self.listeners.get(events.DATA, ())
+        for message in messages:
+            for function in listeners:
+                function(message)
+
     def postProcess(self, message=None):
         """Post processes the data source. Can be overriden.
         Assumes inbox has been flushed and should close any open files / connections.
@@ -823,31 +1460,36 @@ class SynchronousActor(object):
         any child nodes. This essentially allows a node to send special messages 
         to any nodes listening."""
         validateType('message', Message, message)
-        message.channel = channel
-        message.forward = forward
+
+        # the data is shared by every child, each one gets its own envelope
+        message.data.freeze()
         # message.source = self
-        self.log_trace("Sending message: %s on channel: %s" % (message, channel))
+        self.log_trace("Sending message: %s on channel: %s", message, channel)
         for child in self.children:
-            child.handle(message)
+            child.handle(message.envelope(channel, forward))
             # child.inbox.put_nowait(message)
 
         # yields to event loop
         # self.tick()
 
     def emitBatch(self, channel, messages, forward=False):
-        """Add all messages to child queues before yielding"""
+        """Sends several messages on the same channel to the children as one batch."""
+        trace = log_enabled(logging.TRACE)
+        batch = []
         for message in messages:
-            message.channel = channel
-            message.forward = forward
+            validateType('message', Message, message)
+            message.data.freeze()
+            batch.append(message.envelope(channel, forward))
             # message.source = self
-            self.log_trace("Sending message: %s on channel: %s" % (message, channel))
-            for child in self.children:
-                child.handle(message)
-                # child.inbox.queue.extend(messages)
-                # child.inbox.put_nowait(message)
+            if trace:
+                self.log_trace("Sending message: %s on channel: %s", message, channel)
 
-        # for child in self.children:
-            # child.inbox.queue.extend(messages)
+        # the batch is shared by every child
+        messages = batch
+        if not messages:
+            return
+        for child in self.children:
+            child.insertBatch(messages)
 
         # yields to event loop
         # self.tick()
@@ -867,12 +1509,31 @@ class SynchronousActor(object):
         """Registers event listeners based on a channel.
         Note: All functions registered should have 2 arguments. The first is current node (ie. self) and the second is the data being transferred.
         """
-        self.log_debug("Registering function on channel '%s'" % (channel))
+        self.log_debug("Registering function on channel '%s'", channel)
         if channel in self.listeners:
             self.listeners[channel].append(function)
         else:
             self.listeners[channel] = [function]
 
+    def handleBatch(self, messages):
+        """Handles a batch of messages sharing one channel. Data batches are passed to
+        `processBatch` and forwarded as a batch, others are handled one by one."""
+        if not messages:
+            return
+        first = messages[0]
+        if first.channel != events.DATA:
+            for message in messages:
+                self.handle(message)
+            return
+
+        self.processBatch(messages)
+
+        # forwards the batch if allowed
+        if first.forward:
+            self.log_trace("Forwarding batch on channel: %s", first.channel)
+            for child in self.children:
+                child.insertBatch(messages)
+
     def handle(self, message):
         """Handles events received on a given channel and forwards it if allowed."""
 
@@ -887,9 +1548,9 @@ class SynchronousActor(object):
 
         # forwards message if allowed
         if message.forward:
-            self.log_trace("Forwarding message on channel: %s" % message.channel)
+            self.log_trace("Forwarding message on channel: %s", message.channel)
             for child in self.children:
-                child.handle(message)
+                child.handle(message.envelope())
                 # child.inbox.put_nowait(message)
             # self.tick()
 
@@ -897,36 +1558,40 @@ class SynchronousActor(object):
         """Inserts a new message to be handled"""
         self.handle(message)
 
+    def insertBatch(self, messages):
+        """Inserts a batch of messages to be handled"""
+        self.handleBatch(messages)
+
     def log(self, msg):
         """Logging capability is baked into every Node."""
         self.log_info(msg)
 
-    def log_debug(self, msg):
+    def log_debug(self, msg, *args):
         """Logs a DEBUG message"""
-        log_debug(str(self.name).upper(), msg)
+        log_debug(self._alias, msg, *args)
 
-    def log_info(self, msg):
+    def log_info(self, msg, *args):
         """Logs an INFO message"""
-        log_info(str(self.name).upper(), msg)
+        log_info(self._alias, msg, *args)
 
-    def log_warning(self, msg):
+    def log_warning(self, msg, *args):
         """Logs a WARNING message"""
-        log_warning(str(self.name).upper(), msg)
+        log_warning(self._alias, msg, *args)
 
     def log_error(self, msg):
         """Logs an ERROR message"""
-        log_error(str(self.name).upper(), msg)
+        log_error(self._alias, msg)
 
     def log_critical(self, msg):
         """Logs a CRITICAL message"""
-        log_critical(str(self.name).upper(), msg)
+        log_critical(self._alias, msg)
 
     def log_exception(self, msg):
         """Logs an exception"""
-        log_exception(str(self.name).upper(), msg)
+        log_exception(self._alias, msg)
 
-    def log_trace(self, msg):
+    def log_trace(self, msg, *args):
         """Logs low-level debug message"""
-        log_trace(str(self.name).upper(), msg)
+        log_trace(self._alias, msg, *args)
 
 from . import events
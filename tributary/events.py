@@ -4,13 +4,20 @@ from core import *
 
 __doc__ = """This submodules simply contains static messages and channel names"""
 
-__all__ = ['DATA', 'STOP', 'START', 'KILL', 'StopMessage', 'StartMessage', 'KillMessage']
+__all__ = ['DATA', 'STOP', 'START', 'KILL', 'HIGH_WATERMARK', 'LOW_WATERMARK', 'CHECKPOINT', 'StopMessage', 'StartMessage', 'KillMessage']
 
 DATA = 'data'
 STOP = 'tributary.stop'
 START = 'tributary.start'
 KILL = 'tributary.kill'
 
+# inbox depth notifications, only delivered to the actor's own listeners
+HIGH_WATERMARK = 'tributary.highwatermark'
+LOW_WATERMARK = 'tributary.lowwatermark'
+
+# checkpoint barriers, forwarded by each actor once it has taken its snapshot
+CHECKPOINT = 'tributary.checkpoint'
+
 StopMessage = Message.create(STOP, True)
 StartMessage = Message.create(START, True)
 KillMessage = Message.create(KILL, True)
@@ -1,6 +1,6 @@
 # Exceptions used in Tributary
 
-__all__ = ["NodeDoesNotExist"]
+__all__ = ["NodeDoesNotExist", "InboxFull"]
 
 class NodeDoesNotExist(Exception):
     """NodeDoesNotExist is raised when a node is queried for
@@ -11,3 +11,13 @@ class NodeDoesNotExist(Exception):
     
     def __str__(self):
         return "Node '%s' does not exist" % (self.source_name)
+
+class InboxFull(Exception):
+    """InboxFull is raised when a message is inserted into a full inbox
+    whose overflow policy is ERROR."""
+    def __init__(self, actor_name):
+        super(InboxFull, self).__init__()
+        self.actor_name = actor_name
+
+    def __str__(self):
+        return "Inbox of '%s' is full" % (self.actor_name)
@@ -5,7 +5,7 @@ __doc__ = 'Tributary is a modular data processing framework.'
 
 import logging, sys
 
-__all__ = ['log_script_activity', 'log_exception', 'log_info', 'log_debug', 'log_warning', 'log_error', 'log_critical', 'log_activity', 'log_trace']
+__all__ = ['log_script_activity', 'log_exception', 'log_info', 'log_debug', 'log_warning', 'log_error', 'log_critical', 'log_activity', 'log_trace', 'log_enabled']
 
 
 # Add trace level logging
@@ -40,6 +40,11 @@ def set_log_level(lvl):
     for handler in logger.handlers:
         handler.setLevel(lvl)
 
+def log_enabled(lvl):
+    """Returns True if messages of the given level would be logged. Use it to
+    skip building expensive log messages on hot paths."""
+    return logger.isEnabledFor(lvl)
+
 def log_activity(producer, msg, category):
     """
     Logs information regarding the specific category.
@@ -93,7 +98,7 @@ def log_script_activity(script_alias, msg):
     log_activity(script_alias, msg, 'SCRIPT')
 
 
-def log_info(script_alias, msg):
+def log_info(script_alias, msg, *args):
     """
     Logs general information.
 
@@ -101,6 +106,7 @@ def log_info(script_alias, msg):
     :type script_alias: String
     :param msg: message to be logged
     :type msg:  String
+    :param args: arguments merged into `msg` only if the level is enabled
     :rtype: None
 
     Usage::
@@ -112,11 +118,12 @@ def log_info(script_alias, msg):
         tributary.log_info(SCRIPT_NAME, "Reactor Levels Normal")
 
     """
-    logger.info("[%s] - %s", script_alias.upper(), msg)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("[%s] - %s", script_alias.upper(), msg % args if args else msg)
     # log_activity(script_alias, msg, 'INFO')
 
 
-def log_debug(script_alias, msg):
+def log_debug(script_alias, msg, *args):
     """
     Logs debug information.
 
@@ -124,6 +131,7 @@ def log_debug(script_alias, msg):
     :type script_alias: String
     :param msg: message to be logged
     :type msg:  String
+    :param args: arguments merged into `msg` only if the level is enabled
     :rtype: None
 
     Usage::
@@ -135,11 +143,12 @@ def log_debug(script_alias, msg):
         tributary.log_debug(SCRIPT_NAME, "Debug Mode Engaged")
 
     """
-    logger.debug("[%s] - %s", script_alias.upper(), msg)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] - %s", script_alias.upper(), msg % args if args else msg)
     # log_activity(script_alias, msg, 'DEBUG')
 
 
-def log_warning(script_alias, msg):
+def log_warning(script_alias, msg, *args):
     """
     Logs warning information.
 
@@ -147,6 +156,7 @@ def log_warning(script_alias, msg):
     :type script_alias: String
     :param msg: message to be logged
     :type msg:  String
+    :param args: arguments merged into `msg` only if the level is enabled
     :rtype: None
 
     Usage::
@@ -158,7 +168,8 @@ def log_warning(script_alias, msg):
         tributary.log_warning(SCRIPT_NAME, "DON'T PRESS THE RED BUTTON")
 
     """
-    logger.warning("[%s] - %s", script_alias.upper(), msg)
+    if logger.isEnabledFor(logging.WARNING):
+        logger.warning("[%s] - %s", script_alias.upper(), msg % args if args else msg)
     # log_activity(script_alias, msg, 'WARNING')
 
 
@@ -245,7 +256,7 @@ def log_exception(script_alias, msg, terminate=False):
         exit(1)
 
 
-def log_trace(script_alias, msg):
+def log_trace(script_alias, msg, *args):
     """
     Logs trace information (detailed debug).
 
@@ -253,6 +264,7 @@ def log_trace(script_alias, msg):
     :type script_alias: String
     :param msg: message to be logged
     :type msg:  String
+    :param args: arguments merged into `msg` only if the level is enabled
     :rtype: None
 
     Usage::
@@ -264,7 +276,8 @@ def log_trace(script_alias, msg):
         tributary.log_trace(SCRIPT_NAME, "DON'T PRESS THE RED BUTTON")
 
     """
-    logger.trace("[%s] - %s", script_alias.upper(), msg)
+    if logger.isEnabledFor(logging.TRACE):
+        logger.trace("[%s] - %s", script_alias.upper(), msg % args if args else msg)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module keeps the metrics of the actors of an execution context. Each actor
+updates its own `ActorMetrics` in place, with plain counters and a histogram whose
+buckets are fixed in advance, so recording costs a few attribute updates per inbox
+entry. The values are only aggregated when they are read.
+"""
+
+from collections import OrderedDict
+
+__all__ = ['ActorMetrics', 'MetricsRegistry']
+
+# Processing times are counted in buckets of powers of two microseconds: bucket `i`
+# holds the times from 2 ** (i - 1) (included) to 2 ** i microseconds, the last one
+# every time above 2 ** (BUCKETS - 2) microseconds (about 18 minutes)
+BUCKETS = 32
+
+class ActorMetrics(object):
+    """ActorMetrics holds the metrics of an actor: the data messages it received and
+    emitted, the messages rejected by each of its modifiers, the exceptions it logged,
+    the peak depth of its inbox and the time spent handling each inbox entry (a message
+    or a batch) in its greenlet."""
+    __slots__ = ('name', 'inbox', 'received', 'emitted', 'filtered', 'errors', 'peak', 'time', 'histogram')
+
+    def __init__(self, name, inbox=None):
+        super(ActorMetrics, self).__init__()
+        self.name = name
+        self.inbox = inbox
+        self.received = 0
+        self.emitted = 0
+        self.filtered = []
+        self.errors = 0
+        self.peak = 0
+        self.time = 0.0
+        self.histogram = [0] * BUCKETS
+
+    def observe(self, elapsed):
+        """Records a processing time, in seconds"""
+        self.time += elapsed
+        index = int(elapsed * 1e6).bit_length()
+        self.histogram[index if index < BUCKETS else BUCKETS - 1] += 1
+
+    @property
+    def depth(self):
+        """Current depth of the inbox"""
+        return self.inbox.qsize() if self.inbox is not None else 0
+
+    @property
+    def handled(self):
+        """Number of processing times recorded"""
+        return sum(self.histogram)
+
+    def percentile(self, fraction):
+        """Returns the upper bound (in seconds) of the bucket holding the given fraction
+        of the processing times, None if none was recorded"""
+        rank = fraction * self.handled
+        if not rank:
+            return None
+        total = 0
+        for index, count in enumerate(self.histogram):
+            total += count
+            if total >= rank:
+                return (1 << index) / 1e6
+        return (1 << (BUCKETS - 1)) / 1e6
+
+    def report(self):
+        """Returns the metrics as a dictionary"""
+        return dict(name=self.name, received=self.received, emitted=self.emitted, filtered=list(self.filtered),
+                    errors=self.errors, depth=self.depth, peak=self.peak, handled=self.handled, time=self.time,
+                    p50=self.percentile(0.5), p99=self.percentile(0.99))
+
+class MetricsRegistry(object):
+    """MetricsRegistry holds the metrics of every actor of an execution context, in the
+    order the actors were added. Actors are told apart by identity, not by name."""
+    def __init__(self):
+        super(MetricsRegistry, self).__init__()
+        self.actors = OrderedDict()
+
+    def register(self, actor):
+        """Returns the metrics of an actor, created the first time"""
+        metrics = self.actors.get(actor)
+        if metrics is None:
+            metrics = self.actors[actor] = ActorMetrics(actor.name, getattr(actor, 'inbox', None))
+        return metrics
+
+    def __getitem__(self, actor):
+        """Returns the metrics of an actor, or of the only actor with the given name"""
+        metrics = self.actors.get(actor)
+        if metrics is None:
+            named = [metrics for metrics in self.actors.values() if metrics.name == actor]
+            if len(named) != 1:
+                raise KeyError(actor)
+            metrics = named[0]
+        return metrics
+
+    def report(self):
+        """Returns the metrics of every actor as a list of dictionaries"""
+        return [metrics.report() for metrics in self.actors.values()]
+
+    def summary(self):
+        """Returns the metrics of every actor as lines of text"""
+        def duration(seconds):
+            if seconds is None:
+                return '-'
+            elif seconds < 1e-3:
+                return '%.0fus' % (seconds * 1e6)
+            elif seconds < 1:
+                return '%.1fms' % (seconds * 1e3)
+            return '%.2fs' % seconds
+
+        width = max([len(str(metrics.name)) for metrics in self.actors.values()] + [5])
+        lines = ['%-*s %10s %10s %10s %6s %7s %7s %8s %8s %9s' % (
+            width, 'actor', 'in', 'out', 'filtered', 'errors', 'depth', 'peak', 'p50', 'p99', 'time')]
+        for report in self.report():
+            lines.append('%-*s %10d %10d %10d %6d %7d %7d %8s %8s %9s' % (
+                width, report['name'], report['received'], report['emitted'], sum(report['filtered']),
+                report['errors'], report['depth'], report['peak'], duration(report['p50']),
+                duration(report['p99']), duration(report['time'])))
+        return lines
@@ -2,15 +2,28 @@
 # -*- coding: utf-8 -*-
 
 # Overrides and Bias classes for tributary
-from .core import BaseOverride
-import operators
+from .core import BaseOverride, MessageBatch
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 __all__ = ['TimeBiasOverride', 'StaticParamOverride', 'CopyParamOverride', \
-    'ParamTypeOverride', 'RenameParamOverride', 'FunctionOverride', \
+    'RenameParamOverride', 'FunctionOverride', \
     'OperatorOverride', 'MultiplyParamOverride', 'AddParamOverride', \
     'SubtractParamOverride', 'DivideParamOverride', 'StringTypeOverride', \
     'FloatTypeOverride', 'IntTypeOverride']
 
+def _replace(batch, columns, present, times=None):
+    """Returns a batch with the given columns and presence masks, the other attributes are the ones of `batch`"""
+    result = MessageBatch(batch.times if times is None else times, present, **columns)
+    result.ns = batch.ns
+    result.channel = batch.channel
+    result.forward = batch.forward
+    return result
+
 class TimeBiasOverride(BaseOverride):
     """Adds a time bias to messages. Bias should be a timedelta."""
     def __init__(self, bias):
@@ -18,9 +31,16 @@ class TimeBiasOverride(BaseOverride):
         self.bias = bias
 
     def apply(self, msg):
+        # the data is shared, only the envelope is replaced
+        msg = msg.envelope()
         msg.datetime = msg.datetime + self.bias
         return msg
 
+    def applyBatch(self, batch):
+        # like `apply`, the timestamps are rounded down to the microsecond
+        bias = ((self.bias.days * 86400 + self.bias.seconds) * 1000000 + self.bias.microseconds) * 1000
+        return _replace(batch, dict(batch.data.items()), dict(batch.present), batch.times // 1000 * 1000 + bias)
+
 class StaticParamOverride(BaseOverride):
     """Adds a static reference position to every message"""
     def __init__(self, paramName, value):
@@ -29,21 +49,45 @@ class StaticParamOverride(BaseOverride):
         self.value = value
 
     def apply(self, message):
-        message.setParam(self.paramName, self.value)
+        message = message.copy()
+        message.data.set(self.paramName, self.value)
         return message
 
+    def applyBatch(self, batch):
+        columns = dict(batch.data.items())
+        columns[self.paramName] = numpy.array([self.value] * len(batch))
+        present = dict(batch.present)
+        present.pop(self.paramName, None)
+        return _replace(batch, columns, present)
+
 class CopyParamOverride(BaseOverride):
     """docstring for ParamTypeOverride"""
     def __init__(self, param, new_param):
-        super(CopyTimeOverride, self).__init__()
+        super(CopyParamOverride, self).__init__()
         self.param = param
-        self.newparam = newparam
+        self.newparam = new_param
 
     def apply(self, message):
-        if self.param in message:
-            message[self.newparam] = message[self.param]
+        if self.param in message.data:
+            message = message.copy()
+            message.data[self.newparam] = message.data[self.param]
         return message
 
+    def applyBatch(self, batch):
+        if self.param not in batch.data:
+            return batch
+        columns = dict(batch.data.items())
+        present = dict(batch.present)
+        if self.param in present:
+            if self.newparam in columns:
+                # the rows without the copied parameter keep their value
+                return super(CopyParamOverride, self).applyBatch(batch)
+            present[self.newparam] = present[self.param]
+        else:
+            present.pop(self.newparam, None)
+        columns[self.newparam] = columns[self.param]
+        return _replace(batch, columns, present)
+
 
 class RenameParamOverride(BaseOverride):
     """docstring for RenameParamOverride"""
@@ -53,11 +97,26 @@ class RenameParamOverride(BaseOverride):
         self.repl = repl
 
     def apply(self, message):
-        if self.param in message:
-            message[self.repl] = message[self.param]
-            del message[self.param]
+        if self.param in message.data:
+            message = message.copy()
+            message.data[self.repl] = message.data[self.param]
+            del message.data[self.param]
         return message
 
+    def applyBatch(self, batch):
+        if self.param not in batch.data:
+            return batch
+        columns = dict(batch.data.items())
+        present = dict(batch.present)
+        if self.param in present and self.repl in columns:
+            # the rows without the renamed parameter keep their value
+            return super(RenameParamOverride, self).applyBatch(batch)
+        columns[self.repl] = columns.pop(self.param)
+        present.pop(self.repl, None)
+        if self.param in present:
+            present[self.repl] = present.pop(self.param)
+        return _replace(batch, columns, present)
+
 class FunctionOverride(BaseOverride):
     """docstring for FunctionOverride"""
     def __init__(self, param, fn):
@@ -66,10 +125,28 @@ class FunctionOverride(BaseOverride):
         self.fn = fn
 
     def apply(self, message):
-        if self.param in message:
-            message[self.param] = self.fn(message[self.param])
+        if self.param in message.data:
+            message = message.copy()
+            message.data[self.param] = self.fn(message.data[self.param])
         return message
 
+    def applyBatch(self, batch):
+        # the function is called on the values of the rows having the parameter
+        if self.param not in batch.data:
+            return batch
+        values = batch.data[self.param].tolist()
+        mask = batch.present.get(self.param)
+        if mask is None:
+            column = numpy.asarray([self.fn(value) for value in values])
+        else:
+            rows = numpy.flatnonzero(mask)
+            results = numpy.asarray([self.fn(values[row]) for row in rows])
+            column = numpy.zeros(len(values), dtype=results.dtype)
+            column[rows] = results
+        columns = dict(batch.data.items())
+        columns[self.param] = column
+        return _replace(batch, columns, dict(batch.present))
+
 class StringTypeOverride(FunctionOverride):
     """docstring for StringTypeOverride"""
     def __init__(self, param):
@@ -94,27 +171,41 @@ class OperatorOverride(BaseOverride):
         self.op = op
     
     def apply(self, message):
-        if self.param in message:
-            message[self.param] = self.op(message[self.param], self.mod)
+        if self.param in message.data:
+            message = message.copy()
+            message.data[self.param] = self.op(message.data[self.param], self.mod)
         return message
 
+    def applyBatch(self, batch):
+        if self.param not in batch.data:
+            return batch
+        column = batch.data[self.param]
+        if column.dtype.kind not in 'biuf':
+            return super(OperatorOverride, self).applyBatch(batch)
+        if self.param in batch.present:
+            # the rows without the parameter are not computed
+            column = numpy.where(batch.present[self.param], column, 1)
+        columns = dict(batch.data.items())
+        columns[self.param] = self.op(column, self.mod)
+        return _replace(batch, columns, dict(batch.present))
+
 class MultiplyParamOverride(OperatorOverride):
     """docstring for ParamTypeOverride"""
     def __init__(self, param, num):
-        super(MultiplyParamOverride, self).__init__(param, num, operators.mul)
+        super(MultiplyParamOverride, self).__init__(param, num, operator.mul)
 
 class AddParamOverride(OperatorOverride):
     """docstring for ParamTypeOverride"""
     def __init__(self, param, num):
-        super(AddParamOverride, self).__init__(param, num, operators.add)
+        super(AddParamOverride, self).__init__(param, num, operator.add)
 
 class SubtractParamOverride(OperatorOverride):
     """docstring for ParamTypeOverride"""
     def __init__(self, param, num):
-        super(SubtractParamOverride, self).__init__(param, num, operators.sub)
+        super(SubtractParamOverride, self).__init__(param, num, operator.sub)
 
 class DivideParamOverride(OperatorOverride):
     """docstring for ParamTypeOverride"""
     def __init__(self, param, num):
-        super(DivideParamOverride, self).__init__(param, num, operators.div)
+        super(DivideParamOverride, self).__init__(param, num, operator.div)
 
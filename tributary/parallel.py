@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module runs the work of stream nodes outside of the gevent hub, so one
+CPU heavy node does not hold back every other node of the engine.
+"""
+
+import multiprocessing
+from multiprocessing.util import Finalize
+import gevent
+from gevent.event import AsyncResult
+from gevent.lock import BoundedSemaphore
+from .core import MessageBatch
+from .events import StopMessage
+from .streams import StreamElement
+from .utilities import validateType
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['ProcessPoolElement', 'PartitionedStreamElement']
+
+# The node instance of a worker process, created by `_initWorker`
+_worker = None
+
+def _initWorker(factory, args, kwargs):
+    """Creates the node of a worker process. Messages emitted by the node are
+    collected and returned to the parent process."""
+    global _worker
+    _worker = factory(*args, **kwargs)
+    outputs = []
+
+    def emit(channel, message, forward=False):
+        outputs.append((channel, message, forward))
+
+    def emitBatch(channel, messages, forward=False):
+        outputs.extend([(channel, message, forward) for message in messages])
+
+    _worker.emit = emit
+    _worker.emitBatch = emitBatch
+    _worker.outputs = outputs
+    _worker.preProcess(None)
+
+    # runs when the pool is closed and the worker exits
+    Finalize(_worker, _worker.postProcess, exitpriority=10)
+
+def _processBatch(messages):
+    """Processes a batch in a worker process and returns what the node emitted."""
+    del _worker.outputs[:]
+    if isinstance(_worker, StreamElement):
+        messages = [m for m in (_worker.modify(m) for m in messages) if m is not None]
+    _worker.processBatch(messages)
+    return list(_worker.outputs)
+
+class _Waiter(object):
+    """Receives the result of a batch from the result thread of a pool. The thread wakes
+    the hub up through an async watcher, so no thread of the hub's threadpool is taken
+    while the batch is processed."""
+    def __init__(self):
+        self.value = None
+        self.event = AsyncResult()
+        self.watcher = gevent.get_hub().loop.async_()
+        self.watcher.start(self.wake)
+
+    def set(self, value):
+        """Called by the result thread of the pool"""
+        self.value = value
+        self.watcher.send()
+
+    def wake(self):
+        self.event.set(self.value)
+
+    def get(self, result, interval=0.05):
+        """Returns the outputs of the batch, raises the error of a batch which failed"""
+        try:
+            while True:
+                try:
+                    return self.event.get(timeout=interval)
+                except gevent.Timeout:
+                    # the pool only calls back on success
+                    if result.ready() and not result.successful():
+                        result.get()
+        finally:
+            self.watcher.close()
+
+class ProcessPoolElement(StreamElement):
+    """ProcessPoolElement runs another node in a pool of worker processes. Each worker
+    creates its own instance with `factory(*args, **kwargs)` and calls its `preProcess`
+    once, `processBatch` for every batch and `postProcess` when the pool is closed.
+
+    Data messages are shipped to the workers in batches of `batchSize` messages and
+    whatever the worker nodes emit is emitted to the children of this node. If `ordered`
+    is True the results are emitted in the order the batches were sent. At most `inflight`
+    batches are processed at the same time, further messages wait in the inbox. Waiting
+    for a batch does not take a thread of the hub's threadpool, which is left to the
+    sinks and the checkpoints. Pending results are emitted before STOP is forwarded to
+    the children.
+
+    Messages and the emitted results must be picklable. The worker nodes do not have
+    children of their own. Their state is not part of the checkpoints, a checkpoint only
+    waits for the results of the messages received before its barrier.
+    """
+    def __init__(self, name, factory, args=(), kwargs=None, processes=None, batchSize=100, ordered=True, inflight=None, **options):
+        super(ProcessPoolElement, self).__init__(name, **options)
+        validateType("batchSize", int, batchSize)
+        self.factory = factory
+        self.factoryArgs = args
+        self.factoryKwargs = kwargs or {}
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batchSize = batchSize
+        self.ordered = ordered
+        self.pool = None
+
+        # messages waiting to be shipped and the greenlets waiting on results
+        self.pending = []
+        self.collectors = []
+        self.slots = BoundedSemaphore(inflight or self.processes * 2)
+
+    def preProcess(self, message=None):
+        """Starts the worker processes"""
+        self.pool = multiprocessing.Pool(self.processes, _initWorker, (self.factory, self.factoryArgs, self.factoryKwargs))
+
+    def process(self, message=None):
+        self.pending.append(message)
+        if len(self.pending) >= self.batchSize:
+            self.submit()
+
+    def processBatch(self, messages):
+        self.pending.extend(messages)
+        while len(self.pending) >= self.batchSize:
+            self.submit()
+
+    def submit(self):
+        """Ships the pending messages to the pool"""
+        batch, self.pending = self.pending[:self.batchSize], self.pending[self.batchSize:]
+        if not batch:
+            return
+
+        # waits (cooperatively) while too many batches are being processed
+        self.slots.acquire()
+        waiter = _Waiter()
+        result = self.pool.apply_async(_processBatch, (batch,), callback=waiter.set)
+        previous = self.collectors[-1] if self.ordered and self.collectors else None
+        self.collectors.append(gevent.spawn(self.collect, waiter, result, previous))
+
+    def collect(self, waiter, result, previous=None):
+        """Waits for the result of a batch and emits it"""
+        try:
+            outputs = waiter.get(result)
+        except Exception:
+            self.log_exception("Error in worker process")
+            outputs = []
+        finally:
+            self.slots.release()
+
+        # keeps the order of the batches
+        if previous is not None:
+            previous.join()
+
+        for channel, message, forward in outputs:
+            self.emit(channel, message, forward)
+        self.collectors.remove(gevent.getcurrent())
+
+    def snapshot(self):
+        """Emits the results of every message received so far"""
+        while self.pending:
+            self.submit()
+        gevent.joinall(list(self.collectors))
+        return None
+
+    def postProcess(self, message=None):
+        """Ships the remaining messages, emits all the results and closes the pool"""
+        if self.pool is None:
+            return
+        while self.pending:
+            self.submit()
+        gevent.joinall(list(self.collectors))
+
+        pool, self.pool = self.pool, None
+        pool.close()
+        gevent.get_hub().threadpool.apply(pool.join)
+
+class PartitionedStreamElement(StreamElement):
+    """PartitionedStreamElement spreads the incoming messages over `partitions` replicas
+    of a node. A message goes to the replica selected by the hash of its `key` parameter,
+    so every message with the same key is handled by the same replica. Messages without
+    the parameter go to the first replica.
+
+    The replicas are created with `factory(replicaName, *args, **kwargs)`. If `processes`
+    is True each replica runs in its own worker process (see `ProcessPoolElement`),
+    `poolOptions` are passed to those. The filters of this node are applied once, before
+    routing. Whatever the replicas emit is emitted to the children of this node and STOP
+    is only forwarded once every replica has stopped.
+    """
+    def __init__(self, name, factory, key, partitions, args=(), kwargs=None, processes=False, poolOptions=None, **options):
+        super(PartitionedStreamElement, self).__init__(name, **options)
+        validateType("partitions", int, partitions)
+        self.key = key
+        self.replicas = []
+        for index in range(partitions):
+            replicaName = '%s-%s' % (name, index)
+            if processes:
+                replica = ProcessPoolElement(replicaName, factory, (replicaName,) + tuple(args), kwargs,
+                                             processes=1, **(poolOptions or {}))
+            else:
+                replica = factory(replicaName, *args, **(kwargs or {}))
+
+            # the replicas have no children, their output is merged here
+            replica.emit = self.emit
+            replica.emitBatch = self.emitBatch
+            self.replicas.append(replica)
+
+    def setContext(self, ctx):
+        """Sets the execution context of this node and its replicas"""
+        super(PartitionedStreamElement, self).setContext(ctx)
+        for replica in self.replicas:
+            replica.setContext(ctx)
+
+    def partition(self, message):
+        """Returns the index of the replica handling the message"""
+        if self.key in message.data:
+            return hash(message.data.get(self.key)) % len(self.replicas)
+        return 0
+
+    def preProcess(self, message=None):
+        """Starts the replicas"""
+        for replica in self.replicas:
+            replica.start()
+
+    def process(self, message=None):
+        if isinstance(message, MessageBatch):
+            self.processBatch([message])
+        else:
+            self.replicas[self.partition(message)].insert(message)
+
+    def processBatch(self, messages):
+        """Routes the messages, each replica receives its share as one batch"""
+        count = len(self.replicas)
+        shares = [[] for replica in self.replicas]
+        for message in messages:
+            if isinstance(message, MessageBatch):
+                # columnar batches are split by row
+                if self.key in message.data.keys():
+                    rows = numpy.array([hash(value) % count for value in message.data.get(self.key).tolist()], dtype=int)
+                    rows[~message.presence(self.key)] = 0
+                    for index in range(count):
+                        selected = message.select(rows == index)
+                        if len(selected):
+                            shares[index].append(selected)
+                else:
+                    shares[0].append(message)
+            else:
+                shares[self.partition(message)].append(message)
+
+        for replica, share in zip(self.replicas, shares):
+            if share:
+                replica.insertBatch(share)
+
+    def barrier(self, message):
+        """Passes the barrier of a checkpoint to the replicas and waits for their snapshots,
+        so their output before the barrier is emitted before it is forwarded"""
+        checkpointer = self.getContext().checkpointer
+        if checkpointer is not None:
+            if not checkpointer.align(self, message.data.id):
+                return
+            for replica in self.replicas:
+                replica.insert(message.envelope())
+            checkpointer.wait(message.data.id, self.replicas)
+            checkpointer.acknowledge(message.data.id, self, self.snapshot())
+        for child in self.children:
+            child.insert(message.envelope())
+
+    def postProcess(self, message=None):
+        """Stops the replicas and waits for them, so their output is emitted before STOP
+        (or KILL) is forwarded"""
+        if message is None:
+            message = StopMessage
+        for replica in self.replicas:
+            replica.insert(message.envelope(forward=False))
+        gevent.joinall(self.replicas)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module contains file sources parsing CSV and JSON-lines files. Both read
+their files in large chunks (see `FileSource`) and parse a whole chunk at once: the
+CSV rows are converted column by column and the JSON objects of a chunk are decoded
+with a single call. The timestamps of a chunk are parsed at once as well.
+
+Messages are emitted one per row, or as a `MessageBatch` per chunk with typed NumPy
+columns if `columnar` is True.
+"""
+
+import bisect, csv, json, datetime, cStringIO
+from itertools import izip
+from .core import MessageBatch, now
+from .events import DATA
+from .sources import FileSource
+from .utilities import toNanoseconds
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['CSVSource', 'JSONLinesSource']
+
+# Multipliers to nanoseconds of the numeric time units
+_UNITS = {'s': 1000000000, 'ms': 1000000, 'us': 1000, 'ns': 1}
+
+# The integer value of NumPy's "not a time"
+_NAT = -2 ** 63
+
+# The functions building the rows of the columns, by column names (see `_rows`)
+_builders = {}
+
+def _missing(value):
+    return value is None or value == ''
+
+def _convert(kind, values):
+    """Converts a column. Returns the converted values, missing values being None, and
+    the indexes of the values which can not be converted."""
+    if kind is str or kind is None:
+        return list(values), []
+    try:
+        return map(kind, values), []
+    except (TypeError, ValueError):
+        converted, invalid = [], []
+        for index, value in enumerate(values):
+            if _missing(value):
+                converted.append(None)
+                continue
+            try:
+                converted.append(kind(value))
+            except (TypeError, ValueError):
+                converted.append(None)
+                invalid.append(index)
+        return converted, invalid
+
+def _array(kind, values):
+    """Returns a converted column as a NumPy array. Numeric columns with missing values
+    are float columns with NaN."""
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return values
+    if kind is int or kind is float:
+        if kind is float or None in values:
+            return numpy.array([numpy.nan if value is None else value for value in values], dtype=numpy.float64)
+        return numpy.array(values, dtype=numpy.int64)
+    return numpy.array(values)
+
+def _take(values, indexes):
+    """Returns the values of a column at the given indexes"""
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return values[indexes]
+    return [values[index] for index in indexes]
+
+def _rows(names, columns):
+    """Returns the rows of the columns as dictionaries. The function building them with a
+    dictionary display is generated once per list of names, it is several times faster
+    than calling `dict` on every row."""
+    key = tuple(names)
+    build = _builders.get(key)
+    if build is None:
+        values = ['v%d' % index for index in range(len(names))]
+        source = 'def build(columns):\n    return [{%s} for %s, in izip(*columns)]\n' % (
+            ', '.join(['%r: %s' % (name, value) for name, value in zip(names, values)]), ', '.join(values))
+        namespace = {'izip': izip}
+        exec(compile(source, '<rows>', 'exec'), namespace)
+        build = _builders[key] = namespace['build']
+    return build(columns)
+
+def _infer(values):
+    """Returns int, float or str, the narrowest type every value converts to. Missing
+    values are ignored."""
+    values = [value for value in values if not _missing(value)]
+    for kind in (int, float):
+        try:
+            map(kind, values)
+            return kind
+        except (TypeError, ValueError):
+            pass
+    return str
+
+def _numbers(values, unit):
+    """Converts a column of numeric timestamps with NumPy, None if some values can not be"""
+    array = numpy.array(values)
+    if array.dtype.kind != 'f':
+        try:
+            return (array.astype(numpy.int64) * _UNITS[unit]).tolist()
+        except (TypeError, ValueError, OverflowError):
+            pass
+    try:
+        floats = array.astype(numpy.float64)
+    except (TypeError, ValueError):
+        return None
+    if not numpy.isfinite(floats).all():
+        return None
+    # fractions are rounded to the microsecond to keep the float precision
+    scale = _UNITS[unit] // 1000
+    if scale:
+        return (numpy.round(floats * scale).astype(numpy.int64) * 1000).tolist()
+    return numpy.round(floats).astype(numpy.int64).tolist()
+
+def _number(value, unit):
+    """Converts a numeric timestamp, None if it can not be"""
+    if not isinstance(value, float):
+        try:
+            return int(value) * _UNITS[unit]
+        except (TypeError, ValueError):
+            pass
+    scale = _UNITS[unit] // 1000
+    try:
+        if scale:
+            return int(round(float(value) * scale)) * 1000
+        return int(round(float(value)))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def _datetime(value):
+    """Converts an ISO 8601 timestamp with NumPy, None if it can not be"""
+    try:
+        ns = int(numpy.datetime64(value, 'ns').astype(numpy.int64))
+    except (TypeError, ValueError):
+        return None
+    return None if ns == _NAT else ns
+
+def parseTimes(values, unit):
+    """Returns the timestamps of a column as a list of integer nanoseconds since the
+    epoch, None for the values which can not be parsed. `unit` is 's', 'ms', 'us' or 'ns'
+    for numbers, 'iso' for ISO 8601 strings or a `strptime` format. Numbers and ISO
+    strings are converted with NumPy at once, value by value if some are invalid."""
+    if unit in _UNITS:
+        times = _numbers(values, unit) if numpy is not None else None
+        if times is None:
+            times = [_number(value, unit) for value in values]
+        return times
+    elif unit == 'iso' and numpy is not None:
+        try:
+            times = numpy.array(values, dtype='datetime64[ns]').astype(numpy.int64)
+            if not (times == _NAT).any():
+                return times.tolist()
+        except (TypeError, ValueError):
+            pass
+        return [_datetime(value) for value in values]
+    elif unit == 'iso':
+        unit = '%Y-%m-%dT%H:%M:%S'
+
+    # repeated values are parsed once
+    parsed = {}
+    times = []
+    for value in values:
+        if value in parsed:
+            ns = parsed[value]
+        else:
+            try:
+                ns = toNanoseconds(datetime.datetime.strptime(value, unit))
+            except (TypeError, ValueError):
+                ns = None
+            parsed[value] = ns
+        times.append(ns)
+    return times
+
+class ParserSource(FileSource):
+    """ParserSource is the base class of the parsing sources. `schema` is a list of
+    (name, type) tuples, types being int, float or str (None keeps the parsed value).
+    If `timeField` is given, its values are the timestamps of the messages, parsed
+    according to `timeUnit` (see `parseTimes`), otherwise the messages are timestamped
+    when the chunk is parsed.
+
+    With `timeSorted` the reading of each file starts at the chunk holding the start of
+    the time filters (see `FileSource.seek`), the rows before it are skipped and the
+    reading stops at the first row past their end.
+
+    Rows which can not be parsed, or whose timestamp or values can not be converted, are
+    counted in `errors` and skipped. Missing values are None. An inferred int column is
+    widened to float when later rows hold floats.
+    """
+    def __init__(self, name, filenames, schema=None, timeField=None, timeUnit='s', columnar=False, **kwargs):
+        super(ParserSource, self).__init__(name, filenames, **kwargs)
+        if columnar and numpy is None:
+            raise ImportError("Columnar parsing requires numpy")
+        self.schema = list(schema) if schema else None
+        self.timeField = timeField
+        self.timeUnit = timeUnit
+        self.columnar = columnar
+        self.inferred = False
+        self.errors = 0
+
+    def parseChunk(self, filename, chunk):
+        """Returns the column names and the columns of a chunk, plus the rows as
+        dictionaries if the parser has them (None otherwise)"""
+        raise NotImplementedError("parseChunk")
+
+    def processChunk(self, filename, chunk):
+        names, columns, rows = self.parseChunk(filename, chunk)
+        count = len(rows) if rows is not None else len(columns[0]) if columns else 0
+        if not count:
+            return
+
+        invalid = set()
+        parsed = columns
+        if self.columnar or rows is None:
+            kinds, columns, errors = self.convert(names, columns)
+            invalid.update(errors)
+        elif self.schema is not None:
+            # the values of the rows are converted to the types of the schema as well
+            kinds, columns, errors = self.convert(names, columns)
+            invalid.update(errors)
+            for name, kind, original, column in zip(names, kinds, parsed, columns):
+                # str columns are kept as they are, like the values which already have their type
+                if kind is None or kind is str or set(map(type, original)) == set([kind]):
+                    continue
+                for row, value in zip(rows, column):
+                    if name in row:
+                        row[name] = value
+
+        if self.timeField in names:
+            # numeric timestamps are read from the converted column, which is faster
+            index = names.index(self.timeField)
+            times = parseTimes(columns[index] if self.timeUnit in _UNITS else parsed[index], self.timeUnit)
+            if None in times:
+                invalid.update(index for index, ns in enumerate(times) if ns is None)
+        else:
+            times = [now()] * count
+
+        if invalid:
+            # the rows with invalid values are skipped
+            self.errors += len(invalid)
+            valid = [index for index in range(count) if index not in invalid]
+            times = [times[index] for index in valid]
+            columns = [_take(column, valid) for column in columns]
+            if rows is not None:
+                rows = [rows[index] for index in valid]
+            count = len(valid)
+
+        first, last = self.timeSlice(times)
+        if first or last < count:
+            times = times[first:last]
+            columns = [column[first:last] for column in columns]
+            if rows is not None:
+                rows = rows[first:last]
+        if not times:
+            return
+
+        if self.columnar:
+            self.emit(DATA, MessageBatch(times, **dict((name, _array(kind, column)) for name, kind, column in zip(names, kinds, columns))))
+            return
+
+        if rows is None:
+            rows = _rows(names, columns)
+        size = self.batchSize
+        for start in range(0, len(rows), size):
+            self.emitRows(rows[start:start + size], times[start:start + size])
+
+    def timeSlice(self, times):
+        """Returns the first and last (excluded) rows of a chunk within the time range of the
+        filters if the source is time sorted. Stops the reading if rows are past the range."""
+        first, last = 0, len(times)
+        if self.timeSorted:
+            start, stop = self.startTime(), self.stopTime()
+            if start is not None:
+                first = bisect.bisect_left(times, start)
+            if stop is not None:
+                last = max(first, bisect.bisect_left(times, stop))
+                if last < len(times):
+                    self.done = True
+        return first, last
+
+    def parseTime(self, value):
+        """Returns the timestamp of a value of the time field, None if it can not be parsed"""
+        return parseTimes([value], self.timeUnit)[0]
+
+    def kinds(self, names, columns):
+        """Returns the types of the columns, from the schema or inferred from the first chunk"""
+        if self.schema is None:
+            self.schema = [(name, _infer(column[:100])) for name, column in zip(names, columns)]
+            self.inferred = True
+        types = dict(self.schema)
+        return [types.get(name) for name in names]
+
+    def convert(self, names, columns):
+        """Converts the columns to the types of the schema. Returns the types, the converted
+        columns (NumPy arrays for numeric columnar ones) and the indexes of the rows with
+        values which can not be converted. An inferred int column holding floats is widened
+        to float."""
+        kinds = self.kinds(names, columns)
+        converted, invalid = [], set()
+        for index, (name, kind, column) in enumerate(zip(names, kinds, columns)):
+            if self.columnar and (kind is int or kind is float):
+                try:
+                    converted.append(numpy.array(column).astype(numpy.int64 if kind is int else numpy.float64))
+                    continue
+                except (TypeError, ValueError):
+                    pass
+            values, errors = _convert(kind, column)
+            if errors and kind is int and self.inferred:
+                widened, remaining = _convert(float, column)
+                if len(remaining) < len(errors):
+                    self.schema = [(field, float if field == name else other) for field, other in self.schema]
+                    kinds[index] = float
+                    values, errors = widened, remaining
+            converted.append(values)
+            invalid.update(errors)
+        return kinds, converted, invalid
+
+    def snapshot(self):
+        state = super(ParserSource, self).snapshot()
+        state.update(schema=self.schema, inferred=self.inferred, errors=self.errors)
+        return state
+
+    def restore(self, state):
+        super(ParserSource, self).restore(state)
+        self.schema = state['schema']
+        self.inferred = state.get('inferred', False)
+        self.errors = state['errors']
+
+class CSVSource(ParserSource):
+    """CSVSource emits the rows of CSV files. The column names are read from the first
+    line of each file if `header` is True, otherwise they are the names of the schema.
+    Rows without as many fields as there are columns are skipped. Values are converted
+    to the types of the schema; without one, the types are inferred from the first rows.
+    Quoted fields can hold line breaks, the chunks are not cut within them, but the seek
+    of time sorted files expects rows on a single line.
+    """
+    def __init__(self, name, filenames, header=True, delimiter=',', quotechar='"', **kwargs):
+        super(CSVSource, self).__init__(name, filenames, **kwargs)
+        if not header and not self.schema:
+            raise ValueError("A schema is required for CSV files without a header")
+        self.header = header
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.names = None if header else [name for name, kind in self.schema]
+
+    def recordsEnd(self, data, begin):
+        end = super(CSVSource, self).recordsEnd(data, begin)
+        if end < 0 or data.find(self.quotechar, begin, end) < 0:
+            return end
+
+        # an odd number of quotes before a separator means it is within a quoted field
+        chunk = data[begin:end]
+        while chunk.count(self.quotechar) % 2:
+            cut = chunk.rfind(self.separator, 0, chunk.rfind(self.quotechar))
+            if cut < 0:
+                return -1
+            chunk = chunk[:cut + len(self.separator)]
+        return begin + len(chunk)
+
+    def parseChunk(self, filename, chunk):
+        # the lines keep their line breaks for the quoted fields holding some
+        lines = cStringIO.StringIO(chunk) if self.separator.endswith('\n') else self.records(chunk)
+        records = list(csv.reader(lines, delimiter=self.delimiter, quotechar=self.quotechar))
+        if self.header and self.position[1] == 0 and records:
+            self.names = records.pop(0)
+        if self.names is None:
+            return [], [], None
+
+        width = len(self.names)
+        if records and set(map(len, records)) != set([width]):
+            valid = [record for record in records if len(record) == width]
+            self.errors += len(records) - len(valid)
+            records = valid
+        return self.names, zip(*records), None
+
+    def recordTime(self, record):
+        if self.names is None or self.timeField not in self.names:
+            return None
+        try:
+            values = next(csv.reader([record], delimiter=self.delimiter, quotechar=self.quotechar))
+        except (csv.Error, StopIteration):
+            return None
+        if len(values) != len(self.names):
+            return None
+        return self.parseTime(values[self.names.index(self.timeField)])
+
+    def seek(self, fileno, offset, size):
+        if self.header and not offset:
+            # the names are needed to find the times, the reading starts after them
+            position, record = self.recordAt(fileno, 0, size)
+            if record is None:
+                return offset
+            self.names = next(csv.reader([record], delimiter=self.delimiter, quotechar=self.quotechar), None)
+            offset = min(position + len(record) + len(self.separator), size)
+        return super(CSVSource, self).seek(fileno, offset, size)
+
+    def snapshot(self):
+        # the header is not read again when the reading resumes
+        state = super(CSVSource, self).snapshot()
+        state['names'] = self.names
+        return state
+
+    def restore(self, state):
+        super(CSVSource, self).restore(state)
+        self.names = state['names']
+
+class JSONLinesSource(ParserSource):
+    """JSONLinesSource emits the objects of JSON-lines files, one object per line. The
+    objects of a chunk are decoded at once, per-row messages use them as parameters, with
+    the values of the schema's keys converted. Columnar batches have the columns of the
+    schema (or of the keys of the first object), missing keys are None. Lines which do not
+    hold exactly one object are skipped.
+    """
+    def parseChunk(self, filename, chunk):
+        records = filter(str.strip, self.records(chunk))
+        try:
+            objects = json.loads('[%s]' % ','.join(records))
+        except ValueError:
+            objects = None
+
+        # a line holding several values decodes as more than one object
+        if objects is None or len(objects) != len(records):
+            # finds the invalid lines
+            objects = []
+            for record in records:
+                try:
+                    objects.append(json.loads(record))
+                except ValueError:
+                    self.errors += 1
+        if objects and set(map(type, objects)) != set([dict]):
+            valid = [obj for obj in objects if isinstance(obj, dict)]
+            self.errors += len(objects) - len(valid)
+            objects = valid
+
+        # only the columns which are needed are extracted
+        if self.columnar:
+            names = [name for name, kind in self.schema] if self.schema else list(objects[0]) if objects else []
+        elif self.schema:
+            # the other values of per-row messages are kept as they are
+            names = [name for name, kind in self.schema if kind is int or kind is float]
+        else:
+            names = []
+        if self.timeField is not None and self.timeField not in names:
+            names.append(self.timeField)
+        columns = [[obj.get(name) for obj in objects] for name in names]
+        return names, columns, objects
+
+    def recordTime(self, record):
+        if self.timeField is None:
+            return None
+        try:
+            obj = json.loads(record)
+        except ValueError:
+            return None
+        return self.parseTime(obj.get(self.timeField)) if isinstance(obj, dict) else None
+
+    def kinds(self, names, columns):
+        """Returns the types of the schema, the decoded values are kept as they are without one"""
+        if self.schema is None:
+            return [None] * len(names)
+        return super(JSONLinesSource, self).kinds(names, columns)
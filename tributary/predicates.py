@@ -1,56 +1,87 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from .utilities import validateType, strToUnixtime
-from .exceptions import NotImplementedYet
-from .core import BasePredicate, Message
+from .utilities import validateType, strToUnixtime, toNanoseconds
+from .core import BasePredicate, BaseOverride, Message, MessageBatch
 import re
 from math import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __all__ = ["InclusiveTimePredicate", "ExclusiveTimePredicate", "PredicateGroup",
     "ReversePredicate", "AndPredicate", "OrPredicate",
     "ParamPredicate", "ParamEqualPredicate", "ParamNotEqualPredicate",
     "ParamInPredicate", "ParamNotInPredicate", "ParamContainsPredicate",
-    "LessThanTimePredicate", "GreaterThanTimePredicate"]
+    "LessThanTimePredicate", "GreaterThanTimePredicate", "FilePredicate",
+    "CompiledPredicate", "compilePredicate", "compileModifiers"]
 
 class TimePredicate(BasePredicate):
-    """TimePredicate: defines start and stop times for the filter. Expects arguments as datetime objects."""
+    """TimePredicate: defines start and stop times for the filter. Expects arguments as datetime objects
+    or unixtimes in seconds, they are converted to nanoseconds once and compared to `Message.ns`."""
     def __init__(self, start, stop):
         super(TimePredicate, self).__init__()
         self.start = start
         self.stop = stop
+        self.startNs = toNanoseconds(start)
+        self.stopNs = toNanoseconds(stop)
 
 class InclusiveTimePredicate(TimePredicate):
-    """InclusiveTimePredicate: If the message's time is `>= start and < stop` the message is valid. Expects arguments as datetime objects."""
+    """InclusiveTimePredicate: If the message's time is `>= start and < stop` the message is valid."""
 
     def apply(self, msg):
-        validateType("msg", Message, msg)
-        return msg.datetime >= self.start and msg.datetime < self.stop:
+        return self.startNs <= msg.ns < self.stopNs
+
+    def mask(self, batch):
+        return (batch.times >= self.startNs) & (batch.times < self.stopNs)
+
+    def timeRange(self):
+        return self.startNs, self.stopNs
 
 class ExclusiveTimePredicate(TimePredicate):
-    """ExclusiveTimePredicate: If the message's time is `< start and >= stop` the message is valid. Expects arguments as datetime objects."""
+    """ExclusiveTimePredicate: If the message's time is `< start or >= stop` the message is valid."""
 
     def apply(self, message):
-        validateType("message", Message, message)
-        return message.datetime < self.start and message.datetime >= self.stop:
+        return not self.startNs <= message.ns < self.stopNs
+
+    def mask(self, batch):
+        return (batch.times < self.startNs) | (batch.times >= self.stopNs)
 
 class LessThanTimePredicate(BasePredicate):
-    """Filters out every message whose timestamp is less than the given time. Expects argument as datetime objects."""
+    """Filters out every message whose timestamp is less than (or equal to) the given time. Expects
+    argument as a datetime object or a unixtime in seconds."""
     def __init__(self, timestamp):
+        super(LessThanTimePredicate, self).__init__()
         self.timestamp = timestamp
+        self.ns = toNanoseconds(timestamp)
 
     def apply(self, message):
-        validateType("message", Message, message)
-        return message.datetime > self.timestamp
+        return message.ns > self.ns
+
+    def mask(self, batch):
+        return batch.times > self.ns
+
+    def timeRange(self):
+        return self.ns + 1, None
 
 class GreaterThanTimePredicate(BasePredicate):
-    """Filters out every message vector whose timestamp is greater than the given time."""
+    """Filters out every message whose timestamp is greater than (or equal to) the given time. Expects
+    argument as a datetime object or a unixtime in seconds."""
     def __init__(self, timestamp):
+        super(GreaterThanTimePredicate, self).__init__()
         self.timestamp = timestamp
+        self.ns = toNanoseconds(timestamp)
 
     def apply(self, message):
-        validateType("message", Message, message)
-        return message.time < self.unixtime
+        return message.ns < self.ns
+
+    def mask(self, batch):
+        return batch.times < self.ns
+
+    def timeRange(self):
+        return None, self.ns
 
 
 class PredicateGroup(BasePredicate):
@@ -76,6 +107,22 @@ class AndPredicate(PredicateGroup):
                 break
         return apply
 
+    def mask(self, batch):
+        # unlike `apply` every filter sees every row, stops once no row is left
+        result = numpy.ones(len(batch), dtype=bool)
+        for _filter in self.filters:
+            result &= _filter.mask(batch)
+            if not result.any():
+                break
+        return result
+
+    def timeRange(self):
+        # the intersection of the ranges
+        starts, stops = zip(*[_filter.timeRange() for _filter in self.filters]) or ((), ())
+        starts = [start for start in starts if start is not None]
+        stops = [stop for stop in stops if stop is not None]
+        return (max(starts) if starts else None), (min(stops) if stops else None)
+
 class OrPredicate(PredicateGroup):
     """OrPredicate: This filter combines several filters to find the logical OR of all the filters added"""
 
@@ -88,6 +135,22 @@ class OrPredicate(PredicateGroup):
                 break
         return apply
 
+    def mask(self, batch):
+        # unlike `apply` every filter sees every row, stops once all rows are valid
+        result = numpy.zeros(len(batch), dtype=bool)
+        for _filter in self.filters:
+            result |= _filter.mask(batch)
+            if result.all():
+                break
+        return result
+
+    def timeRange(self):
+        # the smallest range covering every range
+        if not self.filters:
+            return None, None
+        starts, stops = zip(*[_filter.timeRange() for _filter in self.filters])
+        return (None if None in starts else min(starts)), (None if None in stops else max(stops))
+
 class ReversePredicate(BasePredicate):
     """ReversePredicate simply reverses the output of the filter given in the constructor"""
     def __init__(self, _filter):
@@ -97,6 +160,9 @@ class ReversePredicate(BasePredicate):
     def apply(self, message):
         return not self._filter.apply(message)
 
+    def mask(self, batch):
+        return ~self._filter.mask(batch)
+
 class ParamPredicate(BasePredicate):
     """docstring for ParamPredicate"""
     def __init__(self, param, validIfNotExist=True):
@@ -107,15 +173,30 @@ class ParamPredicate(BasePredicate):
         self.validIfNotExist = validIfNotExist
 
     def eval(self, value):
-        raise NotImplementedYet("eval")
+        raise NotImplementedError("eval")
+
+    def evalColumn(self, column):
+        """Evaluates `eval` over a NumPy array and returns a boolean array. Subclasses
+        override it with array operations, by default `eval` is called per value."""
+        return numpy.fromiter((bool(self.eval(value)) for value in column.tolist()), dtype=bool, count=len(column))
 
     def apply(self, data):
         validateType("value", Message, data)
-        if data.hasParam(self.param):
-            return not self.eval(data.getParam(self.param))
+        if self.param in data.data:
+            return not self.eval(data.data.get(self.param))
         else:
             return self.validIfNotExist
 
+    def mask(self, batch):
+        validateType("batch", MessageBatch, batch)
+        if self.param not in batch.data.keys():
+            return numpy.repeat(self.validIfNotExist, len(batch))
+
+        result = ~self.evalColumn(batch.data.get(self.param))
+        if self.param in batch.present:
+            result = numpy.where(batch.present[self.param], result, self.validIfNotExist)
+        return result
+
 class ParamEqualPredicate(ParamPredicate):
     """If a data point has the given parameter and is equal to
        the value supplied, it is filtered out.
@@ -127,6 +208,14 @@ class ParamEqualPredicate(ParamPredicate):
     def eval(self, value):
         return value == self.value
 
+    def evalColumn(self, column):
+        # the comparison operators of the subclasses work on whole arrays
+        result = numpy.asarray(self.eval(column))
+        if result.shape != column.shape:
+            # not comparable element-wise (ie. mismatched types)
+            return super(ParamEqualPredicate, self).evalColumn(column)
+        return result
+
 class ParamNotEqualPredicate(ParamEqualPredicate):
     """If a data point has the given parameter and is not equal to
        the value supplied, it is filtered out.
@@ -175,6 +264,11 @@ class ParamInPredicate(ParamEqualPredicate):
     def eval(self, value):
         return value in self.value
 
+    def evalColumn(self, column):
+        if isinstance(self.value, (list, tuple, set, frozenset)):
+            return numpy.in1d(column, list(self.value))
+        return ParamPredicate.evalColumn(self, column)
+
 class ParamNotInPredicate(ParamEqualPredicate):
     """If a data point has the given parameter and is not in
        the value supplied, it is filtered out.
@@ -183,17 +277,27 @@ class ParamNotInPredicate(ParamEqualPredicate):
     def eval(self, value):
         return value not in self.value
 
+    def evalColumn(self, column):
+        if isinstance(self.value, (list, tuple, set, frozenset)):
+            return numpy.in1d(column, list(self.value), invert=True)
+        return ParamPredicate.evalColumn(self, column)
+
 class FilePredicate(BasePredicate):
-    """FilePredicates are meant to filter file names which are output from a RecursiveFileDataSource.
-       They can be used to limit the file names returned."""
+    """FilePredicates are meant to filter file names which are output from a DirectorySource.
+       They can be used to limit the file names returned. The pattern is compiled once and
+       searched in the `filename` parameter; DirectorySource applies it while walking."""
     def __init__(self, re_pattern):
         super(FilePredicate, self).__init__()
         self.pattern = re_pattern
+        self.regex = re.compile(re_pattern)
+
+    def match(self, filename):
+        """Returns True if the pattern is found in the file name"""
+        return self.regex.search(filename) is not None
 
     def apply(self, value):
         validateType("value", Message, value)
-        filename = value.getParam("filename")
-        return re.search(self.pattern, filename) is not None
+        return self.match(value.data.get("filename", ""))
 
 class ParamContainsPredicate(ParamPredicate):
     """ParamContainsPredicate are meant to filter file names which are output from a RecursiveFileDataSource.
@@ -204,3 +308,129 @@ class ParamContainsPredicate(ParamPredicate):
 
     def eval(self, value):
         return not self.contains in value
+
+    def evalColumn(self, column):
+        if column.dtype.kind in 'SU' and isinstance(self.contains, basestring):
+            return numpy.char.find(column, self.contains) < 0
+        return super(ParamContainsPredicate, self).evalColumn(column)
+
+# Operators used to inline the comparisons of the ParamPredicate family. Only
+# these exact classes are inlined, subclasses may have overridden `eval`.
+_OPERATORS = {
+    ParamEqualPredicate: '==',
+    ParamNotEqualPredicate: '!=',
+    ParamLessThanPredicate: '<',
+    ParamLessThanOrEqualToPredicate: '<=',
+    ParamGreaterThanPredicate: '>',
+    ParamGreaterThanOrEqualToPredicate: '>=',
+    ParamInPredicate: 'in',
+    ParamNotInPredicate: 'not in',
+}
+
+class CompiledPredicate(BasePredicate):
+    """CompiledPredicate wraps the function generated by `compilePredicate`. Batches
+    are still evaluated by the original predicate's `mask`."""
+    def __init__(self, predicate, function, source):
+        super(CompiledPredicate, self).__init__()
+        self.predicate = predicate
+        self.source = source
+        self.apply = function
+
+    def mask(self, batch):
+        return self.predicate.mask(batch)
+
+    def timeRange(self):
+        return self.predicate.timeRange()
+
+def _expression(node, bind):
+    """Returns the source of an expression evaluating the predicate tree on `message`,
+    whose parameters are available as the dict `content`."""
+    cls = type(node)
+    if cls in _OPERATORS:
+        param = bind(node.param)
+        return '(not (content[%s] %s %s) if %s in content else %r)' % (
+            param, _OPERATORS[cls], bind(node.value), param, bool(node.validIfNotExist))
+    elif cls is ParamContainsPredicate:
+        param = bind(node.param)
+        return '(%s in content[%s] if %s in content else %r)' % (
+            bind(node.contains), param, param, bool(node.validIfNotExist))
+    elif cls is InclusiveTimePredicate:
+        return '(%s <= message._ns < %s)' % (bind(node.startNs), bind(node.stopNs))
+    elif cls is ExclusiveTimePredicate:
+        return '(not %s <= message._ns < %s)' % (bind(node.startNs), bind(node.stopNs))
+    elif cls is LessThanTimePredicate:
+        return '(message._ns > %s)' % bind(node.ns)
+    elif cls is GreaterThanTimePredicate:
+        return '(message._ns < %s)' % bind(node.ns)
+    elif cls is AndPredicate:
+        return '(%s)' % ' and '.join([_expression(f, bind) for f in node.filters] or ['True'])
+    elif cls is OrPredicate:
+        return '(%s)' % ' or '.join([_expression(f, bind) for f in node.filters] or ['False'])
+    elif cls is ReversePredicate:
+        return '(not %s)' % _expression(node._filter, bind)
+    return 'bool(%s(message))' % bind(node.apply)
+
+def _generate(name, lines):
+    """Compiles the body of a one argument function taking `message`. Returns the
+    function and its source."""
+    namespace = {}
+
+    def bind(value):
+        constant = '_c%s' % len(namespace)
+        namespace[constant] = value
+        return constant
+
+    body = lines(bind)
+    source = 'def %s(message):\n%s' % (name, ''.join(['    %s\n' % line for line in body]))
+    exec(compile(source, '<compiled %s>' % name, 'exec'), namespace)
+    return namespace[name], source
+
+def compilePredicate(predicate):
+    """Flattens a predicate tree into a single generated function. Parameters and
+    values are bound as constants, type validation is skipped and the short-circuit
+    order of the And/Or groups is kept. Unknown predicates are called through `apply`."""
+    validateType("predicate", BasePredicate, predicate)
+    if isinstance(predicate, CompiledPredicate):
+        return predicate
+
+    function, source = _generate('predicate', lambda bind: [
+        'content = message.data.__dict__',
+        'return %s' % _expression(predicate, bind)])
+    return CompiledPredicate(predicate, function, source)
+
+def compileModifiers(modifiers, counts=None, start=0):
+    """Fuses a list of filters and overrides into a single generated function which
+    returns the resulting message or None if a filter rejected it. Consecutive
+    filters are merged into one expression and overrides are called in between.
+
+    If `counts` is given, the messages rejected by the filter at index `i` of the list
+    are counted in `counts[start + i]`. Only rejections pay for the count."""
+    def lines(bind):
+        body = []
+        pending = []
+        counter = bind(counts) if counts is not None else None
+        for index, modifier in enumerate(list(modifiers) + [None]):
+            if isinstance(modifier, BasePredicate):
+                if isinstance(modifier, CompiledPredicate):
+                    modifier = modifier.predicate
+                if counter is not None:
+                    # one test per filter to know which one rejected the message
+                    if not body or body[-1].startswith('message = '):
+                        body.append('content = message.data.__dict__')
+                    body.append('if not %s:' % _expression(modifier, bind))
+                    body.append('    %s[%d] += 1' % (counter, start + index))
+                    body.append('    return None')
+                    continue
+                pending.append(_expression(modifier, bind))
+                continue
+            if pending:
+                # an override may have returned another message
+                body.append('content = message.data.__dict__')
+                body.append('if not (%s): return None' % ' and '.join(pending))
+                pending = []
+            if isinstance(modifier, BaseOverride):
+                body.append('message = %s(message)' % bind(modifier.apply))
+        body.append('return message')
+        return body
+
+    return _generate('modifiers', lines)[0]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module splits a pipeline over several engines (and hosts). A `RemoteActor`
+is added as a child like any other node and sends what it receives over TCP to a
+`RemoteEndpoint`, which inserts the messages into an actor of its own engine.
+"""
+
+import struct
+import gevent
+from gevent import socket
+from gevent.lock import Semaphore
+from gevent.server import StreamServer
+from .core import Actor, Service
+from .codec import Encoder, Decoder
+from .events import DATA, START
+
+__all__ = ['RemoteActor', 'RemoteEndpoint']
+
+# Every frame starts with the length of its payload
+_HEADER = struct.Struct('!I')
+
+# The payload starts with the name of the target actor
+_TARGET = struct.Struct('!H')
+
+# Sent back by the endpoint once a frame has been inserted
+_ACK = b'\x01'
+
+def _sendFrame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def _recvExactly(sock, size):
+    """Reads `size` bytes. Returns None if the connection was closed."""
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _recvFrame(sock):
+    header = _recvExactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    return _recvExactly(sock, _HEADER.unpack(header)[0])
+
+def encodeFrame(encoder, target, messages):
+    """Encodes the name of the target actor and a list of messages. The strings interned by
+    the encoder are only sent once per connection."""
+    return _TARGET.pack(len(target)) + target + encoder.encode(messages)
+
+def decodeFrame(decoder, payload):
+    """Returns the name of the target actor and the list of messages of a frame"""
+    size = _TARGET.unpack_from(payload)[0]
+    return payload[_TARGET.size:_TARGET.size + size], decoder.feed(payload[_TARGET.size + size:])
+
+class RemoteActor(Actor):
+    """RemoteActor is a proxy for the actor named `target` in the engine listening on
+    `host`:`port` (see `RemoteEndpoint`). Data messages are sent in batches of up to
+    `batchSize` messages, a partial batch is sent after `linger` seconds. At most `window`
+    batches are sent before the endpoint acknowledges them, the proxy (and thus its
+    parents, through its inbox) waits otherwise. START, STOP and KILL are sent as well.
+    If the endpoint closes the connection, sending fails with an IOError.
+    """
+    def __init__(self, name, host, port, target, batchSize=100, linger=0.01, window=8, **options):
+        super(RemoteActor, self).__init__(name, **options)
+        self.address = (host, port)
+        self.target = target
+        self.batchSize = batchSize
+        self.linger = linger
+        self.window = window
+        self.sock = None
+        self._encoder = None
+        self.buffer = []
+        self._flusher = None
+        self._credits = Semaphore(window)
+        self._acks = None
+        self._closed = False
+
+        # one batch is taken from the buffer and written at a time
+        self._lock = Semaphore()
+
+        # control messages are sent as they arrive
+        self.on(START, self.send)
+
+    def preProcess(self, message=None):
+        """Connects to the endpoint"""
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address)
+            self._encoder = Encoder()
+            self._credits = Semaphore(self.window)
+            self._closed = False
+            self._acks = gevent.spawn(self._readAcks)
+
+    def process(self, message=None):
+        self.buffer.append(message)
+        self._buffered()
+
+    def processBatch(self, messages):
+        self.buffer.extend(messages)
+        self._buffered()
+
+    def _buffered(self):
+        while len(self.buffer) >= self.batchSize:
+            self.sendBuffer()
+        if self.buffer and self._flusher is None:
+            self._flusher = gevent.spawn_later(self.linger, self._lingered)
+
+    def _lingered(self):
+        self._flusher = None
+        self.sendBuffer()
+
+    def sendBuffer(self):
+        """Sends up to `batchSize` buffered messages"""
+        with self._lock:
+            if self.buffer:
+                # waits for an acknowledgement if `window` batches are in flight
+                self._acquire()
+                batch, self.buffer = self.buffer[:self.batchSize], self.buffer[self.batchSize:]
+                _sendFrame(self.sock, encodeFrame(self._encoder, self.target, batch))
+
+    def send(self, message):
+        """Sends a message right away, after the buffered ones"""
+        while self.buffer:
+            self.sendBuffer()
+        with self._lock:
+            self._acquire()
+            _sendFrame(self.sock, encodeFrame(self._encoder, self.target, [message.envelope()]))
+
+    def _acquire(self):
+        """Takes a credit, fails once the endpoint has closed the connection"""
+        self._credits.acquire()
+        if self._closed:
+            # wakes the next one waiting for a credit
+            self._credits.release()
+            raise IOError("Connection to %s:%s closed by the endpoint" % self.address)
+
+    def _readAcks(self):
+        try:
+            while True:
+                ack = self.sock.recv(self.window)
+                if not ack:
+                    break
+                for i in range(len(ack)):
+                    self._credits.release()
+        except socket.error:
+            pass
+        self._closed = True
+        self._credits.release()
+
+    def postProcess(self, message=None):
+        """Sends the remaining messages and the STOP (or KILL), then waits for every
+        batch to be acknowledged and disconnects"""
+        if self.sock is None:
+            return
+        if self._flusher is not None:
+            self._flusher.kill()
+            self._flusher = None
+        try:
+            if message is not None:
+                self.send(message)
+            else:
+                while self.buffer:
+                    self.sendBuffer()
+
+            for i in range(self.window):
+                self._acquire()
+        finally:
+            self._acks.kill()
+            self.sock.close()
+            self.sock = None
+
+class RemoteEndpoint(Service):
+    """RemoteEndpoint receives messages from `RemoteActor` proxies and inserts them into
+    the actors of the given execution context. It is added to the context as a service, so
+    the engine closes it when it stops. Use port 0 to listen on any free port, `address`
+    returns the actual address. It listens on the loopback interface unless another `host`
+    is given. Pickled values are rejected unless `allowPickle` is True, as unpickling data
+    received from the network runs arbitrary code. A connection sending an invalid frame,
+    or a frame for an unknown actor, is closed."""
+    def __init__(self, name, ctx, host='127.0.0.1', port=0, allowPickle=False):
+        super(RemoteEndpoint, self).__init__(name)
+        self.context = ctx
+        self.allowPickle = allowPickle
+        self.server = StreamServer((host, port), self.serve)
+        self.server.start()
+        ctx.addService(self)
+
+    @property
+    def address(self):
+        return self.server.address
+
+    def serve(self, sock, address):
+        """Handles a connection from a RemoteActor"""
+        self.log_debug("Connection from %s:%s", *address[:2])
+        decoder = Decoder(self.allowPickle)
+        while True:
+            payload = _recvFrame(sock)
+            if payload is None:
+                break
+            try:
+                target, messages = decodeFrame(decoder, payload)
+                self.deliver(self.context.actors[target], messages)
+            except Exception:
+                self.log_exception("Invalid frame from %s:%s, closing the connection" % address[:2])
+                break
+            sock.sendall(_ACK)
+        sock.close()
+
+    def deliver(self, actor, messages):
+        """Inserts the received messages into the actor"""
+        channel = messages[0].channel
+        if channel == DATA:
+            actor.insertBatch(messages)
+        elif channel == START:
+            # the actor may already have been started by its engine
+            if not actor.running:
+                actor.start()
+        else:
+            for message in messages:
+                actor.insert(message)
+
+    def join(self):
+        """Stops listening for connections"""
+        self.server.stop()
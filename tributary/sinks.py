@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module contains sinks writing the messages they receive to files. The records
+are encoded a batch at a time and buffered, then written with a single call once
+`bufferSize` bytes are buffered or `flushInterval` seconds after the first buffered
+record, whichever comes first. When the written records are synced to the disk is set
+by the `sync` policy (see `Sync`). The buffer is written and the file closed when the
+sink stops.
+"""
+
+import os, csv, json, time
+import cStringIO
+import gevent
+from gevent.lock import Semaphore
+from .core import Actor, MessageBatch, deser
+from .codec import Encoder, MAGIC
+from .utilities import validateType, validateIn, Enum
+
+__all__ = ['Sync', 'FileSink', 'JSONLinesSink', 'CSVSink', 'BinarySink']
+
+# When the written records are synced to the disk: never (it is left to the system),
+# after every write, or at most every `syncInterval` seconds, a single sync committing
+# every write made since the previous one
+Sync = Enum('NEVER', 'ALWAYS', 'GROUP')
+
+def _rows(messages):
+    """Returns the messages with the batches replaced by their rows"""
+    if not any(isinstance(message, MessageBatch) for message in messages):
+        return messages
+    rows = []
+    for message in messages:
+        if isinstance(message, MessageBatch):
+            rows.extend(message.toMessages())
+        else:
+            rows.append(message)
+    return rows
+
+class FileSink(Actor):
+    """FileSink writes the `field` parameter of every message to `filename`, each record
+    ending with `separator`, a line per message by default. The file is truncated when the
+    sink starts unless `append` is True. Override `encode` to write other records.
+
+    `flushInterval` can be None to write only when the buffer is full. With the GROUP
+    policy, a sync runs at most every `syncInterval` seconds and the writes made meanwhile
+    wait for the next one, so a record reaches the disk at most `flushInterval` plus
+    `syncInterval` seconds after it was received. Syncs run in the threadpool of the hub
+    so the other nodes keep running. `count`, `writes` and `syncs` are the numbers of
+    records, writes and syncs so far.
+
+    A checkpoint writes the buffer (and syncs it unless the policy is NEVER). A restored
+    sink truncates the file to its size at the checkpoint, dropping the records written
+    after it, which are written again.
+    """
+    def __init__(self, name, filename, field='line', separator='\n', append=False, bufferSize=1 << 20,
+                 flushInterval=1.0, sync=Sync.NEVER, syncInterval=1.0, **options):
+        super(FileSink, self).__init__(name, **options)
+        validateType("bufferSize", int, bufferSize)
+        validateIn("sync", sync, Sync.__dict__.values())
+        self.filename = filename
+        self.field = field
+        self.separator = separator
+        self.append = append
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.sync = sync
+        self.syncInterval = syncInterval
+        self.file = None
+        self.restoredSize = None
+        self.buffer = []
+        self.buffered = 0
+        self.count = 0
+        self.writes = 0
+        self.syncs = 0
+
+        # timers writing the buffer and syncing the file when their deadline is reached
+        self._flusher = None
+        self._syncer = None
+
+        # time of the last sync and whether writes were made since then
+        self._synced = 0
+        self._unsynced = False
+
+        # the file is not closed while it is being synced
+        self._lock = Semaphore()
+
+    def preProcess(self, message=None):
+        """Opens the file and writes its header if it is empty"""
+        if self.file is None:
+            # unbuffered, the buffer of the sink is written with a single call
+            self.file = open(self.filename, 'ab' if self.append or self.restoredSize is not None else 'wb', 0)
+            if self.restoredSize is not None:
+                self.file.truncate(self.restoredSize)
+            self._synced = time.time()
+            if not os.fstat(self.file.fileno()).st_size:
+                header = self.fileHeader()
+                if header:
+                    self.file.write(header)
+
+    def fileHeader(self):
+        """Returns what is written at the start of the file"""
+        return b''
+
+    def encode(self, messages):
+        """Returns the records of a list of messages"""
+        field, separator = self.field, self.separator
+        return b''.join([str(message.data.get(field, '')) + separator for message in _rows(messages)])
+
+    def process(self, message=None):
+        self.bufferRecords(self.encode([message]), len(message) if isinstance(message, MessageBatch) else 1)
+
+    def processBatch(self, messages):
+        count = len(messages)
+        for message in messages:
+            if isinstance(message, MessageBatch):
+                count += len(message) - 1
+        self.bufferRecords(self.encode(messages), count)
+
+    def bufferRecords(self, data, count):
+        """Buffers the encoded records of `count` messages"""
+        self.count += count
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.bufferSize:
+            self.writeBuffer()
+        elif self._flusher is None and self.flushInterval is not None:
+            self._flusher = gevent.spawn_later(self.flushInterval, self._flushLater)
+
+    def writeBuffer(self):
+        """Writes the buffered records with a single call and syncs the file according to the policy"""
+        self._write()
+        if not self._unsynced or self.sync == Sync.NEVER:
+            return
+        elapsed = time.time() - self._synced
+        if self.sync == Sync.ALWAYS or elapsed >= self.syncInterval:
+            self.fsync()
+        elif self._syncer is None:
+            self._syncer = gevent.spawn_later(self.syncInterval - elapsed, self._syncLater)
+
+    def _write(self):
+        if self._flusher is not None and self._flusher is not gevent.getcurrent():
+            self._flusher.kill()
+        self._flusher = None
+        if self.buffer:
+            data = b''.join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+            self.file.write(data)
+            self.writes += 1
+            self._unsynced = True
+
+    def _flushLater(self):
+        self._flusher = None
+        self.writeBuffer()
+
+    def fsync(self):
+        """Syncs the file to the disk. The writes made during the sync are committed by the next one."""
+        with self._lock:
+            if self.file is None:
+                return
+            self._unsynced = False
+            self._synced = time.time()
+            gevent.get_hub().threadpool.apply(os.fsync, (self.file.fileno(),))
+            self.syncs += 1
+
+    def _syncLater(self):
+        self._syncer = None
+        if self._unsynced:
+            self.fsync()
+
+    def snapshot(self):
+        if self.file is None:
+            return None
+        self._write()
+        if self._unsynced and self.sync != Sync.NEVER:
+            self.fsync()
+        return {'size': os.fstat(self.file.fileno()).st_size, 'count': self.count}
+
+    def restore(self, state):
+        self.restoredSize = state['size']
+        self.count = state['count']
+
+    def postProcess(self, message=None):
+        """Writes the buffered records, syncs the file unless the policy is NEVER and closes it"""
+        if self.file is None:
+            return
+        if self._syncer is not None:
+            self._syncer.kill()
+            self._syncer = None
+        self._write()
+        if self._unsynced and self.sync != Sync.NEVER:
+            self.fsync()
+        with self._lock:
+            self.file.close()
+            self.file = None
+        self.log_debug("%s records written in %s writes, %s syncs", self.count, self.writes, self.syncs)
+
+class JSONLinesSink(FileSink):
+    """JSONLinesSink writes the parameters of every message as a JSON object, one per line.
+    If `timeField` is given, the timestamp of the message is written in it, in nanoseconds
+    since the epoch (see `parsers.JSONLinesSource`)."""
+    def __init__(self, name, filename, timeField=None, **kwargs):
+        super(JSONLinesSink, self).__init__(name, filename, **kwargs)
+        self.timeField = timeField
+        self._encoder = json.JSONEncoder(default=deser, separators=(',', ':'))
+
+    def encode(self, messages):
+        dumps = self._encoder.encode
+        if self.timeField is None:
+            lines = [dumps(message.data.__dict__) for message in _rows(messages)]
+        else:
+            field = self.timeField
+            lines = [dumps(dict(message.data.__dict__, **{field: message.ns})) for message in _rows(messages)]
+        lines.append(b'')
+        return b'\n'.join(lines)
+
+class CSVSink(FileSink):
+    """CSVSink writes the `fields` parameters of every message as a CSV row, missing ones
+    are empty. If `timeField` is given, the timestamp of the message (in nanoseconds since
+    the epoch) is written first, in a column of that name. The names of the columns are
+    written first in a new file if `header` is True."""
+    def __init__(self, name, filename, fields, header=True, delimiter=',', quotechar='"', timeField=None, **kwargs):
+        super(CSVSink, self).__init__(name, filename, **kwargs)
+        self.fields = list(fields)
+        self.header = header
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.timeField = timeField
+
+    def writeRows(self, rows):
+        """Returns the given rows as CSV"""
+        out = cStringIO.StringIO()
+        csv.writer(out, delimiter=self.delimiter, quotechar=self.quotechar, lineterminator='\n').writerows(rows)
+        return out.getvalue()
+
+    def fileHeader(self):
+        if not self.header:
+            return b''
+        return self.writeRows([([self.timeField] if self.timeField else []) + self.fields])
+
+    def encode(self, messages):
+        fields = self.fields
+        if self.timeField is None:
+            rows = [[message.data.get(field) for field in fields] for message in _rows(messages)]
+        else:
+            rows = [[message.ns] + [message.data.get(field) for field in fields] for message in _rows(messages)]
+        return self.writeRows(rows)
+
+class BinarySink(FileSink):
+    """BinarySink writes the messages in the binary format of the `codec` module, which
+    keeps their timestamps and the types of their parameters. Batches are written as
+    they are. The file can be read back with `codec.readMessages`."""
+    def __init__(self, name, filename, **kwargs):
+        super(BinarySink, self).__init__(name, filename, **kwargs)
+        self._encoder = None
+
+    def preProcess(self, message=None):
+        # the strings interned by a previous encoder are not known to this one
+        if self.file is None:
+            self._encoder = Encoder()
+        super(BinarySink, self).preProcess(message)
+
+    def fileHeader(self):
+        return MAGIC
+
+    def encode(self, messages):
+        return self._encoder.encode(messages)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module contains producers reading their messages from files.
+"""
+
+import os, mmap
+import gevent
+from gevent.queue import Queue
+from gevent.threadpool import ThreadPool
+from .core import Message, now
+from .events import DATA
+from .predicates import FilePredicate, compileModifiers
+from .streams import StreamProducer
+from .utilities import validateType
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+__all__ = ['FileSource', 'DirectorySource']
+
+class FileSource(StreamProducer):
+    """FileSource emits the records of one or more files, one message per record with
+    the record in the `field` parameter and the name of the file in `filename`. Records
+    end with `separator`, a line per message by default.
+
+    The files are memory mapped and read in chunks of about `chunkSize` bytes of whole
+    records, split at once. The messages of a chunk are emitted in batches of `batchSize`.
+    Only one chunk is mapped and held in memory at a time, whatever the size of the files.
+    `position` is the (filename, offset) of the chunk being read. Setting `done` stops
+    the reading after the current chunk. Checkpoints are taken between chunks and a
+    restored source resumes from the chunk following its snapshot.
+
+    Sources whose records have a timestamp implement `recordTime`. If such a source is
+    `timeSorted`, the reading of each file starts with a bisection of the file to the
+    chunk holding `startTime` and stops at the first chunk which is `exhausted`. The
+    records of FileSource itself have no timestamp, `timeSorted` has no effect on it.
+    """
+    barrierOnTick = False
+
+    def __init__(self, name, filenames, field='line', separator='\n', chunkSize=1 << 22, batchSize=1000, **kwargs):
+        super(FileSource, self).__init__(name, **kwargs)
+        validateType("chunkSize", int, chunkSize)
+        validateType("batchSize", int, batchSize)
+        if isinstance(filenames, basestring):
+            filenames = [filenames]
+        self.filenames = list(filenames)
+        self.field = field
+        self.separator = separator
+        self.chunkSize = chunkSize
+        self.batchSize = batchSize
+        self.position = None
+        self.done = False
+
+    def process(self, message=None):
+        filenames, offset = self.filenames, 0
+        if self.position is not None:
+            # resumes from the restored position
+            filename, offset = self.position
+            if filename in filenames:
+                filenames = filenames[filenames.index(filename):]
+        for filename in filenames:
+            if self.done:
+                break
+            self.readFile(filename, offset)
+            offset = 0
+
+    def readFile(self, filename, offset=0):
+        """Reads a file from the given offset, chunk by chunk"""
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not offset and self.startTime() is not None:
+                offset = self.seek(f.fileno(), offset, size)
+            while offset < size and not self.done:
+                self.position = (filename, offset)
+                self.injectBarriers()
+                chunk = self.readChunk(f.fileno(), offset, size)
+                if self.stopTime() is not None:
+                    end = chunk.find(self.separator)
+                    if self.exhausted(self.recordTime(chunk[:end] if end >= 0 else chunk)):
+                        self.done = True
+                        break
+                offset += len(chunk)
+                self.processChunk(filename, chunk)
+        self.position = (filename, offset)
+
+    def recordTime(self, record):
+        """Returns the timestamp (ns) of a record, None if it has none or it can not be
+        parsed. Sources with timestamps override it to seek and stop early."""
+        return None
+
+    def recordAt(self, fileno, position, size):
+        """Returns the offset and the content of the first record starting at or after
+        `position`, (None, None) if there is none"""
+        start = position - position % mmap.ALLOCATIONGRANULARITY
+        if start >= size:
+            return None, None
+
+        # only the pages which are read are loaded
+        mapped = mmap.mmap(fileno, size - start, access=mmap.ACCESS_READ, offset=start)
+        try:
+            begin = position - start
+            if position:
+                cut = mapped.find(self.separator, max(position - len(self.separator), 0) - start)
+                if cut < 0:
+                    return None, None
+                begin = cut + len(self.separator)
+            if begin >= size - start:
+                return None, None
+            end = mapped.find(self.separator, begin)
+            return start + begin, mapped[begin:end if end >= 0 else size - start]
+        finally:
+            mapped.close()
+
+    def seek(self, fileno, offset, size):
+        """Returns the offset of a record before the first one at or after `startTime`,
+        found by bisecting the file down to a chunk. Every record before the returned
+        offset is older than `startTime`, the remaining ones are skipped when the chunk
+        is processed."""
+        start = self.startTime()
+        low, high = offset, size
+        while high - low > self.chunkSize:
+            middle = (low + high) // 2
+            position, record = self.recordAt(fileno, middle, size)
+            ns = self.recordTime(record) if record is not None else None
+            if ns is not None and ns < start:
+                low = position
+            else:
+                # the record is at or after the start, or it can not be parsed
+                high = middle
+        return low
+
+    def readChunk(self, fileno, offset, size):
+        """Maps the file from `offset` and returns about `chunkSize` bytes of whole records.
+        Only the chunk is mapped so the pages are released once it has been read."""
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        length = self.chunkSize
+        while True:
+            end = min(offset + length, size)
+            mapped = mmap.mmap(fileno, end - start, access=mmap.ACCESS_READ, offset=start)
+            try:
+                if end == size:
+                    return mapped[offset - start:]
+                cut = self.recordsEnd(mapped, offset - start)
+                if cut >= 0:
+                    return mapped[offset - start:cut]
+            finally:
+                mapped.close()
+
+            # a record longer than the chunk
+            length *= 2
+
+    def recordsEnd(self, data, begin):
+        """Returns the end of the last whole record of `data` after `begin`, -1 if there
+        is none. Override it if records can hold the separator."""
+        cut = data.rfind(self.separator, begin)
+        return cut + len(self.separator) if cut >= 0 else -1
+
+    def records(self, chunk):
+        """Returns the records of a chunk"""
+        records = chunk.split(self.separator)
+        if not records[-1]:
+            records.pop()
+        return records
+
+    def processChunk(self, filename, chunk):
+        """Emits the records of a chunk. Override it to parse the records."""
+        field = self.field
+        ns = now()
+        records = self.records(chunk)
+        for start in range(0, len(records), self.batchSize):
+            self.emitBatch(DATA, [Message.fromDict({'filename': filename, field: record}, ns)
+                                  for record in records[start:start + self.batchSize]])
+
+    def snapshot(self):
+        return {'position': self.position, 'done': self.done}
+
+    def restore(self, state):
+        self.position = state['position']
+        self.done = state['done']
+
+class DirectorySource(StreamProducer):
+    """DirectorySource emits the paths of the files found under the `roots` directories,
+    one message per file with the path in the `filename` parameter. Subdirectories are
+    walked if `recursive` is True, following symbolic links if `followLinks` is True.
+
+    Directories are listed concurrently by `threads` native threads (with `scandir`, from
+    the standard library or the scandir package, if available). The `FilePredicate`
+    filters added before any other modifier are applied to the paths during the walk, so
+    rejected paths never become messages; the other modifiers are applied as usual.
+
+    Paths are emitted in batches of `batchSize`. If `fanOut` is True, each batch goes to
+    a single child, the one with the fewest queued messages (in turn when several have as
+    few), instead of every child. This spreads the files over several reader actors.
+
+    Paths are found in no particular order, the source can not be `timeSorted`.
+    """
+    def __init__(self, name, roots, recursive=True, followLinks=False, threads=4, batchSize=1000, fanOut=False, **kwargs):
+        super(DirectorySource, self).__init__(name, **kwargs)
+        validateType("threads", int, threads)
+        validateType("batchSize", int, batchSize)
+        if self.timeSorted:
+            raise ValueError("The paths of a DirectorySource are not sorted by time")
+        if isinstance(roots, basestring):
+            roots = [roots]
+        self.roots = list(roots)
+        self.recursive = recursive
+        self.followLinks = followLinks
+        self.threads = threads
+        self.batchSize = batchSize
+        self.fanOut = fanOut
+        self.pathFilters = []
+        self._turn = 0
+
+    def compile(self, message=None):
+        """Splits the leading file filters from the other modifiers"""
+        count = 0
+        while count < len(self.modifiers) and isinstance(self.modifiers[count], FilePredicate):
+            count += 1
+        self.pathFilters = self.modifiers[:count]
+        super(DirectorySource, self).compile(message)
+        self._pipeline = compileModifiers(self.modifiers[count:], self.filterCounts(), count)
+
+    def listDirectory(self, path):
+        """Returns the subdirectories and the accepted files of a directory, and the number
+        of files rejected by each file filter. Runs in the threadpool."""
+        directories = []
+        files = []
+        rejected = [0] * len(self.pathFilters)
+        try:
+            if scandir is not None:
+                for entry in scandir(path):
+                    if entry.is_dir(follow_symlinks=self.followLinks):
+                        directories.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry.path)
+            else:
+                for name in os.listdir(path):
+                    child = os.path.join(path, name)
+                    if os.path.isdir(child) and (self.followLinks or not os.path.islink(child)):
+                        directories.append(child)
+                    elif os.path.isfile(child):
+                        files.append(child)
+        except OSError:
+            # the directory may have been removed or may not be readable
+            return directories, files, rejected
+        for index, _filter in enumerate(self.pathFilters):
+            count = len(files)
+            files = [filename for filename in files if _filter.match(filename)]
+            rejected[index] = count - len(files)
+        return directories, files, rejected
+
+    def process(self, message=None):
+        if self._pipeline is None:
+            self.compile()
+        pool = ThreadPool(self.threads)
+        results = Queue()
+
+        def scan(path):
+            try:
+                results.put(pool.apply(self.listDirectory, (path,)))
+            except Exception:
+                self.log_exception("Error listing '%s'" % path)
+                results.put(((), (), ()))
+
+        pending = 0
+        for root in self.roots:
+            gevent.spawn(scan, root)
+            pending += 1
+
+        batch = []
+        ns = now()
+        counts = self.filterCounts()
+        while pending:
+            directories, files, rejected = results.get()
+            pending -= 1
+            if counts is not None:
+                for index, count in enumerate(rejected):
+                    counts[index] += count
+            if self.recursive:
+                for directory in directories:
+                    gevent.spawn(scan, directory)
+                    pending += 1
+            for filename in files:
+                batch.append(Message.fromDict({'filename': filename}, ns))
+            while len(batch) >= self.batchSize:
+                self.emitBatch(DATA, batch[:self.batchSize])
+                batch = batch[self.batchSize:]
+                ns = now()
+        if batch:
+            self.emitBatch(DATA, batch)
+        pool.kill()
+
+    def emitBatch(self, channel, messages, forward=False):
+        if not self.fanOut or channel != DATA:
+            return super(DirectorySource, self).emitBatch(channel, messages, forward)
+
+        valid = []
+        for message in messages:
+            message.data.freeze()
+            message = self.modify(message.envelope(channel, forward))
+            if message is not None:
+                valid.append(message)
+
+        # the whole batch goes to the least busy child, in turn if they are equally busy
+        if self.metrics is not None:
+            self.metrics.emitted += len(valid)
+        children = self.children
+        if valid and children:
+            turn = self._turn % len(children)
+            self._turn += 1
+            children = children[turn:] + children[:turn]
+            min(children, key=lambda child: child.inbox.qsize() if hasattr(child, 'inbox') else 0).insertBatch(valid)
+
+        # yields to event loop
+        self.tick()
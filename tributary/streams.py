@@ -7,57 +7,53 @@ nodes handle each 'message' they are given 'completely'. By default, they do
 not store any messages but instead pass them along to any child nodes.
 """
 
-import tributary
-from .core import Actor, BasePredicate, BaseOverride, Message
+import time
+from .core import Actor, BasePredicate, BaseOverride, Message, MessageBatch
 from .utilities import validateType
-from .events import StartMessage, StopMessage, START, STOP
-from gevent.queue import Empty
+from .events import StartMessage, StopMessage, START, STOP, DATA, CHECKPOINT
+from .predicates import compileModifiers
 
-class LimitPredicate(BasePredicate):
-    """LimitPredicate is used to limit the number of messages processed by the stream node"""
-    def __init__(self, limit, offset=0):
-        super(LimitPredicate, self).__init__()
-        self.limit = limit + 1
-        self.count = 0
-
-    def apply(self, msg):
-        self.count += 1
-        if self.count < self.limit:
-            return True
-        return False
-
-class SkipPredicate(BasePredicate):
-    """SkipPredicate is used to skip a leading number of messages"""
-    def __init__(self, skip):
-        super(SkipPredicate, self).__init__()
-        self.skip = skip + 1
-        self.count = 0
-
-    def apply(self, msg):
-        self.count += 1
-        if self.count > self.skip:
-            return True
-        return False
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class SkipLimitPredicate(BasePredicate):
-    """SkipLimitPredicate first skips a number of messages then limits the following messages."""
+    """SkipLimitPredicate first skips a number of messages then limits the following messages.
+    A `limit` of None lets every following message through."""
     def __init__(self, skip, limit):
         super(SkipLimitPredicate, self).__init__()
-        self.skip = skip + 1
-        self.limit = limit + 1
+        self.skip = skip
+        self.limit = limit
         self.count = 0
 
-    def isValid(self, msg):
+    def apply(self, msg):
         self.count += 1
-        if self.count > self.skip and self.count < self.limit + self.skip:
-            return True
-        return False
+        return self.count > self.skip and (self.limit is None or self.count <= self.skip + self.limit)
+
+    def mask(self, batch):
+        # the rows are counted in order, as if `apply` was called for each of them
+        index = numpy.arange(self.count, self.count + len(batch))
+        self.count += len(batch)
+        if self.limit is None:
+            return index >= self.skip
+        return (index >= self.skip) & (index < self.skip + self.limit)
+
+class LimitPredicate(SkipLimitPredicate):
+    """LimitPredicate is used to limit the number of messages processed by the stream node"""
+    def __init__(self, limit, offset=0):
+        super(LimitPredicate, self).__init__(offset, limit)
+
+class SkipPredicate(SkipLimitPredicate):
+    """SkipPredicate is used to skip a leading number of messages"""
+    def __init__(self, skip):
+        super(SkipPredicate, self).__init__(skip, None)
 
 class StreamElement(Actor):
     """Streams send their processed data to their children as soon as they have
     finished processing it themselves."""
-    def __init__(self, name):
-        super(StreamElement, self).__init__(name)
+    def __init__(self, name, **kwargs):
+        super(StreamElement, self).__init__(name, **kwargs)
         # set to True on the first message received
         self.initialized = False
 
@@ -71,16 +67,22 @@ class StreamElement(Actor):
         # Stores all the filters and overrides for this node.
         self.modifiers = []
 
+        # The modifiers fused into one function, built when the stream starts.
+        self._pipeline = None
+        self.on(START, self.compile)
+
     def addFilter(self, _filter):
         """Adds a Filter to this stream. Filters must inherit from the BasePredicate class."""
         validateType("filter", BasePredicate, _filter)
         self.modifiers.append(_filter)
+        self._pipeline = None
         return self
 
     def addOverride(self, override):
         """Adds an override to the stream. Overrides must inherit from the BaseOverride class."""
         validateType("arg", BaseOverride, override)
         self.modifiers.append(override)
+        self._pipeline = None
         return self
 
     def limit(self, count, offset=0):
@@ -96,48 +98,90 @@ class StreamElement(Actor):
         self.addFilter(SkipPredicate(count))
         return self
 
+    def compile(self, message=None):
+        """Fuses the filters and overrides into a single function (see `compileModifiers`).
+        This is done when the stream starts, adding a modifier discards the compiled function
+        and it is rebuilt on the next message."""
+        self._pipeline = compileModifiers(self.modifiers, self.filterCounts())
+
+    def filterCounts(self):
+        """Returns the list counting the messages rejected by each modifier, None without metrics"""
+        metrics = self.metrics
+        if metrics is None:
+            return None
+        if len(metrics.filtered) < len(self.modifiers):
+            metrics.filtered.extend([0] * (len(self.modifiers) - len(metrics.filtered)))
+        return metrics.filtered
+
+    def modify(self, message):
+        """Applies the filters and overrides in the order they were added. Returns the
+        resulting message or None if a filter rejected it. Control messages are not modified."""
+        if message.channel != DATA:
+            return message
+        if isinstance(message, MessageBatch):
+            return self.modifyBatch(message)
+        if self._pipeline is None:
+            self.compile()
+        return self._pipeline(message)
+
+    def modifyBatch(self, batch):
+        """Applies the filters and overrides to a columnar batch, the filters select
+        the remaining rows at once. Returns None if no row is left."""
+        counts = self.filterCounts()
+        for index, modifier in enumerate(self.modifiers):
+            if isinstance(modifier, BaseOverride):
+                batch = modifier.applyBatch(batch)
+            elif isinstance(modifier, BasePredicate):
+                mask = modifier.mask(batch)
+                if not mask.all():
+                    if counts is not None:
+                        counts[index] += len(batch) - int(mask.sum())
+                    batch = batch.select(mask)
+                if not len(batch):
+                    return None
+        return batch
+
     def execute(self):
         """Handles the data flow for streams"""
         self.running = True
 
         self.log("Starting...")
+        metrics = self.metrics
         while self.running:
-
-            # Boolean flag to determine message validity
-            valid = True
-            
             try:
-                message = self.inbox.get()
+                message = self.receive()
 
-                # Iterates over all the filters and overrides to modify the
-                # stream's default capability.
-                for modifier in self.modifiers:
-                    if isinstance(modifier, BaseOverride):
-                        message = modifier.apply(message)
-                    elif isinstance(modifier, BasePredicate):
-                        if not modifier.apply(message):
-                            valid = False
+                # woken up without a message, re-check `running`
+                if message is None:
+                    continue
 
-                            # Must be a break and not return because setting
-                            # the initialization flag would be skipped if it
-                            # needed to be set.
-                            break
+                # control messages are not timed
+                start = time.time() if metrics is not None and (isinstance(message, list) or message.channel == DATA) else None
 
-                # the incoming message was not filtered
-                if valid:
+                if isinstance(message, list):
 
-                    # process the incoming message
-                    self.handle(message)
+                    # the modifiers are applied to each message of the batch,
+                    # the remaining ones are processed together
+                    batch = [m for m in (self.modify(m) for m in message) if m is not None]
+                    self.handleBatch(batch)
+                else:
+                    message = self.modify(message)
 
-                # yield to event loop after processing the message
-                self.tick()
+                    # the incoming message was not filtered
+                    if message is not None:
 
-            except Empty:
+                        # process the incoming message
+                        self.handle(message)
+
+                if start is not None:
+                    metrics.observe(time.time() - start)
+
+                # yield to event loop only if more messages are waiting
+                if not self.inbox.empty():
+                    self.tick()
 
-                # Empty signifies that the queue is empty, so yield to another node
-                self.tick()
             except Exception:
-                tributary.log_exception(self.name, "Error in '%s': %s" % (self.__class__.__name__, self.name))
+                self.log_exception("Error in '%s': %s" % (self.__class__.__name__, self.name))
                 self.tick()
 
         # self.tick()
@@ -146,17 +190,103 @@ class StreamElement(Actor):
 
 class StreamProducer(StreamElement):
     """StreamProducer is an 'output' only stream. It does not process any
-    incoming messages. Publishing messages is done manually inside the process method."""
+    incoming messages. Publishing messages is done manually inside the process method.
+
+    A producer whose messages are sorted by time should set `timeSorted`. The time range
+    accepted by its filters can then be used to skip the messages before `startTime` and
+    to stop reading once `exhausted` returns True. The producer has to use them, they
+    only return None and False if it is not `timeSorted` (see `sources.FileSource`).
+
+    Checkpoints start at the producers (see `injectBarriers`). By default the barriers
+    are emitted the next time the producer yields after emitting; producers whose
+    snapshot is not up to date at every emit set `barrierOnTick` to False and call
+    `injectBarriers` themselves.
+
+    A producer does not wait on its inbox while `process` runs. The messages sent to it
+    (see `ExecutionContext.sendTo`) are handled each time it yields, and once more when
+    `process` returns."""
+    barrierOnTick = True
+
+    def __init__(self, name, timeSorted=False, **kwargs):
+        super(StreamProducer, self).__init__(name, **kwargs)
+        self.timeSorted = timeSorted
+        self._timeRange = None
+
+        # barriers of the checkpoints requested, waiting to be emitted
+        self._barriers = []
+
+    def compile(self, message=None):
+        super(StreamProducer, self).compile(message)
+        self._timeRange = self.timeRange()
+
+    def timeRange(self):
+        """Returns the (start, stop) nanoseconds outside of which the filters reject every
+        message, None meaning unbounded. Filters after an override are not considered,
+        the override may change the timestamps."""
+        start = stop = None
+        for modifier in self.modifiers:
+            if isinstance(modifier, BaseOverride):
+                break
+            low, high = modifier.timeRange()
+            if low is not None and (start is None or low > start):
+                start = low
+            if high is not None and (stop is None or high < stop):
+                stop = high
+        return start, stop
+
+    def startTime(self):
+        """Returns the time (ns) a time sorted source can seek to, None to read from the start"""
+        if not self.timeSorted:
+            return None
+        if self._pipeline is None:
+            self.compile()
+        return self._timeRange[0]
+
+    def stopTime(self):
+        """Returns the time (ns) from which a time sorted source can stop reading, None if it can not"""
+        if not self.timeSorted:
+            return None
+        if self._pipeline is None:
+            self.compile()
+        return self._timeRange[1]
+
+    def exhausted(self, ns):
+        """Returns True if the source is time sorted and no message at or after `ns` can
+        pass the filters, so the source can stop reading. `ns` can be None if unknown."""
+        stop = self.stopTime()
+        return stop is not None and ns is not None and ns >= stop
 
     def validate(self, message):
-        if message is not None:
-            for modifier in self.modifiers:
-                if isinstance(modifier, BaseOverride):
-                    message = modifier.apply(message)
-                elif isinstance(modifier, BasePredicate):
-                    if not modifier.apply(message):
-                        return False
-        return True
+        """Returns False if a filter rejects the message"""
+        return message is None or self.modify(message) is not None
+
+    def requestCheckpoint(self, barrier):
+        self._barriers.append(barrier)
+
+    def injectBarriers(self):
+        """Takes the snapshot of the producer for the checkpoints requested so far and emits
+        their barriers. It is called where the snapshot covers every message emitted."""
+        while self._barriers:
+            barrier = self._barriers.pop(0)
+            checkpointer = self.getContext().checkpointer
+            if checkpointer is not None:
+                checkpointer.acknowledge(barrier.data.id, self, self.snapshot())
+            self.emit(CHECKPOINT, barrier)
+
+    def tick(self):
+        if self._barriers and self.barrierOnTick:
+            self.injectBarriers()
+        super(StreamProducer, self).tick()
+        self.handleInbox()
+
+    def handleInbox(self):
+        """Handles the messages waiting in the inbox, without waiting for more"""
+        while not self.inbox.empty():
+            message = self.receive()
+            if isinstance(message, list):
+                self.handleBatch(message)
+            elif message is not None:
+                self.handle(message)
 
     def execute(self):
         """Executes the preProcess, process, postProcess, scatter and gather methods"""
@@ -168,6 +298,8 @@ class StreamProducer(StreamElement):
 
         # process
         self.process(None)
+        self.injectBarriers()
+        self.handleInbox()
 
         self.emit(STOP, StopMessage, forward=True)
 
@@ -184,77 +316,90 @@ class StreamProducer(StreamElement):
         any child nodes. This essentially allows a node to send special messages 
         to any nodes listening."""
         validateType('message', Message, message)
-        message.channel = channel
-        message.forward = forward
+        message.data.freeze()
         # message.source = self
 
-        if self.validate(message):
-            self.log_debug("Sending message: %s on channel: %s" % (message, channel))
+        # overrides return a modified copy instead of changing the message
+        message = self.modify(message.envelope(channel, forward))
+        if message is not None:
+            self.log_debug("Sending message: %s on channel: %s", message, channel)
+            if self.metrics is not None and channel == DATA:
+                self.metrics.emitted += len(message) if isinstance(message, MessageBatch) else 1
 
             for child in self.children:
-                child.insert(message)
+                child.insert(message.envelope())
 
         # yields to event loop
         self.tick()
 
-# class Sink(StreamElement):
-#     """Sink hold their state until the end then publishes it to any
-#     child nodes. Children of Sink nodes should only expect one value."""
-#     def execute(self, input=None):
-
-#         # Should be false on the first message received.
-#         # The preProcess function should handle any initialization for this stream.
-#         if not self.initialized:
-#             self.preProcess(input)
-#             self.log("Initializing...")
-
-#         # If the input is None, then it signals the end of the stream. None should
-#         # be considered a poison-pill.
-#         if input is not None:
-#             try:
-#                 # Iterates over all the filters and overrides to modify the
-#                 # stream's default capability.
-#                 for modifier in self.modifiers:
-#                     if isinstance(modifier, BaseOverride):
-#                         input = modifier.apply(input)
-#                     elif isinstance(modifier, BasePredicate):
-#                         if not modifier.apply(input):
-#                             return
-
-#                 # Processes the input. Stores any intermediate results in self.state.
-#                 self.process(input)
-#             except:
-#                 tributary.log_exception(self.name, "Error in '%s': %s" % (self.__class__.__name__, self.name))
-#         else:
-#             # Closes the Sink node if None is received and the node has been initialized
-#             if self.initialized:
-
-#                 # Closes the Sink
-#                 self.postProcess(None)
-
-#                 # Published the state to any child nodes
-#                 self.scatter(self.state)
-
-#                 # Post processes any child nodes
-#                 self.gather()
-#                 self.log("Exiting...")
-
-#         # Sets the init flag on the first message recieved
-#         if not self.initialized:
-#             self.initialized = True
-
-# class StreamCounter(Sink):
-#     """StreamCounter is a sink which only counts
-#     the number of messages it has received."""
-#     def __init__(self, name):
-#         super(StreamCounter, self).__init__(name)
-#         self.count = 0
-#         self.state = Message()
-
-#     def process(self, pkt):
-#         self.count += 1
-
-#     def postProcess(self, pkt):
-#         self.state.name = self.name
-#         self.state["count"] = self.count
+    def emitBatch(self, channel, messages, forward=False):
+        """Sends the messages which pass the modifiers to the children as one batch."""
+        valid = []
+        for message in messages:
+            validateType('message', Message, message)
+            message.data.freeze()
+            valid.append(message.envelope(channel, forward))
+        self._emitValid(channel, valid)
+
+    def emitRows(self, rows, times):
+        """Emits data messages built from the rows, dictionaries used as they are, and
+        their timestamps (ns) as one batch. Unlike `emitBatch` the messages are not put
+        in envelopes, nothing else holds them. This is the fastest way for sources to emit
+        many rows."""
+        self._emitValid(DATA, Message.fromRows(rows, times))
+
+    def _emitValid(self, channel, valid):
+        # control messages are not modified
+        if self.modifiers and channel == DATA:
+            valid = [message for message in map(self.modify, valid) if message is not None]
+        if self.metrics is not None and channel == DATA:
+            self.metrics.emitted += len(valid)
+
+        # the batch is shared by every child
+        if valid:
+            for child in self.children:
+                child.insertBatch(valid)
+
+        # yields to event loop
+        self.tick()
+
+class Sink(StreamElement):
+    """Sinks hold their state until the stream stops, then publish it to their
+    children before the STOP. Children of Sink nodes should only expect one value."""
+    def __init__(self, name, **kwargs):
+        super(Sink, self).__init__(name, **kwargs)
+
+        # a sink can receive several STOP messages (from its parents and the engine),
+        # the state is only published on the first one
+        self._published = False
+
+        # runs after postProcess, which can set the final state
+        self.on(STOP, self.publish)
+
+    def publish(self, message=None):
+        """Sends the state to the children, if any, the first time the stream stops"""
+        if self._published:
+            return
+        self._published = True
+        if self.state is not None:
+            state, self.state = self.state, None
+            self.emit(DATA, state)
+
+class StreamCounter(Sink):
+    """StreamCounter is a sink which only counts
+    the number of messages it has received."""
+    def __init__(self, name, **kwargs):
+        super(StreamCounter, self).__init__(name, **kwargs)
+        self.count = 0
+
+    def process(self, message=None):
+        self.count += len(message) if isinstance(message, MessageBatch) else 1
+
+    def snapshot(self):
+        return {'count': self.count}
+
+    def restore(self, state):
+        self.count = state['count']
 
+    def postProcess(self, message=None):
+        self.state = Message(name=self.name, count=self.count)
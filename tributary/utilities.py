@@ -5,7 +5,7 @@ from datetime import datetime
 
 __all__ = ["validateType", "Enum", "strToUnixtime", \
     "validateNotNone", "validateIn", "validateIter", \
-    "unixtimeToDatetime", "hmsToSAM"]
+    "unixtimeToDatetime", "toNanoseconds", "hmsToSAM"]
 
 def validateType(varname, correct_type, value):
     """Validates the type of an object"""
@@ -43,6 +43,13 @@ def strToUnixtime(date_string, format):
     unix = float("%0.6f" % (calendar.timegm(dt.utctimetuple()) + dt.time().microsecond / 1000000.0))
     return unix
 
+def toNanoseconds(value):
+    """Converts a datetime (aware ones are converted to UTC) or a unixtime in seconds to
+    integer nanoseconds since the epoch, like `Message.ns`"""
+    if isinstance(value, datetime):
+        return (calendar.timegm(value.utctimetuple()) * 1000000 + value.microsecond) * 1000
+    return int(round(value * 1e9))
+
 def unixtimeToDatetime(unixtime, format="%Y-%m-%d %H:%M:%S.%f"):
     """Converts a unixtime float to a string formatted datetime"""
     timestamp_unix = unixtime
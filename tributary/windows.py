@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This sub-module aggregates streams over time windows. Windows are driven by the
+timestamps of the messages (`Message.ns`), not by the clock, so a replayed stream
+gives the same results as a live one. A window is closed once a message past its end
+arrives and the open windows are closed when the stream stops.
+"""
+
+import fractions
+from collections import OrderedDict
+from .core import Message, MessageBatch
+from .events import DATA
+from .streams import StreamElement
+
+__all__ = ['Aggregate', 'WindowElement', 'TumblingWindow', 'SlidingWindow', 'SessionWindow']
+
+class Aggregate(object):
+    """Aggregate keeps the count, sum, minimum, maximum, mean and (population) variance
+    of a series of values. Adding a value or merging another aggregate takes constant time."""
+    __slots__ = ('count', 'sum', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self):
+        super(Aggregate, self).__init__()
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        """Adds a value"""
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        # Welford's online update of the mean and the sum of squared differences
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """Adds the values of another aggregate"""
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.sum, self.min, self.max, self.mean, self.m2 = \
+                other.count, other.sum, other.min, other.max, other.mean, other.m2
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    def result(self):
+        """Returns the aggregates as a dictionary"""
+        return dict(count=self.count, sum=self.sum, min=self.min, max=self.max, mean=self.mean, variance=self.variance)
+
+class WindowElement(StreamElement):
+    """WindowElement is the base class of the window operators. The values of the `field`
+    parameter are aggregated per window and, if `key` is given, per value of the `key`
+    parameter. Messages without the field are ignored. Every closed window is emitted as
+    a message with the key, `start` and `end` (seconds since the epoch) and the values of
+    `Aggregate.result`, timestamped at the end of the window.
+
+    Messages older than the windows which are still open are counted in `late` and dropped.
+    """
+    def __init__(self, name, field, key=None, **options):
+        super(WindowElement, self).__init__(name, **options)
+        self.field = field
+        self.key = key
+        self.late = 0
+
+    def process(self, message=None):
+        if isinstance(message, MessageBatch):
+            for ns, key, value in self.rows(message):
+                self.aggregate(ns, key, value)
+        elif self.field in message.data:
+            self.aggregate(message.ns, message.data.get(self.key) if self.key else None, message.data.get(self.field))
+
+    def rows(self, batch):
+        """Returns the (ns, key, value) tuples of the rows of a batch which have the field"""
+        if self.field not in batch.data.keys():
+            return []
+        present = batch.presence(self.field)
+        keys = [None] * len(batch)
+        if self.key in batch.data.keys():
+            keys = [key if found else None for key, found in zip(batch.data.get(self.key).tolist(), batch.presence(self.key).tolist())]
+        rows = zip(batch.times.tolist(), keys, batch.data.get(self.field).tolist())
+        if not present.all():
+            rows = [row for row, found in zip(rows, present.tolist()) if found]
+        return rows
+
+    def aggregate(self, ns, key, value):
+        """Adds a value at the given time (in nanoseconds)"""
+        raise NotImplementedError("aggregate")
+
+    def closeAll(self):
+        """Closes every open window"""
+        raise NotImplementedError("closeAll")
+
+    def postProcess(self, message=None):
+        self.closeAll()
+
+    def snapshot(self):
+        return {'late': self.late}
+
+    def restore(self, state):
+        self.late = state['late']
+
+    def result(self, key, start, end, aggregate):
+        """Returns the message emitted for a closed window"""
+        message = Message(start=start / 1e9, end=end / 1e9, **aggregate.result())
+        if self.key:
+            message.data.set(self.key, key)
+        message.ns = end
+        return message
+
+class SlidingWindow(WindowElement):
+    """SlidingWindow aggregates the last `size` seconds every `slide` seconds. The windows
+    are aligned on the epoch, a window ends at every multiple of `slide`.
+
+    Values are aggregated in panes of the greatest common divisor of `size` and `slide`
+    seconds, closing a window merges its panes instead of going over its messages again."""
+    def __init__(self, name, field, size, slide=None, key=None, **options):
+        super(SlidingWindow, self).__init__(name, field, key, **options)
+        self.size = int(round(size * 1e9))
+        self.slide = int(round((slide or size) * 1e9))
+        if self.size <= 0 or self.slide <= 0:
+            raise ValueError("Window size and slide must be positive")
+        self.pane = fractions.gcd(self.size, self.slide)
+
+        # aggregates by key, for each pane start; end of the next window to close
+        self.panes = {}
+        self.end = None
+
+    def aggregate(self, ns, key, value):
+        if self.end is None:
+            self.end = (ns // self.slide + 1) * self.slide
+        elif ns >= self.end:
+            self.advance(ns)
+
+        start = ns - ns % self.pane
+        if start < self.end - self.size:
+            self.late += 1
+            return
+
+        aggregates = self.panes.get(start)
+        if aggregates is None:
+            aggregates = self.panes[start] = {}
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = Aggregate()
+        aggregate.add(value)
+
+    def advance(self, ns):
+        """Closes the windows ending at or before `ns`"""
+        results = []
+        while self.end <= ns:
+            if not self.panes:
+                # skips the windows without any message
+                self.end = (ns // self.slide + 1) * self.slide
+                break
+            results.extend(self.closeWindow())
+        if results:
+            self.emitBatch(DATA, results)
+
+    def closeWindow(self):
+        """Closes the next window and returns its results"""
+        end = self.end
+        start = end - self.size
+        merged = {}
+        for paneStart, aggregates in self.panes.items():
+            if start <= paneStart < end:
+                for key, aggregate in aggregates.items():
+                    if key not in merged:
+                        merged[key] = Aggregate()
+                    merged[key].merge(aggregate)
+
+        # the panes before the next window are not needed anymore
+        self.end += self.slide
+        for paneStart in [paneStart for paneStart in self.panes if paneStart < self.end - self.size]:
+            del self.panes[paneStart]
+        return [self.result(key, start, end, aggregate) for key, aggregate in merged.items()]
+
+    def snapshot(self):
+        state = super(SlidingWindow, self).snapshot()
+        state.update(panes=self.panes, end=self.end)
+        return state
+
+    def restore(self, state):
+        super(SlidingWindow, self).restore(state)
+        self.panes = state['panes']
+        self.end = state['end']
+
+    def closeAll(self):
+        results = []
+        while self.panes:
+            results.extend(self.closeWindow())
+        self.end = None
+        if results:
+            self.emitBatch(DATA, results)
+
+class TumblingWindow(SlidingWindow):
+    """TumblingWindow aggregates consecutive, non-overlapping windows of `size` seconds"""
+    def __init__(self, name, field, size, key=None, **options):
+        super(TumblingWindow, self).__init__(name, field, size, size, key, **options)
+
+class SessionWindow(WindowElement):
+    """SessionWindow aggregates the sessions of each key. A session ends when no message
+    with the key arrives for `gap` seconds; `start` and `end` are the times of its first
+    and last messages."""
+    def __init__(self, name, field, gap, key=None, **options):
+        super(SessionWindow, self).__init__(name, field, key, **options)
+        self.gap = int(round(gap * 1e9))
+
+        # [start, last, aggregate] by key, the least recently active first
+        self.sessions = OrderedDict()
+        self.watermark = None
+
+    def aggregate(self, ns, key, value):
+        if self.watermark is None or ns > self.watermark:
+            self.watermark = ns
+            self.expire(ns)
+
+        session = self.sessions.pop(key, None)
+        if session is None:
+            session = [ns, ns, Aggregate()]
+        elif ns < session[0]:
+            session[0] = ns
+        elif ns > session[1]:
+            session[1] = ns
+        session[2].add(value)
+        self.sessions[key] = session
+
+    def expire(self, ns):
+        """Closes the sessions without messages since `gap` seconds before `ns`"""
+        results = []
+        for key, session in self.sessions.iteritems():
+            if ns - session[1] <= self.gap:
+                break
+            results.append(self.result(key, session[0], session[1], session[2]))
+        for i in range(len(results)):
+            self.sessions.popitem(last=False)
+        if results:
+            self.emitBatch(DATA, results)
+
+    def snapshot(self):
+        state = super(SessionWindow, self).snapshot()
+        state.update(sessions=self.sessions, watermark=self.watermark)
+        return state
+
+    def restore(self, state):
+        super(SessionWindow, self).restore(state)
+        self.sessions = state['sessions']
+        self.watermark = state['watermark']
+
+    def closeAll(self):
+        results = [self.result(key, start, last, aggregate) for key, (start, last, aggregate) in self.sessions.items()]
+        self.sessions.clear()
+        self.watermark = None
+        if results:
+            self.emitBatch(DATA, results)